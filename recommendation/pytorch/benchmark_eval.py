@@ -0,0 +1,72 @@
+import os
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+
+from convert import TEST_NEG_FILENAME, TEST_RATINGS_FILENAME
+from dataset import load_test_ratings, load_test_negs
+from neumf import NeuMF
+from ncf import val_epoch
+
+
+def parse_args():
+    parser = ArgumentParser(description="Compare evaluation times of the"
+                                        " per user and batched NCF"
+                                        " evaluations on CPU")
+    parser.add_argument('data', type=str,
+                        help='path to test and training data files')
+    parser.add_argument('-f', '--factors', type=int, default=8,
+                        help='number of predictive factors')
+    parser.add_argument('--layers', nargs='+', type=int,
+                        default=[64, 32, 16, 8],
+                        help='size of hidden layers for MLP')
+    parser.add_argument('-k', '--topk', type=int, default=10,
+                        help='rank for test examples to be considered a hit')
+    parser.add_argument('--users', type=int, default=0,
+                        help='number of test users to time, 0 for all')
+    parser.add_argument('--eval-batch-users', type=int, nargs='+',
+                        default=[25, 100, 1000],
+                        help='users per model call to time')
+    parser.add_argument('--seed', '-s', type=int, default=0,
+                        help='manually set random seed')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    torch.manual_seed(args.seed)
+
+    ratings = load_test_ratings(os.path.join(args.data, TEST_RATINGS_FILENAME))
+    negs = load_test_negs(os.path.join(args.data, TEST_NEG_FILENAME))
+    if args.users > 0:
+        ratings, negs = ratings[:args.users], negs[:args.users]
+    nb_users = int(ratings[:, 0].max()) + 1
+    nb_items = int(max(ratings[:, 1].max(), negs.max())) + 1
+
+    model = NeuMF(nb_users, nb_items,
+                  mf_dim=args.factors, mf_reg=0.,
+                  mlp_layer_sizes=args.layers,
+                  mlp_layer_regs=[0. for i in args.layers])
+
+    begin = time.time()
+    hits, ndcgs = val_epoch(model, ratings, negs, args.topk, use_cuda=False)
+    print('per user: {:.2f} s, HR@{} {:.4f}, NDCG@{} {:.4f}'.format(
+        time.time() - begin, args.topk, np.mean(hits), args.topk,
+        np.mean(ndcgs)))
+
+    for batch_users in args.eval_batch_users:
+        begin = time.time()
+        batch_hits, batch_ndcgs = val_epoch(model, ratings, negs, args.topk,
+                                            use_cuda=False,
+                                            batch_users=batch_users)
+        print('{} users per batch: {:.2f} s, {} different hits, max NDCG'
+              ' difference {:.3g}'.format(
+                  batch_users, time.time() - begin,
+                  int((hits != batch_hits).sum()),
+                  np.abs(ndcgs - batch_ndcgs).max()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import os
+import time
+from argparse import ArgumentParser
+
+import dataset
+from convert import (TEST_NEG_FILENAME, TEST_RATINGS_FILENAME,
+                     TRAIN_RATINGS_FILENAME)
+from utils import binary_fname
+
+
+def parse_args():
+    parser = ArgumentParser(description="Compare loading times of the CSV"
+                                        " and binary NCF data files")
+    parser.add_argument('data', type=str,
+                        help='path to test and training data files')
+    return parser.parse_args()
+
+
+def load(data, binary):
+    # hide the binary files from the loaders to time the CSV path
+    exists = os.path.exists
+    if not binary:
+        os.path.exists = lambda path: not path.endswith('.npy') and \
+            exists(path)
+    try:
+        begin = time.time()
+        train = dataset.CFTrainDataset(
+            os.path.join(data, TRAIN_RATINGS_FILENAME), 4)
+        ratings = dataset.load_test_ratings(
+            os.path.join(data, TEST_RATINGS_FILENAME))
+        negs = dataset.load_test_negs(os.path.join(data, TEST_NEG_FILENAME))
+        return time.time() - begin, train, ratings, negs
+    finally:
+        os.path.exists = exists
+
+
+def main():
+    args = parse_args()
+    if not os.path.exists(binary_fname(
+            os.path.join(args.data, TRAIN_RATINGS_FILENAME), 'indptr')):
+        raise ValueError('No binary files in {}, rerun convert.py'
+                         .format(args.data))
+
+    csv_time, train, ratings, negs = load(args.data, binary=False)
+    print('CSV: {:.2f} s, {} users, {} items, {} pairs, {} test users'
+          .format(csv_time, train.nb_users, train.nb_items, train.mat.nnz,
+                  len(ratings)))
+    binary_time, train, ratings, negs = load(args.data, binary=True)
+    print('binary: {:.2f} s, {} users, {} items, {} pairs, {} test users'
+          .format(binary_time, train.nb_users, train.nb_items,
+                  train.mat.nnz, len(ratings)))
+
+
+if __name__ == '__main__':
+    main()
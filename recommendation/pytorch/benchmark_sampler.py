@@ -0,0 +1,60 @@
+import os
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+
+from dataset import CFTrainDataset, CFTrainBatches
+from convert import TRAIN_RATINGS_FILENAME
+
+
+def parse_args():
+    parser = ArgumentParser(description="Compare examples/sec of the"
+                                        " training DataLoader and"
+                                        " CFTrainBatches")
+    parser.add_argument('data', type=str,
+                        help='path to test and training data files')
+    parser.add_argument('-b', '--batch-size', type=int, default=2048,
+                        help='number of examples for each iteration')
+    parser.add_argument('-n', '--negative-samples', type=int, default=4,
+                        help='number of negative examples per interaction')
+    parser.add_argument('--batches', type=int, default=500,
+                        help='number of batches to time')
+    parser.add_argument('--workers', '-w', type=int, default=8,
+                        help='Number of workers for training DataLoader')
+    parser.add_argument('--seed', '-s', type=int, default=0,
+                        help='manually set random seed')
+    return parser.parse_args()
+
+
+def examples_per_sec(loader, nb_batches):
+    begin = time.time()
+    nb_examples = 0
+    for batch_index, (user, item, label) in enumerate(loader):
+        nb_examples += user.size(0)
+        if batch_index + 1 == nb_batches:
+            break
+    return nb_examples / (time.time() - begin)
+
+
+def main():
+    args = parse_args()
+    torch.manual_seed(args.seed)
+    np.random.seed(seed=args.seed)
+
+    dataset = CFTrainDataset(
+        os.path.join(args.data, TRAIN_RATINGS_FILENAME), args.negative_samples)
+    dataloader = torch.utils.data.DataLoader(
+            dataset=dataset, batch_size=args.batch_size, shuffle=True,
+            num_workers=args.workers, pin_memory=True)
+    print('DataLoader, {} workers: {:.0f} examples/sec'.format(
+        args.workers, examples_per_sec(dataloader, args.batches)))
+
+    batches = CFTrainBatches(dataset, args.batch_size)
+    print('CFTrainBatches: {:.0f} examples/sec'.format(
+        examples_per_sec(batches, args.batches)))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,7 @@ import pandas as pd
 from tqdm import tqdm
 
 from load import implicit_load
+from utils import binary_fname
 
 
 MIN_RATINGS = 20
@@ -35,6 +36,25 @@ def parse_args():
     return parser.parse_args()
 
 
+def save_binary(output, nb_users, train_ratings, test_ratings, test_negs):
+    """Save the ratings as int32 arrays next to their CSV files, which
+    dataset.py memory-maps instead of parsing the CSV files; the training
+    pairs are in CSR order, with the row pointers of each user"""
+    train = np.array(list(train_ratings), dtype=np.int32).reshape(-1, 2)
+    train = train[np.lexsort((train[:, 1], train[:, 0]))]
+    indptr = np.zeros(nb_users + 1, dtype=np.int64)
+    np.cumsum(np.bincount(train[:, 0], minlength=nb_users), out=indptr[1:])
+
+    train_fname = os.path.join(output, TRAIN_RATINGS_FILENAME)
+    np.save(binary_fname(train_fname, 'users'), train[:, 0])
+    np.save(binary_fname(train_fname, 'items'), train[:, 1])
+    np.save(binary_fname(train_fname, 'indptr'), indptr)
+    np.save(binary_fname(os.path.join(output, TEST_RATINGS_FILENAME)),
+            np.array(test_ratings, dtype=np.int32))
+    np.save(binary_fname(os.path.join(output, TEST_NEG_FILENAME)),
+            np.array(test_negs, dtype=np.int32))
+
+
 def main():
     args = parse_args()
     np.random.seed(args.seed)
@@ -96,6 +116,10 @@ def main():
     df_test_negs.to_csv(os.path.join(args.output, TEST_NEG_FILENAME),
                         index=False, header=False, sep='\t')
 
+    print("Saving binary train and test arrays to {}".format(args.output))
+    save_binary(args.output, len(original_users), all_ratings, test_ratings,
+                test_negs)
+
 
 if __name__ == '__main__':
     main()
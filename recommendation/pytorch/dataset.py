@@ -1,57 +1,128 @@
+import os
+
 import numpy as np
+import pandas as pd
 import scipy
 import scipy.sparse
 import torch
 import torch.utils.data
 
+from utils import binary_fname
+
 
 class CFTrainDataset(torch.utils.data.dataset.Dataset):
     def __init__(self, train_fname, nb_neg):
-        self._load_train_matrix(train_fname)
+        if os.path.exists(binary_fname(train_fname, 'indptr')):
+            self._load_train_binary(train_fname)
+        else:
+            self._load_train_matrix(train_fname)
         self.nb_neg = nb_neg
 
     def _load_train_matrix(self, train_fname):
-        def process_line(line):
-            tmp = line.split('\t')
-            return [int(tmp[0]), int(tmp[1]), float(tmp[2]) > 0]
-        with open(train_fname, 'r') as file:
-            data = list(map(process_line, file))
-        self.nb_users = max(data, key=lambda x: x[0])[0] + 1
-        self.nb_items = max(data, key=lambda x: x[1])[1] + 1
-
-        self.data = list(filter(lambda x: x[2], data))
-        self.mat = scipy.sparse.dok_matrix(
-                (self.nb_users, self.nb_items), dtype=np.float32)
-        for user, item, _ in data:
-            self.mat[user, item] = 1.
+        data = pd.read_csv(train_fname, sep='\t', header=None,
+                           usecols=[0, 1, 2]).values
+        users, items = data[:, 0].astype(np.int32), data[:, 1].astype(np.int32)
+        self.nb_users = int(users.max()) + 1
+        self.nb_items = int(items.max()) + 1
+
+        self.mat = scipy.sparse.csr_matrix(
+                (np.ones(len(data), dtype=np.float32), (users, items)),
+                shape=(self.nb_users, self.nb_items))
+        self.mat.sum_duplicates()
+        self.mat.data[:] = 1.
+        positive = data[:, 2] > 0
+        self.users, self.items = users[positive], items[positive]
+
+    def _load_train_binary(self, train_fname):
+        def load(name):
+            return np.load(binary_fname(train_fname, name), mmap_mode='r')
+        # every training pair is positive, in CSR order
+        self.users, self.items = load('users'), load('items')
+        indptr = load('indptr')
+        self.nb_users = len(indptr) - 1
+        self.nb_items = int(self.items.max()) + 1
+        self.mat = scipy.sparse.csr_matrix(
+                (np.ones(len(self.items), dtype=np.float32), self.items,
+                 indptr), shape=(self.nb_users, self.nb_items))
+
+    def _is_positive(self, u, j):
+        row = self.mat.indices[self.mat.indptr[u]:self.mat.indptr[u + 1]]
+        k = np.searchsorted(row, j)
+        return k < len(row) and row[k] == j
 
     def __len__(self):
-        return (self.nb_neg + 1) * len(self.data)
+        return (self.nb_neg + 1) * len(self.users)
 
     def __getitem__(self, idx):
         if idx % (self.nb_neg + 1) == 0:
             idx = idx // (self.nb_neg + 1)
-            return self.data[idx][0], self.data[idx][1], np.ones(1, dtype=np.float32)  # noqa: E501
+            return int(self.users[idx]), int(self.items[idx]), np.ones(1, dtype=np.float32)  # noqa: E501
         else:
             idx = idx // (self.nb_neg + 1)
-            u = self.data[idx][0]
+            u = int(self.users[idx])
             j = torch.LongTensor(1).random_(0, self.nb_items).item()
-            while (u, j) in self.mat:
+            while self._is_positive(u, j):
                 j = torch.LongTensor(1).random_(0, self.nb_items).item()
             return u, j, np.zeros(1, dtype=np.float32)
 
 
 def load_test_ratings(fname):
-    def process_line(line):
-        tmp = map(int, line.split('\t')[0:2])
-        return list(tmp)
-    ratings = map(process_line, open(fname, 'r'))
-    return list(ratings)
+    if os.path.exists(binary_fname(fname)):
+        return np.load(binary_fname(fname), mmap_mode='r')
+    return pd.read_csv(fname, sep='\t', header=None,
+                       usecols=[0, 1]).values.astype(np.int32)
 
 
 def load_test_negs(fname):
-    def process_line(line):
-        tmp = map(int, line.split('\t'))
-        return list(tmp)
-    negs = map(process_line, open(fname, 'r'))
-    return list(negs)
+    if os.path.exists(binary_fname(fname)):
+        return np.load(binary_fname(fname), mmap_mode='r')
+    return pd.read_csv(fname, sep='\t', header=None).values.astype(np.int32)
+
+
+class CFTrainBatches(object):
+    """Shuffled training batches of a CFTrainDataset, built with numpy.
+
+    Each epoch covers the same samples as a shuffled DataLoader over the
+    dataset: every positive once, followed by nb_neg negatives of the same
+    user. The negatives of a whole batch are drawn at once and rejection
+    checked against a sorted array of user * nb_items + item keys, and
+    batches are returned as (user, item, label) tensors.
+    """
+    def __init__(self, dataset, batch_size):
+        self.nb_neg = dataset.nb_neg
+        self.nb_items = dataset.nb_items
+        self.batch_size = batch_size
+
+        self.users = np.asarray(dataset.users, dtype=np.int64)
+        self.items = np.asarray(dataset.items, dtype=np.int64)
+        mat = dataset.mat.tocoo()
+        self.keys = np.sort(mat.row.astype(np.int64) * self.nb_items +
+                            mat.col)
+
+    def __len__(self):
+        nb_samples = (self.nb_neg + 1) * len(self.users)
+        return (nb_samples + self.batch_size - 1) // self.batch_size
+
+    def _is_positive(self, users, items):
+        keys = users * self.nb_items + items
+        idx = np.searchsorted(self.keys, keys)
+        idx[idx == len(self.keys)] = 0
+        return self.keys[idx] == keys
+
+    def _batch(self, idx):
+        pos = idx // (self.nb_neg + 1)
+        users = self.users[pos]
+        labels = idx % (self.nb_neg + 1) == 0
+        items = np.where(labels, self.items[pos],
+                         np.random.randint(0, self.nb_items, len(idx)))
+        redraw = np.flatnonzero(~labels)
+        while len(redraw) > 0:
+            redraw = redraw[self._is_positive(users[redraw], items[redraw])]
+            items[redraw] = np.random.randint(0, self.nb_items, len(redraw))
+        return (torch.from_numpy(users), torch.from_numpy(items),
+                torch.from_numpy(labels.astype(np.float32)).view(-1, 1))
+
+    def __iter__(self):
+        order = np.random.permutation((self.nb_neg + 1) * len(self.users))
+        for i in range(0, len(order), self.batch_size):
+            yield self._batch(order[i:i + self.batch_size])
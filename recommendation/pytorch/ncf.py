@@ -15,7 +15,8 @@ from torch import multiprocessing as mp
 
 import utils
 from neumf import NeuMF
-from dataset import CFTrainDataset, load_test_ratings, load_test_negs
+from dataset import (CFTrainDataset, CFTrainBatches, load_test_ratings,
+                     load_test_negs)
 from convert import (TEST_NEG_FILENAME, TEST_RATINGS_FILENAME,
                      TRAIN_RATINGS_FILENAME)
 
@@ -48,8 +49,14 @@ def parse_args():
                         help='stop training early at threshold')
     parser.add_argument('--processes', '-p', type=int, default=1,
                         help='Number of processes for evaluating model')
+    parser.add_argument('--eval-batch-users', type=int, default=0,
+                        help='Score this many users per batch in evaluation'
+                             ' instead of evaluating one user at a time')
     parser.add_argument('--workers', '-w', type=int, default=8,
                         help='Number of workers for training DataLoader')
+    parser.add_argument('--batch-sampling', action='store_true',
+                        help='draw each training batch with numpy instead '
+                             'of a per sample DataLoader')
     return parser.parse_args()
 
 
@@ -59,7 +66,7 @@ def predict(model, users, items, batch_size=1024, use_cuda=True):
     preds = []
     for user, item in batches:
         def proc(x):
-            x = np.array(x)
+            x = np.array(x, dtype=np.int64)
             x = torch.from_numpy(x)
             if use_cuda:
                 x = x.cuda(async=True)
@@ -82,9 +89,9 @@ def _calculate_ndcg(ranked, test_item):
 
 
 def eval_one(rating, items, model, K, use_cuda=True):
-    user = rating[0]
-    test_item = rating[1]
-    items.append(test_item)
+    user = int(rating[0])
+    test_item = int(rating[1])
+    items = list(items) + [test_item]
     users = [user] * len(items)
     predictions = predict(model, users, items, use_cuda=use_cuda)
 
@@ -96,15 +103,58 @@ def eval_one(rating, items, model, K, use_cuda=True):
     return hit, ndcg
 
 
+def eval_batched(model, ratings, negs, K, use_cuda=True, batch_users=1000):
+    """Hits and NDCGs of eval_one for every user, scoring the candidates of
+    batch_users users with one model call.
+
+    eval_one ranks the unique candidates by score, with ties going to the
+    items listed first, so the test item, listed last, ranks after every
+    other item scoring at least as high. Its rank is counted directly.
+    """
+    hits = np.zeros(len(ratings), dtype=np.float32)
+    ndcgs = np.zeros(len(ratings), dtype=np.float32)
+    for begin in range(0, len(ratings), batch_users):
+        rating = np.asarray(ratings[begin:begin + batch_users], dtype=np.int64)
+        # sorted, so that repeated negatives are counted once, and the
+        # test item is never counted against itself
+        items = np.sort(np.asarray(negs[begin:begin + len(rating)],
+                                   dtype=np.int64), axis=1)
+        first = np.ones(items.shape, dtype=np.uint8)
+        first[:, 1:] = items[:, 1:] != items[:, :-1]
+        first &= items != rating[:, 1:2]
+        items = np.concatenate((items, rating[:, 1:2]), axis=1)
+        users = np.repeat(rating[:, 0:1], items.shape[1], axis=1)
+
+        user, item, first = (torch.from_numpy(x) for x in
+                             (users.reshape(-1), items.reshape(-1), first))
+        if use_cuda:
+            user = user.cuda(async=True)
+            item = item.cuda(async=True)
+            first = first.cuda(async=True)
+        with torch.no_grad():
+            scores = model(user, item, sigmoid=True).view(items.shape)
+
+        rank = ((scores[:, :-1] >= scores[:, -1:]) * first).long().sum(dim=1)
+        rank = rank.cpu().numpy()
+        hit = rank < K
+        hits[begin:begin + len(rating)] = hit
+        ndcgs[begin:begin + len(rating)] = \
+            hit * math.log(2) / np.log(rank + 2)
+    return hits, ndcgs
+
+
 def val_epoch(model, ratings, negs, K, use_cuda=True, output=None, epoch=None,
-              processes=1):
+              processes=1, batch_users=0):
     if epoch is None:
         print("Initial evaluation")
     else:
         print("Epoch {} evaluation".format(epoch))
     start = datetime.now()
     model.eval()
-    if processes > 1:
+    if batch_users > 0:
+        hits, ndcgs = eval_batched(model, ratings, negs, K, use_cuda=use_cuda,
+                                   batch_users=batch_users)
+    elif processes > 1:
         context = mp.get_context('spawn')
         _eval_one = partial(eval_one, model=model, K=K, use_cuda=use_cuda)
         with context.Pool(processes=processes) as workers:
@@ -159,9 +209,12 @@ def main():
     print('Loading data')
     train_dataset = CFTrainDataset(
         os.path.join(args.data, TRAIN_RATINGS_FILENAME), args.negative_samples)
-    train_dataloader = torch.utils.data.DataLoader(
-            dataset=train_dataset, batch_size=args.batch_size, shuffle=True,
-            num_workers=args.workers, pin_memory=True)
+    if args.batch_sampling:
+        train_dataloader = CFTrainBatches(train_dataset, args.batch_size)
+    else:
+        train_dataloader = torch.utils.data.DataLoader(
+                dataset=train_dataset, batch_size=args.batch_size,
+                shuffle=True, num_workers=args.workers, pin_memory=True)
     test_ratings = load_test_ratings(os.path.join(args.data, TEST_RATINGS_FILENAME))  # noqa: E501
     test_negs = load_test_negs(os.path.join(args.data, TEST_NEG_FILENAME))
     nb_users, nb_items = train_dataset.nb_users, train_dataset.nb_items
@@ -195,7 +248,8 @@ def main():
 
     # Calculate initial Hit Ratio and NDCG
     hits, ndcgs = val_epoch(model, test_ratings, test_negs, args.topk,
-                            use_cuda=use_cuda, processes=args.processes)
+                            use_cuda=use_cuda, processes=args.processes,
+                            batch_users=args.eval_batch_users)
     print('Initial HR@{K} = {hit_rate:.4f}, NDCG@{K} = {ndcg:.4f}'
           .format(K=args.topk, hit_rate=np.mean(hits), ndcg=np.mean(ndcgs)))
     for epoch in range(args.epochs):
@@ -230,7 +284,8 @@ def main():
         begin = time.time()
         hits, ndcgs = val_epoch(model, test_ratings, test_negs, args.topk,
                                 use_cuda=use_cuda, output=valid_results_file,
-                                epoch=epoch, processes=args.processes)
+                                epoch=epoch, processes=args.processes,
+                                batch_users=args.eval_batch_users)
         val_time = time.time() - begin
         print('Epoch {epoch}: HR@{K} = {hit_rate:.4f}, NDCG@{K} = {ndcg:.4f},'
               ' train_time = {train_time:.2f}, val_time = {val_time:.2f}'
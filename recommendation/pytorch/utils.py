@@ -21,6 +21,12 @@ class AverageMeter(object):
         self.avg = self.sum / self.count
 
 
+def binary_fname(fname, name=None):
+    """Path of a binary array saved next to the CSV file fname"""
+    base = os.path.splitext(fname)[0]
+    return base + ('.npy' if name is None else '.{}.npy'.format(name))
+
+
 def count_parameters(model):
     c = map(lambda p: reduce(lambda x, y: x * y, p.size()), model.parameters())
     return sum(c)
@@ -51,6 +51,7 @@ class DualNetwork():
         self.hparams = get_default_hyperparams(**hparams)
         self.inference_input = None
         self.inference_output = None
+        self.feature_buffer = None
         config = tf.ConfigProto()
         config.gpu_options.allow_growth = True
         self.sess = tf.Session(graph=tf.Graph(), config=config)
@@ -76,24 +77,42 @@ class DualNetwork():
         without redifining the entire graph."""
         tf.train.Saver().restore(self.sess, save_file)
 
-    def run(self, position, use_random_symmetry=True):
+    def run(self, position, use_random_symmetry=True, all_symmetries=False):
         probs, values = self.run_many([position],
-                                      use_random_symmetry=use_random_symmetry)
+                                      use_random_symmetry=use_random_symmetry,
+                                      all_symmetries=all_symmetries)
         return probs[0], values[0]
 
-    def run_many(self, positions, use_random_symmetry=True):
-        processed = list(map(features.extract_features, positions))
+    def run_many(self, positions, use_random_symmetry=True,
+                 all_symmetries=False):
+        """Evaluates a list of positions.
+
+        With all_symmetries, each position is evaluated under all 8
+        symmetries in a single batch, and the results are averaged."""
+        self.feature_buffer = features.feature_buffer(
+            len(positions), self.feature_buffer)
+        processed = features.bulk_extract_features(
+            positions, output=self.feature_buffer)
+        if all_symmetries:
+            probabilities, value = self.run_features(
+                symmetries.all_symmetries_feat(processed))
+            return symmetries.average_symmetries(probabilities, value)
         if use_random_symmetry:
             syms_used, processed = symmetries.randomize_symmetries_feat(
                 processed)
-        outputs = self.sess.run(self.inference_output,
-                                feed_dict={self.inference_input: processed})
-        probabilities, value = outputs['policy_output'], outputs['value_output']
+        probabilities, value = self.run_features(processed)
         if use_random_symmetry:
             probabilities = symmetries.invert_symmetries_pi(
                 syms_used, probabilities)
         return probabilities, value
 
+    def run_features(self, processed):
+        """Evaluates a batch of already extracted features, returning the
+        policy and value outputs."""
+        outputs = self.sess.run(self.inference_output,
+                                feed_dict={self.inference_input: processed})
+        return outputs['policy_output'], outputs['value_output']
+
 
 def get_inference_input():
     """Set up placeholders for input features/labels.
@@ -308,25 +327,32 @@ def export_model(working_dir, model_path):
         tf.gfile.Copy(filename, destination_path)
 
 
-def train(working_dir, tf_records, generation_num, **hparams):
+def train(working_dir, tf_records, generation_num, packed=False, replay=None,
+          **hparams):
+    """Trains from tf_records, or, if given, from batches sampled from a
+    replay_buffer.ReplayBuffer."""
     assert generation_num > 0, "Model 0 is random weights"
     estimator = get_estimator(working_dir, **hparams)
     max_steps = generation_num * EXAMPLES_PER_GENERATION // TRAIN_BATCH_SIZE
 
-    def input_fn(): return preprocessing.get_input_tensors(
-        TRAIN_BATCH_SIZE, tf_records)
+    def input_fn():
+        if replay is not None:
+            return replay.get_input_tensors(TRAIN_BATCH_SIZE)
+        return preprocessing.get_input_tensors(
+            TRAIN_BATCH_SIZE, tf_records, packed=packed)
     update_ratio_hook = UpdateRatioSessionHook(working_dir)
     estimator.train(input_fn, hooks=[update_ratio_hook], max_steps=max_steps)
 
 
-def validate(working_dir, tf_records, checkpoint_name=None, **hparams):
+def validate(working_dir, tf_records, checkpoint_name=None, packed=False,
+             **hparams):
     estimator = get_estimator(working_dir, **hparams)
     if checkpoint_name is None:
         checkpoint_name = estimator.latest_checkpoint()
 
     def input_fn(): return preprocessing.get_input_tensors(
         TRAIN_BATCH_SIZE, tf_records, shuffle_buffer_size=1000,
-        filter_amount=0.05)
+        filter_amount=0.05, packed=packed)
     estimator.evaluate(input_fn, steps=1000)
 
 
@@ -0,0 +1,149 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A cache of network evaluations, keyed by Zobrist hashes of positions.
+
+The network only sees the feature planes of a position, so two positions
+with the same planes (the same last 8 boards and player to move, reached by
+different move orders) get the same evaluation. The same holds, up to a
+symmetry of the policy, for positions whose planes are rotations or
+reflections of each other.
+
+Each position is hashed under all 8 symmetries, and the smallest hash is
+the key. Policies are stored in the orientation that produced that key,
+and transformed back for every position that looks them up.
+
+Evaluations averaged over all 8 symmetries (all_symmetries=True) are cached
+separately from single evaluations.
+"""
+
+import collections
+import numpy as np
+
+import features
+import go
+import symmetries
+
+DEFAULT_SIZE = 100000
+
+
+# Planes that hold stones. The remaining plane only encodes the player to
+# move, which gets a single key instead.
+STONE_PLANES = 16
+
+
+def _make_zobrist_table(seed=0):
+    '''Returns a [8, N * N * STONE_PLANES] table of random keys, such that
+    the hash of the stone planes under symmetry s is the XOR of table[s]
+    over the set planes of the untransformed features, and a key for black
+    to play.'''
+    size = go.N * go.N * STONE_PLANES
+    keys = np.random.RandomState(seed).randint(
+        np.iinfo(np.int64).min, np.iinfo(np.int64).max, size=size + 1,
+        dtype=np.int64).view(np.uint64)
+    indices = np.arange(size).reshape(go.N, go.N, STONE_PLANES)
+    table = np.zeros([len(symmetries.SYMMETRIES), size], dtype=np.uint64)
+    for i, s in enumerate(symmetries.SYMMETRIES):
+        # transformed[j] is the index that symmetry s moves to j.
+        transformed = symmetries.apply_symmetry_feat(s, indices).ravel()
+        table[i, transformed] = keys[:size]
+    return table, keys[size]
+
+
+ZOBRIST, BLACK_TO_PLAY = _make_zobrist_table()
+
+
+def canonical_hash(position):
+    '''Returns (key, symmetry): the smallest of the position's hashes under
+    the 8 symmetries, and the symmetry that produced it.'''
+    stones = features.extract_features(position)[:, :, :STONE_PLANES]
+    hashes = np.bitwise_xor.reduce(
+        ZOBRIST.take(np.flatnonzero(stones), axis=1), axis=1)
+    if position.to_play == go.BLACK:
+        hashes ^= BLACK_TO_PLAY
+    i = int(np.argmin(hashes))
+    return int(hashes[i]), symmetries.SYMMETRIES[i]
+
+
+class EvalCache(object):
+    """Memoizes (policy, value) evaluations in front of a network.
+
+    network: anything with a run_many method, like dual_net.DualNetwork.
+    max_size: how many evaluations to keep; the least recently used ones
+        are evicted first.
+
+    Positions repeated within one batch are only evaluated once. Other
+    attributes (like save_file) are forwarded to the network.
+    """
+
+    def __init__(self, network, max_size=DEFAULT_SIZE):
+        self.network = network
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        return getattr(self.network, name)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def run(self, position, use_random_symmetry=True, all_symmetries=False):
+        probs, values = self.run_many([position],
+                                      use_random_symmetry=use_random_symmetry,
+                                      all_symmetries=all_symmetries)
+        return probs[0], values[0]
+
+    def run_many(self, positions, use_random_symmetry=True,
+                 all_symmetries=False):
+        keys = []
+        for position in positions:
+            key, symmetry = canonical_hash(position)
+            keys.append(((key, all_symmetries), symmetry))
+        found = {}  # key -> (policy in the canonical orientation, value)
+        missing = collections.OrderedDict()  # key -> (position, symmetry)
+        for position, (key, symmetry) in zip(positions, keys):
+            if key in found or key in missing:
+                self.hits += 1
+            elif key in self.entries:
+                self.entries.move_to_end(key)
+                found[key] = self.entries[key]
+                self.hits += 1
+            else:
+                missing[key] = (position, symmetry)
+                self.misses += 1
+
+        if missing:
+            kwargs = {'use_random_symmetry': use_random_symmetry}
+            # only networks that support it are asked to average.
+            if all_symmetries:
+                kwargs['all_symmetries'] = True
+            probs, values = self.network.run_many(
+                [position for position, _ in missing.values()], **kwargs)
+            for (key, (_, symmetry)), prob, value in zip(
+                    missing.items(), probs, values):
+                found[key] = self.entries[key] = (
+                    symmetries.apply_symmetry_pi(symmetry, prob), value)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+        move_probs, values = [], []
+        for key, symmetry in keys:
+            prob, value = found[key]
+            move_probs.append(symmetries.apply_symmetry_pi(
+                symmetries.invert_symmetry(symmetry), prob))
+            values.append(value)
+        return move_probs, values
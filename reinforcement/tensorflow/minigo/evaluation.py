@@ -18,6 +18,7 @@ import os
 import time
 import sgf_wrapper
 
+from eval_cache import EvalCache
 from gtp_wrapper import MCTSPlayer
 import goparams
 
@@ -57,8 +58,7 @@ def play_match(black_net, white_net, games, readouts, sgf_dir, verbosity):
             inactive = black if num_move % 2 else white
 
             current_readouts = active.root.N
-            while active.root.N < current_readouts + readouts:
-                active.tree_search()
+            active.search(readouts)
 
             # print some stats on the search
             if verbosity >= 3:
@@ -85,6 +85,14 @@ def play_match(black_net, white_net, games, readouts, sgf_dir, verbosity):
                                                   white_name=white_name)
                     _file.write(sgfstr)
                 print("Finished game", i, active.result_string)
+                if verbosity >= 1:
+                    for player, name in ((black, black_name), (white, white_name)):
+                        reused = player.reused_readouts
+                        print("%s: %.1f readouts reused per move" % (
+                            name, sum(reused) / max(len(reused), 1)))
+                        if isinstance(player.network, EvalCache):
+                            print("%s: eval cache hit rate %.3f" % (
+                                name, player.network.hit_rate()))
                 break
 
             move = active.pick_move()
@@ -98,9 +106,7 @@ def play_match(black_net, white_net, games, readouts, sgf_dir, verbosity):
             if (verbosity > 1) or (verbosity == 1 and num_move % 10 == 9):
                 timeper = (dur / readouts) * 100.0
                 print(active.root.position)
-                print("%d: %d readouts, %.3f s/100. (%.2f sec)" % (num_move,
-                                                                   readouts,
-                                                                   timeper,
-                                                                   dur))
+                print("%d: %d readouts (%d reused), %.3f s/100. (%.2f sec)" % (
+                    num_move, readouts, current_readouts, timeper, dur))
     return winners
 
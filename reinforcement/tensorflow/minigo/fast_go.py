@@ -0,0 +1,357 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+A drop-in replacement for go.Position, backed by flat lists instead of a
+LibertyTracker.
+
+Points are flattened coordinates (see coords.to_flat). Every stone points
+directly at the root of its group; when two groups merge, the stones of the
+smaller one are relabelled, so finding a group is a single list lookup.
+Stones of a group are chained in a circular linked list (`_next`) so that a
+group can be walked on merge and capture.
+
+Instead of sets of liberties, each group keeps *pseudo-liberties*: the number
+of (stone, empty neighbor) adjacencies, plus the sum and the sum of squares of
+those empty neighbors. A group is captured when its count reaches 0, and it
+is in atari exactly when all of its pseudo-liberties are the same point, i.e.
+when count * sum_of_squares == sum ** 2. All of these are updated in O(1) per
+neighbor, and copying a position is a handful of list slices.
+
+Select this engine with GO_ENGINE=fast (see goparams.py and go.new_position).
+'''
+import copy
+import numpy as np
+
+import coords
+import go
+from go import BLACK, WHITE, EMPTY, FILL, UNKNOWN, IllegalMove, PlayerMove
+
+N = go.N
+NN = N * N
+
+NEIGHBORS = [tuple(coords.to_flat(n) for n in go.NEIGHBORS[coords.from_flat(p)])
+             for p in range(NN)]
+
+# How many board deltas a position keeps; enough to rebuild 8 board states.
+MAX_DELTAS = 7
+
+
+class Position(go.Position):
+    def __init__(self, board=None, n=0, komi=7.5, caps=(0, 0),
+                 lib_tracker=None, ko=None, recent=tuple(),
+                 board_deltas=None, to_play=BLACK):
+        '''
+        Same arguments as go.Position. lib_tracker is accepted for
+        compatibility and ignored; groups are always rebuilt from the board.
+        '''
+        assert type(recent) is tuple
+        self.board = board if board is not None else np.copy(go.EMPTY_BOARD)
+        self.n = n
+        self.komi = komi
+        self.caps = caps
+        self.ko = ko
+        self.recent = recent
+        self.board_deltas = board_deltas if board_deltas is not None else np.zeros([
+                                                                                   0, N, N], dtype=np.int8)
+        self.to_play = to_play
+        self.last_eight = None
+        self.cached_features = None
+        self._build_groups()
+
+    def __deepcopy__(self, memodict={}):
+        pos = type(self).__new__(type(self))
+        pos.board = np.copy(self.board)
+        pos.n = self.n
+        pos.komi = self.komi
+        pos.caps = self.caps
+        pos.ko = self.ko
+        pos.recent = self.recent
+        pos.to_play = self.to_play
+        pos.last_eight = None
+        pos.cached_features = self.cached_features
+        # deltas are never mutated in place, so they can be shared.
+        pos._deltas = self._deltas
+        pos._board_deltas = self._board_deltas
+        pos._color = self._color[:]
+        pos._root = self._root[:]
+        pos._next = self._next[:]
+        pos._size = self._size[:]
+        pos._plibs = self._plibs[:]
+        pos._lsum = self._lsum[:]
+        pos._lsum2 = self._lsum2[:]
+        return pos
+
+    @property
+    def board_deltas(self):
+        '''A np.array of shape (n, go.N, go.N), built lazily from the sparse
+        per-move deltas; see go.Position.'''
+        if self._board_deltas is None:
+            deltas = np.zeros([len(self._deltas), NN], dtype=np.int8)
+            for i, (points, values) in enumerate(self._deltas):
+                deltas[i, points] = values
+            self._board_deltas = deltas.reshape(len(self._deltas), N, N)
+        return self._board_deltas
+
+    @board_deltas.setter
+    def board_deltas(self, board_deltas):
+        sparse = []
+        for delta in board_deltas[:MAX_DELTAS]:
+            points = np.flatnonzero(delta)
+            sparse.append((points, delta.ravel()[points]))
+        self._deltas = tuple(sparse)
+        self._board_deltas = board_deltas[:MAX_DELTAS]
+
+    def _push_delta(self, points, color):
+        self._deltas = ((points, color),) + self._deltas[:MAX_DELTAS - 1]
+        self._board_deltas = None
+
+    @property
+    def lib_tracker(self):
+        '''A go.LibertyTracker for this board. Rebuilt on every access; only
+        needed by the features that are not used in self-play.'''
+        return go.LibertyTracker.from_board(self.board)
+
+    def _build_groups(self):
+        color = self.board.ravel().tolist()
+        self._color = color
+        self._root = [go.MISSING_GROUP_ID] * NN
+        self._next = list(range(NN))
+        self._size = [0] * NN
+        self._plibs = [0] * NN
+        self._lsum = [0] * NN
+        self._lsum2 = [0] * NN
+        root = self._root
+        for p in range(NN):
+            if color[p] == EMPTY:
+                continue
+            self._new_group(p)
+            for n in NEIGHBORS[p]:
+                if (color[n] == color[p] and root[n] != go.MISSING_GROUP_ID
+                        and root[n] != root[p]):
+                    self._merge_groups(root[n], root[p])
+
+    def _new_group(self, p):
+        color = self._color
+        plibs = lsum = lsum2 = 0
+        for n in NEIGHBORS[p]:
+            if color[n] == EMPTY:
+                plibs += 1
+                lsum += n
+                lsum2 += n * n
+        self._root[p] = p
+        self._next[p] = p
+        self._size[p] = 1
+        self._plibs[p] = plibs
+        self._lsum[p] = lsum
+        self._lsum2[p] = lsum2
+
+    def _merge_groups(self, group1, group2):
+        size = self._size
+        if size[group1] < size[group2]:
+            group1, group2 = group2, group1
+        root, nxt = self._root, self._next
+        s = group2
+        while True:
+            root[s] = group1
+            s = nxt[s]
+            if s == group2:
+                break
+        nxt[group1], nxt[group2] = nxt[group2], nxt[group1]
+        size[group1] += size[group2]
+        self._plibs[group1] += self._plibs[group2]
+        self._lsum[group1] += self._lsum[group2]
+        self._lsum2[group1] += self._lsum2[group2]
+        return group1
+
+    def _group_stones(self, group):
+        nxt = self._next
+        stones = [group]
+        s = nxt[group]
+        while s != group:
+            stones.append(s)
+            s = nxt[s]
+        return stones
+
+    def _in_atari(self, group):
+        'True if every pseudo-liberty of the group is the same point.'
+        count = self._plibs[group]
+        return count > 0 and count * self._lsum2[group] == self._lsum[group] ** 2
+
+    def _capture_group(self, group):
+        color, root = self._color, self._root
+        plibs, lsum, lsum2 = self._plibs, self._lsum, self._lsum2
+        stones = self._group_stones(group)
+        for s in stones:
+            color[s] = EMPTY
+            root[s] = go.MISSING_GROUP_ID
+        for s in stones:
+            for n in NEIGHBORS[s]:
+                if color[n] != EMPTY:
+                    g = root[n]
+                    plibs[g] += 1
+                    lsum[g] += s
+                    lsum2[g] += s * s
+        return stones
+
+    def _add_stone(self, color, p):
+        'Places a stone at flat point p; returns the flat points captured.'
+        board, root = self._color, self._root
+        plibs, lsum, lsum2 = self._plibs, self._lsum, self._lsum2
+        board[p] = color
+        # the new stone takes away a pseudo-liberty from every adjacent group
+        for n in NEIGHBORS[p]:
+            if board[n] != EMPTY:
+                g = root[n]
+                plibs[g] -= 1
+                lsum[g] -= p
+                lsum2[g] -= p * p
+        self._new_group(p)
+        for n in NEIGHBORS[p]:
+            if board[n] == color and root[n] != root[p]:
+                self._merge_groups(root[n], root[p])
+        captured = []
+        for n in NEIGHBORS[p]:
+            if board[n] == -color and plibs[root[n]] == 0:
+                captured.extend(self._capture_group(root[n]))
+        return captured
+
+    def _is_koish(self, p):
+        color = self._color
+        if color[p] != EMPTY:
+            return None
+        neighbor_colors = {color[n] for n in NEIGHBORS[p]}
+        if len(neighbor_colors) == 1 and not EMPTY in neighbor_colors:
+            return neighbor_colors.pop()
+        return None
+
+    def is_move_suicidal(self, move):
+        color, root = self._color, self._root
+        for n in NEIGHBORS[coords.to_flat(move)]:
+            if color[n] == EMPTY:
+                # at least one liberty after playing here, so not a suicide
+                return False
+            # an adjacent group in atari can only have its last liberty here.
+            in_atari = self._in_atari(root[n])
+            if color[n] == self.to_play:
+                if not in_atari:
+                    return False
+            elif in_atari:
+                # would capture an opponent group.
+                return False
+        return True
+
+    def _surrounded_legality(self, spots, neighbor_colors):
+        # liberty counts would need the whole LibertyTracker; checking for
+        # atari is cheap with pseudo-liberties.
+        return [not self.is_move_suicidal(coords.from_flat(p)) for p in spots]
+
+    def is_move_legal(self, move):
+        'Checks that a move is on an empty space, not on ko, and not suicide'
+        if move is None:
+            return True
+        if self._color[coords.to_flat(move)] != EMPTY:
+            return False
+        if move == self.ko:
+            return False
+        if self.is_move_suicidal(move):
+            return False
+
+        return True
+
+    def pass_move(self, mutate=False):
+        pos = self if mutate else copy.deepcopy(self)
+        pos.n += 1
+        pos.recent += (PlayerMove(pos.to_play, None),)
+        pos._push_delta((), 0)
+        pos.to_play *= -1
+        pos.ko = None
+        pos._advance_features()
+        return pos
+
+    def play_move(self, c, color=None, mutate=False):
+        if color is None:
+            color = self.to_play
+
+        pos = self if mutate else copy.deepcopy(self)
+
+        if c is None:
+            return pos.pass_move(mutate=True)
+
+        if not self.is_move_legal(c):
+            raise IllegalMove("{} move at {} is illegal: \n{}".format(
+                "Black" if self.to_play == BLACK else "White",
+                coords.to_kgs(c), self))
+
+        p = coords.to_flat(c)
+        potential_ko = self._is_koish(p)
+
+        captured = pos._add_stone(color, p)
+        # is_move_legal only covers to_play; a stone of the other color can
+        # still be left without liberties.
+        if pos._plibs[pos._root[p]] == 0:
+            raise IllegalMove("Move at {} would commit suicide!\n".format(c))
+        flat_board = pos.board.reshape(NN)
+        flat_board[p] = color
+        if captured:
+            flat_board[captured] = EMPTY
+
+        if len(captured) == 1 and potential_ko == -color:
+            new_ko = coords.from_flat(captured[0])
+        else:
+            new_ko = None
+
+        if pos.to_play == BLACK:
+            new_caps = (pos.caps[0] + len(captured), pos.caps[1])
+        else:
+            new_caps = (pos.caps[0], pos.caps[1] + len(captured))
+
+        pos.n += 1
+        pos.caps = new_caps
+        pos.ko = new_ko
+        pos.recent += (PlayerMove(color, c),)
+        pos._push_delta([p] + captured, color)
+        pos.to_play *= -1
+        pos._advance_features()
+        return pos
+
+    def score(self):
+        'Return score from B perspective. If W is winning, score is negative.'
+        color = self._color
+        working = color[:]
+        for p in range(NN):
+            if working[p] != EMPTY:
+                continue
+            working[p] = FILL
+            territory = [p]
+            border_colors = set()
+            i = 0
+            while i < len(territory):
+                for n in NEIGHBORS[territory[i]]:
+                    if color[n] != EMPTY:
+                        border_colors.add(color[n])
+                    elif working[n] == EMPTY:
+                        working[n] = FILL
+                        territory.append(n)
+                i += 1
+            if border_colors == {BLACK}:
+                territory_color = BLACK
+            elif border_colors == {WHITE}:
+                territory_color = WHITE
+            else:
+                territory_color = UNKNOWN  # dame, or seki
+            for t in territory:
+                working[t] = territory_color
+
+        return working.count(BLACK) - working.count(WHITE) - self.komi
@@ -148,13 +148,41 @@ NEW_FEATURES_PLANES = sum(f.planes for f in NEW_FEATURES)
 
 
 def extract_features(position, features=NEW_FEATURES):
-    return np.concatenate([feature(position) for feature in features], axis=2)
-
-
-def bulk_extract_features(positions, features=NEW_FEATURES):
+    if features is not NEW_FEATURES:
+        return np.concatenate([feature(position) for feature in features], axis=2)
+    # NEW_FEATURES are cached on the position, and updated incrementally by
+    # the positions that follow it (see go.Position._advance_features).
+    if position.cached_features is None:
+        cached = np.concatenate([feature(position) for feature in features],
+                                axis=2)
+        cached.flags.writeable = False
+        position.cached_features = cached
+    return position.cached_features
+
+
+def feature_buffer(size, buffer=None, features=NEW_FEATURES):
+    '''Returns `buffer` if it can hold `size` examples, or a new one that
+    can. Used to reuse one batch buffer across calls to
+    bulk_extract_features.'''
+    if buffer is None or len(buffer) < size:
+        num_planes = sum(f.planes for f in features)
+        buffer = np.zeros([size, go.N, go.N, num_planes], dtype=np.uint8)
+    return buffer
+
+
+def bulk_extract_features(positions, features=NEW_FEATURES, output=None):
+    '''Extracts features for a batch of positions.
+
+    If `output` is given, it must have room for at least len(positions)
+    examples, and the features are written into it instead of a new array.
+    Returns the filled part of the output.
+    '''
     num_positions = len(positions)
-    num_planes = sum(f.planes for f in features)
-    output = np.zeros([num_positions, go.N, go.N, num_planes], dtype=np.uint8)
+    if output is None:
+        num_planes = sum(f.planes for f in features)
+        output = np.zeros([num_positions, go.N, go.N, num_planes], dtype=np.uint8)
+    else:
+        output = output[:num_positions]
     for i, pos in enumerate(positions):
         output[i] = extract_features(pos, features=features)
     return output
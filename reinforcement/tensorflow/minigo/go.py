@@ -53,6 +53,14 @@ NEIGHBORS = {(x, y): list(filter(_check_bounds, [
 DIAGONALS = {(x, y): list(filter(_check_bounds, [
     (x+1, y+1), (x+1, y-1), (x-1, y+1), (x-1, y-1)])) for x, y in ALL_COORDS}
 
+# Flat indices (x * N + y) of the neighbors of every point, as a [4, N * N]
+# array (one row per direction, so reductions over neighbors are
+# elementwise). Neighbors off the edge of the board are N * N, so indexing
+# a flattened board padded with one extra value looks them up.
+NEIGHBOR_INDICES = np.array([
+    [n[0] * N + n[1] for n in NEIGHBORS[c]] + [N * N] * (4 - len(NEIGHBORS[c]))
+    for c in ALL_COORDS]).reshape([N * N, 4]).T.copy()
+
 
 class IllegalMove(Exception):
     pass
@@ -66,6 +74,16 @@ class PositionWithContext(namedtuple('SgfPosition', ['position', 'next_move', 'r
     pass
 
 
+def new_position(**kwargs):
+    '''Returns a Position from the engine selected by goparams.GO_ENGINE.
+
+    Takes the same keyword arguments as Position.'''
+    if goparams.GO_ENGINE == 'fast':
+        import fast_go
+        return fast_go.Position(**kwargs)
+    return Position(**kwargs)
+
+
 def place_stones(board, color, stones):
     for s in stones:
         board[s] = color
@@ -106,6 +124,30 @@ def find_reached(board, c):
     return chain, reached
 
 
+def label_chains(board):
+    '''Labels the chains of a board: connected points of the same color,
+    either stones or empty regions.
+
+    Returns a flat [N * N] array holding, for every point, the smallest
+    flat index of its chain. Labels are propagated to neighbors of the same
+    color a whole board at a time, with pointer jumping (every label is a
+    point of the same chain, so label = labels[label] skips ahead).'''
+    flat_board = board.ravel()
+    # off-board neighbors are FILL, so they never match a point.
+    padded = np.append(flat_board, FILL)
+    same_color = padded.take(NEIGHBOR_INDICES) == flat_board
+    neighbors = np.where(same_color, NEIGHBOR_INDICES, N * N)
+    # labels[N * N] stays N * N, so it never wins a minimum.
+    labels = np.arange(N * N + 1)
+    while True:
+        new_labels = np.minimum(labels[:-1],
+                                labels.take(neighbors).min(axis=0))
+        new_labels = new_labels.take(new_labels)
+        if np.array_equal(new_labels, labels[:-1]):
+            return new_labels
+        labels[:-1] = new_labels
+
+
 def is_koish(board, c):
     'Check if c is surrounded on all sides by 1 color, and return that color'
     if board[c] != EMPTY:
@@ -287,6 +329,13 @@ class LibertyTracker():
                     self._update_liberties(group_id, add={s})
 
 
+# Maps the feature planes of a position to those of the next position:
+# plane 2k (2k + 1) of the next position is plane 2k - 1 (2k - 2) of this one.
+# Planes 0, 1 and 16 are recomputed.
+_SHIFT_FEATURE_HISTORY = [0, 1] + [p for k in range(1, 8)
+                                   for p in (2 * k - 1, 2 * k - 2)] + [16]
+
+
 class Position():
     def __init__(self, board=None, n=0, komi=7.5, caps=(0, 0),
                  lib_tracker=None, ko=None, recent=tuple(),
@@ -303,6 +352,10 @@ class Position():
             made to the board at each move (played move and captures).
             Should satisfy next_pos.board - next_pos.board_deltas[0] == pos.board
         to_play: BLACK or WHITE
+
+        cached_features holds the features.NEW_FEATURES planes once they have
+        been extracted. They are then carried forward incrementally by
+        play_move and pass_move, which only need to add the new board.
         '''
         assert type(recent) is tuple
         self.board = board if board is not None else np.copy(EMPTY_BOARD)
@@ -316,11 +369,15 @@ class Position():
                                                                                    0, N, N], dtype=np.int8)
         self.to_play = to_play
         self.last_eight = None
+        self.cached_features = None
 
     def __deepcopy__(self, memodict={}):
         new_board = np.copy(self.board)
         new_lib_tracker = copy.deepcopy(self.lib_tracker)
-        return Position(new_board, self.n, self.komi, self.caps, new_lib_tracker, self.ko, self.recent, self.board_deltas, self.to_play)
+        pos = Position(new_board, self.n, self.komi, self.caps, new_lib_tracker, self.ko, self.recent, self.board_deltas, self.to_play)
+        # cached features are read-only, so they can be shared.
+        pos.cached_features = self.cached_features
+        return pos
 
     def __str__(self, colors=True):
         if colors:
@@ -399,33 +456,38 @@ class Position():
 
     def all_legal_moves(self):
         'Returns a np.array of size go.N**2 + 1, with 1 = legal, 0 = illegal'
-        # by default, every move is legal
-        legal_moves = np.ones([N, N], dtype=np.int8)
-        # ...unless there is already a stone there
-        legal_moves[self.board != EMPTY] = 0
-        # calculate which spots have 4 stones next to them
-        # padding is because the edge always counts as a lost liberty.
-        adjacent = np.ones([N+2, N+2], dtype=np.int8)
-        adjacent[1:-1, 1:-1] = np.abs(self.board)
-        num_adjacent_stones = (adjacent[:-2, 1:-1] + adjacent[1:-1, :-2] +
-                               adjacent[2:, 1:-1] + adjacent[1:-1, 2:])
+        flat_board = self.board.ravel()
+        # by default, every empty spot is legal
+        legal_moves = (flat_board == EMPTY).astype(np.int8)
+        # the edge always counts as an adjacent stone.
+        neighbor_colors = np.append(flat_board, FILL).take(NEIGHBOR_INDICES)
         # Surrounded spots are those that are empty and have 4 adjacent stones.
-        surrounded_spots = np.multiply(
-            (self.board == EMPTY),
-            (num_adjacent_stones == 4))
+        surrounded_spots = np.flatnonzero(
+            legal_moves & (neighbor_colors != EMPTY).all(axis=0))
         # Such spots are possibly illegal, unless they are capturing something.
-        # Iterate over and manually check each spot.
-        for coord in np.transpose(np.nonzero(surrounded_spots)):
-            if self.is_move_suicidal(tuple(coord)):
-                legal_moves[tuple(coord)] = 0
+        if len(surrounded_spots):
+            legal_moves[surrounded_spots] = self._surrounded_legality(
+                surrounded_spots, neighbor_colors[:, surrounded_spots])
 
         # ...and retaking ko is always illegal
         if self.ko is not None:
-            legal_moves[self.ko] = 0
+            legal_moves[self.ko[0] * N + self.ko[1]] = 0
 
         # and pass is always legal
-        return np.concatenate([legal_moves.ravel(), [1]])
-        # return legal_moves.ravel()
+        return np.concatenate([legal_moves, [1]])
+
+    def _surrounded_legality(self, spots, neighbor_colors):
+        '''Returns which of the surrounded (flattened) spots are not suicide,
+        given the [4, len(spots)] colors of their neighbors.
+
+        A surrounded spot is a liberty of all of its neighboring groups, so
+        playing there is legal if it connects to a friendly group with
+        another liberty, or takes the last liberty of an opponent group.'''
+        liberties = np.append(self.lib_tracker.liberty_cache.ravel(), 0).take(
+            NEIGHBOR_INDICES[:, spots])
+        return np.any(
+            ((neighbor_colors == self.to_play) & (liberties > 1)) |
+            ((neighbor_colors == -self.to_play) & (liberties == 1)), axis=0)
 
     def pass_move(self, mutate=False):
         pos = self if mutate else copy.deepcopy(self)
@@ -436,14 +498,33 @@ class Position():
             pos.board_deltas[:6]))
         pos.to_play *= -1
         pos.ko = None
+        pos._advance_features()
         return pos
 
     def flip_playerturn(self, mutate=False):
         pos = self if mutate else copy.deepcopy(self)
         pos.ko = None
         pos.to_play *= -1
+        pos.cached_features = None
         return pos
 
+    def _advance_features(self):
+        '''Updates cached_features after a move has been played, from the
+        planes of the position before the move.
+
+        The history planes shift back by one board and swap colors, since
+        the player to move alternates; see features.stone_features.
+        '''
+        previous = self.cached_features
+        if previous is None:
+            return
+        features = previous[:, :, _SHIFT_FEATURE_HISTORY]
+        features[:, :, 0] = self.board == self.to_play
+        features[:, :, 1] = self.board == -self.to_play
+        features[:, :, 16] = self.to_play == BLACK
+        features.flags.writeable = False
+        self.cached_features = features
+
     def get_liberties(self):
         return self.lib_tracker.liberty_cache
 
@@ -499,6 +580,7 @@ class Position():
             new_board_delta.reshape(1, N, N),
             pos.board_deltas[:6]))
         pos.to_play *= -1
+        pos._advance_features()
         return pos
 
     def is_game_over(self):
@@ -508,23 +590,21 @@ class Position():
 
     def score(self):
         'Return score from B perspective. If W is winning, score is negative.'
-        working_board = np.copy(self.board)
-        while EMPTY in working_board:
-            unassigned_spaces = np.where(working_board == EMPTY)
-            c = unassigned_spaces[0][0], unassigned_spaces[1][0]
-            territory, borders = find_reached(working_board, c)
-            border_colors = set(working_board[b] for b in borders)
-            X_border = BLACK in border_colors
-            O_border = WHITE in border_colors
-            if X_border and not O_border:
-                territory_color = BLACK
-            elif O_border and not X_border:
-                territory_color = WHITE
-            else:
-                territory_color = UNKNOWN  # dame, or seki
-            place_stones(working_board, territory_color, territory)
-
-        return np.count_nonzero(working_board == BLACK) - np.count_nonzero(working_board == WHITE) - self.komi
+        flat_board = self.board.ravel()
+        labels = label_chains(self.board)
+        neighbor_colors = np.append(flat_board, FILL).take(NEIGHBOR_INDICES)
+        empty = flat_board == EMPTY
+        # an empty region is territory if it only borders stones of one color
+        borders_black = np.zeros([N * N], dtype=np.bool_)
+        borders_black[labels[empty & (neighbor_colors == BLACK).any(axis=0)]] = True
+        borders_white = np.zeros([N * N], dtype=np.bool_)
+        borders_white[labels[empty & (neighbor_colors == WHITE).any(axis=0)]] = True
+        black_territory = empty & borders_black[labels] & ~borders_white[labels]
+        white_territory = empty & borders_white[labels] & ~borders_black[labels]
+
+        return (np.count_nonzero(flat_board == BLACK) + np.count_nonzero(black_territory) -
+                np.count_nonzero(flat_board == WHITE) - np.count_nonzero(white_territory) -
+                self.komi)
 
     def result(self):
         score = self.score()
@@ -93,3 +93,65 @@ _set('EVALUATE_PUZZLES', True)
 _set('TRIES_PER_PUZZLE', 1)
 _set('SP_READOUTS', 200)
 _set('TERMINATION_ACCURACY', 100)
+
+# Which go.Position implementation to play with: 'default' is go.Position,
+# 'fast' is the union-find engine in fast_go.py. Can be overridden with the
+# GO_ENGINE environment variable.
+_set('GO_ENGINE', 'default')
+GO_ENGINE = os.environ.get('GO_ENGINE', GO_ENGINE)
+
+# Build MCTS trees from mcts.LazyMCTSNode, which only materialize positions
+# for the root and for leaves awaiting evaluation.
+_set('LAZY_MCTS_POSITIONS', False)
+
+# Lazy trees also keep the positions of expanded nodes whose move number is a
+# multiple of this, so a new leaf replays at most this many moves instead of
+# all moves from the root. 0 keeps only the root's position. Measured with
+# oneoffs/mcts_tree_benchmark.py --readouts=1600 on 9x9 (19x19):
+#   MCTSNode:   1.0 play_move per readout, 5414 (14830) bytes/node
+#   interval 0: 3.5 (3.1) play_moves per readout, 2816 (9543) bytes/node
+#   interval 2: 1.5 (1.4) play_moves per readout, 4743 (12460) bytes/node
+#   interval 4: 2.5 (2.1) play_moves per readout, 3744 (11098) bytes/node
+# Deeper trees replay more moves per readout at interval 0, so lazy trees
+# search more slowly than MCTSNode ones unless the interval is small.
+_set('LAZY_MCTS_POSITION_INTERVAL', 4)
+
+# Store MCTS trees as a struct of arrays (mcts_array.ArrayTree) instead of
+# one MCTSNode object per node.
+_set('ARRAY_MCTS_TREE', False)
+
+# Serve selfplay inference from one process (inference_server.py) that
+# batches the requests of all selfplay workers, instead of loading the model
+# in every worker. A batch is run once it has INFERENCE_MAX_BATCH positions or
+# its oldest request has waited INFERENCE_MAX_LATENCY_MS.
+_set('INFERENCE_SERVER', False)
+_set('INFERENCE_MAX_BATCH', 256)
+_set('INFERENCE_MAX_LATENCY_MS', 2)
+
+# How many network evaluations each player caches (eval_cache.EvalCache);
+# 0 disables the cache.
+_set('EVAL_CACHE_SIZE', 0)
+
+# Evaluate every MCTS leaf under all 8 symmetries of the board in one batch
+# and average the results, instead of under one random symmetry.
+_set('EVAL_ALL_SYMMETRIES', False)
+
+# How many processes main.gather uses to stream selfplay records into
+# training chunks; 0 shuffles each model's files serially in a TF session.
+_set('GATHER_WORKERS', 0)
+
+# Write gathered training chunks and holdout games as packed records
+# (preprocessing.PACKED_SUFFIX) instead of ZLIB tf.Examples, and train and
+# validate from them.
+_set('PACKED_RECORDS', False)
+
+# Train from an in-memory replay buffer (replay_buffer.py) holding the
+# selfplay positions of the last REPLAY_GENERATIONS generations, instead of
+# gathering chunks and re-reading the whole window every generation. 0 trains
+# from gathered chunks. REPLAY_BUFFER_SIZE is the most positions it holds.
+_set('REPLAY_GENERATIONS', 0)
+_set('REPLAY_BUFFER_SIZE', 500000)
+
+# Select each batch of MCTS leaves while the network evaluates the previous
+# batch on another thread (strategies.MCTSPlayerMixin.pipelined_tree_search).
+_set('PIPELINED_SEARCH', False)
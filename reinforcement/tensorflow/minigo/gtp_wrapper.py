@@ -59,7 +59,7 @@ class GtpInterface(object):
                 pass
             except:
                 print("Error saving sgf", file=sys.stderr, flush=True)
-        self.position = go.Position(komi=self.komi)
+        self.position = go.new_position(komi=self.komi)
         self.initialize_game(self.position)
 
     def accomodate_out_of_turn(self, color):
@@ -0,0 +1,250 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serves network inference to selfplay workers from a single process.
+
+Selfplay workers normally build their own DualNetwork, so every worker holds
+its own TF graph, session and copy of the weights. Instead, one process can
+run an InferenceServer, and workers use a RemoteNetwork, which has the same
+run / run_many interface as DualNetwork.
+
+Workers extract features and apply random symmetries themselves, then send
+the feature planes over a local (unix domain) socket. The server collects
+requests from all workers into one batch, which is run when it holds
+`max_batch_size` positions or when its oldest request has waited
+`max_latency` seconds, and sends every worker its slice of the results.
+
+python inference_server.py serve models/000001-name /tmp/inference.sock
+"""
+
+import argh
+import argparse
+import os
+import queue
+import socket
+import threading
+import time
+import traceback
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+import features
+import goparams
+import symmetries
+
+MAX_BATCH_SIZE = goparams.INFERENCE_MAX_BATCH
+MAX_LATENCY = goparams.INFERENCE_MAX_LATENCY_MS / 1000.0
+
+
+def _hang_up(conn):
+    '''Shuts down the socket of a connection, so that the worker's recv
+    fails. Closing it would not wake up the worker while this process still
+    has a reader thread blocked on it; that thread closes it instead.'''
+    try:
+        sock = socket.fromfd(conn.fileno(), socket.AF_UNIX, socket.SOCK_STREAM)
+    except OSError:
+        return  # already closed.
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    finally:
+        sock.close()
+
+
+class InferenceServer(object):
+    """Batches inference requests from many RemoteNetworks.
+
+    network: anything with a `run_features` method, like dual_net.DualNetwork.
+    address: path of the unix domain socket to listen on.
+    """
+
+    def __init__(self, network, address, max_batch_size=MAX_BATCH_SIZE,
+                 max_latency=MAX_LATENCY):
+        self.network = network
+        self.address = address
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.requests = queue.Queue()
+        self.num_batches = 0
+        self.num_positions = 0
+        self._closed = False
+        if os.path.exists(address):
+            os.remove(address)
+        self.listener = Listener(address, family='AF_UNIX')
+        self._accept_thread = threading.Thread(target=self._accept, daemon=True)
+        self._accept_thread.start()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._read, args=(conn,),
+                             daemon=True).start()
+
+    def _read(self, conn):
+        while True:
+            try:
+                processed = conn.recv()
+            except (EOFError, OSError):
+                conn.close()
+                return
+            self.requests.put((conn, processed))
+
+    def _next_batch(self):
+        '''Blocks for a request, then gathers more until the batch is full
+        or the first request's deadline has passed.
+
+        Returns the batch, which is empty if close() was called before any
+        request arrived, and whether close() was called.'''
+        request = self.requests.get()
+        if request[0] is None:  # sent by close()
+            return [], True
+        batch = [request]
+        size = len(request[1])
+        deadline = time.time() + self.max_latency
+        while size < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request[0] is None:
+                return batch, True
+            batch.append(request)
+            size += len(request[1])
+        return batch, False
+
+    def serve_batch(self):
+        '''Serves one batch. Returns False once close() has been called.'''
+        batch, closed = self._next_batch()
+        if batch:
+            self._run_batch(batch)
+        return not closed
+
+    def _run_batch(self, batch):
+        processed = np.concatenate([request for _, request in batch])
+        try:
+            probabilities, values = self.network.run_features(processed)
+        except Exception:
+            traceback.print_exc()
+            # the workers would otherwise wait for their results forever.
+            for conn, _ in batch:
+                _hang_up(conn)
+            return
+        self.num_batches += 1
+        self.num_positions += len(processed)
+        start = 0
+        for conn, request in batch:
+            end = start + len(request)
+            try:
+                conn.send((probabilities[start:end], values[start:end]))
+            except OSError:
+                pass  # the worker went away; its reader thread cleans up.
+            start = end
+
+    def serve_forever(self):
+        while self.serve_batch():
+            pass
+
+    def close(self):
+        self._closed = True
+        self.listener.close()
+        self.requests.put((None, None))
+
+
+class RemoteNetwork(object):
+    """A client of an InferenceServer, with the interface of DualNetwork.
+
+    Connecting is retried for `timeout` seconds, so workers can be started
+    at the same time as the server.
+    """
+
+    def __init__(self, address, save_file=None, timeout=60):
+        self.save_file = save_file
+        self.feature_buffer = None
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self.conn = Client(address, family='AF_UNIX')
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def run(self, position, use_random_symmetry=True, all_symmetries=False):
+        probs, values = self.run_many([position],
+                                      use_random_symmetry=use_random_symmetry,
+                                      all_symmetries=all_symmetries)
+        return probs[0], values[0]
+
+    def run_many(self, positions, use_random_symmetry=True,
+                 all_symmetries=False):
+        """Evaluates a list of positions.
+
+        With all_symmetries, each position is evaluated under all 8
+        symmetries in a single batch, and the results are averaged."""
+        self.feature_buffer = features.feature_buffer(
+            len(positions), self.feature_buffer)
+        processed = features.bulk_extract_features(
+            positions, output=self.feature_buffer)
+        if all_symmetries:
+            probabilities, value = self.run_features(
+                symmetries.all_symmetries_feat(processed))
+            return symmetries.average_symmetries(probabilities, value)
+        if use_random_symmetry:
+            syms_used, processed = symmetries.randomize_symmetries_feat(
+                processed)
+        probabilities, value = self.run_features(processed)
+        if use_random_symmetry:
+            probabilities = symmetries.invert_symmetries_pi(
+                syms_used, probabilities)
+        return probabilities, value
+
+    def run_features(self, processed):
+        self.conn.send(np.asarray(processed, dtype=np.uint8))
+        return self.conn.recv()
+
+    def close(self):
+        self.conn.close()
+
+
+def serve(
+        load_file: "The path to the network model files",
+        address: "Path of the unix domain socket to listen on",
+        max_batch_size: "Most positions to run at once"=MAX_BATCH_SIZE,
+        max_latency_ms: "Longest a request waits for its batch to fill"=goparams.INFERENCE_MAX_LATENCY_MS):
+    import dual_net
+    if goparams.DUMMY_MODEL:
+        # same quickly executing network as the selfplay workers use.
+        dual_net.get_default_hyperparams = lambda **kwargs: {
+            'k': 8, 'fc_width': 16, 'num_shared_layers': 1, 'l2_strength': 1e-4, 'momentum': 0.9}
+    network = dual_net.DualNetwork(load_file)
+    server = InferenceServer(network, address, int(max_batch_size),
+                             float(max_latency_ms) / 1000.0)
+    print("Serving %s on %s" % (load_file, address), flush=True)
+    server.serve_forever()
+
+
+parser = argparse.ArgumentParser()
+argh.add_commands(parser, [serve])
+
+if __name__ == '__main__':
+    argh.dispatch(parser)
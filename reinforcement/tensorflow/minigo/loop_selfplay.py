@@ -55,6 +55,9 @@ TRAINING_CHUNK_DIR = os.path.join(BASE_DIR, 'data', 'training_chunks')
 
 ESTIMATOR_WORKING_DIR = os.path.join(BASE_DIR, 'estimator_working_dir')
 
+# Where the inference server listens, if goparams.INFERENCE_SERVER is set.
+INFERENCE_ADDRESS = os.path.join(BASE_DIR, 'inference.sock')
+
 # How many games before the selfplay workers will stop trying to play more.
 MAX_GAMES_PER_GENERATION = goparams.MAX_GAMES_PER_GENERATION
 
@@ -139,6 +142,13 @@ def main_():
       return len(gfile.Glob(os.path.join(SELFPLAY_DIR, model_name, '*.zz')))
 
 
+    if goparams.INFERENCE_SERVER:
+      # one process holds the model and batches the workers' requests.
+      print('Starting inference server...')
+      cmd = 'GOPARAMS={} python3 inference_server.py serve {} {}'.format(
+          os.environ['GOPARAMS'], os.path.join(MODELS_DIR, model_name), INFERENCE_ADDRESS)
+      procs.append(subprocess.Popen(cmd, shell=True))
+
     for i in range(goparams.NUM_PARALLEL_SELFPLAY):
       print('Starting Worker...')
       num_workers += 1
@@ -165,6 +175,8 @@ def main_():
     # Sometimes the workers need extra help...
     time.sleep(5)
     os.system('pkill -f selfplay_worker.py')
+    if goparams.INFERENCE_SERVER:
+      os.system('pkill -f inference_server.py')
 
     # Let things settle after we kill processes.
     time.sleep(10)
@@ -37,6 +37,7 @@ import logging
 
 import goparams
 import predict_games
+import replay_buffer
 
 import qmeas
 
@@ -52,6 +53,7 @@ BURY_SELFPLAY_DIR = os.path.join(BASE_DIR, 'bury_selfplay')
 HOLDOUT_DIR = os.path.join(BASE_DIR, 'data/holdout')
 SGF_DIR = os.path.join(BASE_DIR, 'sgf')
 TRAINING_CHUNK_DIR = os.path.join(BASE_DIR, 'data', 'training_chunks')
+REPLAY_BUFFER_FILE = os.path.join(BASE_DIR, 'data', 'replay_buffer.npz')
 
 ESTIMATOR_WORKING_DIR = os.path.join(BASE_DIR, 'estimator_working_dir')
 
@@ -72,6 +74,7 @@ def print_flags():
         'HOLDOUT_DIR': HOLDOUT_DIR,
         'SGF_DIR': SGF_DIR,
         'TRAINING_CHUNK_DIR': TRAINING_CHUNK_DIR,
+        'REPLAY_BUFFER_FILE': REPLAY_BUFFER_FILE,
         'ESTIMATOR_WORKING_DIR': ESTIMATOR_WORKING_DIR,
     }
     print("Computed variables are:")
@@ -137,25 +140,54 @@ def evaluate(prev_model, cur_model, readouts=200, verbose=1, resign_threshold=0.
 def gather():
     print("Gathering game output...")
     main.gather(input_directory=SELFPLAY_DIR,
-                output_directory=TRAINING_CHUNK_DIR)
+                output_directory=TRAINING_CHUNK_DIR,
+                packed=goparams.PACKED_RECORDS)
 
 
-def train():
+def train(replay=None):
     model_num, model_name = get_latest_model()
     print("Training on gathered game data, initializing from {}".format(model_name))
     new_model_name = shipname.generate(model_num + 1)
     print("New model will be {}".format(new_model_name))
     load_file = os.path.join(MODELS_DIR, model_name)
     save_file = os.path.join(MODELS_DIR, new_model_name)
+    if replay is not None:
+        train_from_replay_buffer(replay, save_file, model_num + 1)
+        return new_model_name
     #try:
     main.train(ESTIMATOR_WORKING_DIR, TRAINING_CHUNK_DIR, save_file,
-               generation_num=model_num + 1)
+               generation_num=model_num + 1, packed=goparams.PACKED_RECORDS)
     #except:
     #    print("Got an error training, muddling on...")
     #    logging.exception("Train error")
     return new_model_name
 
 
+def load_replay_buffer():
+    with timer("Loading replay buffer"):
+        return replay_buffer.ReplayBuffer.restore(
+            REPLAY_BUFFER_FILE, goparams.REPLAY_BUFFER_SIZE,
+            goparams.REPLAY_GENERATIONS)
+
+
+def save_replay_buffer(replay):
+    with timer("Saving replay buffer"):
+        replay.save(REPLAY_BUFFER_FILE)
+
+
+def train_from_replay_buffer(replay, save_file, generation_num):
+    qmeas.start_time('train')
+    with timer("Ingesting new selfplay games"):
+        num_new = replay.ingest(SELFPLAY_DIR)
+    print("Added {} positions; training from {} positions of the last {} "
+          "generations".format(num_new, len(replay), replay.generations))
+    with timer("Training"):
+        dual_net.train(ESTIMATOR_WORKING_DIR, [], generation_num,
+                       replay=replay)
+        dual_net.export_model(ESTIMATOR_WORKING_DIR, save_file)
+    qmeas.stop_time('train')
+
+
 def bury_latest_model():
   main._ensure_dir_exists(BURY_DIR)
   main._ensure_dir_exists(BURY_SELFPLAY_DIR)
@@ -208,18 +240,23 @@ def validate(model_num=None, validate_name=None):
 
     main.validate(ESTIMATOR_WORKING_DIR, *holdout_dirs,
                   checkpoint_name=os.path.join(MODELS_DIR, model_name),
-                  validate_name=validate_name)
+                  validate_name=validate_name,
+                  packed=goparams.PACKED_RECORDS)
 
 
 def echo():
     pass  # Flags are echo'd in the ifmain block below.
 
 
-def rl_loop():
+def rl_loop(replay=None):
     """Run the reinforcement learning loop
 
     This tries to create a realistic way to run the reinforcement learning with
     all default parameters.
+
+    With REPLAY_GENERATIONS, training samples from `replay`, a
+    replay_buffer.ReplayBuffer that the caller keeps in memory between
+    generations.
     """
 
     if goparams.DUMMY_MODEL:
@@ -234,12 +271,13 @@ def rl_loop():
         preprocessing.SHUFFLE_BUFFER_SIZE = 1000
 
     qmeas.stop_time('selfplay_wait')
-    print("Gathering game output...")
-    gather()
+    if replay is None:
+        print("Gathering game output...")
+        gather()
 
     print("Training on gathered game data...")
     _, model_name = get_latest_model()
-    new_model = train()
+    new_model = train(replay)
 
 
     if goparams.EVALUATE_PUZZLES:
@@ -300,5 +338,13 @@ if __name__ == '__main__':
     fh.setLevel(logging.DEBUG)
     fh.setFormatter(formatter)
     log.addHandler(fh)
-    rl_loop()
+    if goparams.REPLAY_GENERATIONS:
+        # restored once on startup and saved once on shutdown.
+        replay = load_replay_buffer()
+        try:
+            rl_loop(replay)
+        finally:
+            save_replay_buffer(replay)
+    else:
+        rl_loop()
     qmeas.end()
@@ -26,12 +26,16 @@ import time
 import cloud_logging
 from tqdm import tqdm
 import gzip
+import hashlib
+import multiprocessing
+import resource
 import numpy as np
 import tensorflow as tf
 from tensorflow import gfile
 
 import go
 import dual_net
+from eval_cache import EvalCache
 from gtp_wrapper import make_gtp_instance, MCTSPlayer
 import preprocessing
 import selfplay_mcts
@@ -106,15 +110,17 @@ def train(
         working_dir: 'tf.estimator working directory.',
         chunk_dir: 'Directory where gathered training chunks are.',
         model_save_path: 'Where to export the completed generation.',
-        generation_num: 'Which generation you are training.'=0):
+        generation_num: 'Which generation you are training.'=0,
+        packed: 'Train from packed chunks instead of tf.Examples'=goparams.PACKED_RECORDS):
     qmeas.start_time('train')
-    tf_records = sorted(gfile.Glob(os.path.join(chunk_dir, '*.tfrecord.zz')))
+    tf_records = sorted(gfile.Glob(
+        os.path.join(chunk_dir, '*' + _record_suffix(packed))))
     tf_records = tf_records[-1 * (WINDOW_SIZE // EXAMPLES_PER_RECORD):]
 
     print("Training from:", tf_records[0], "to", tf_records[-1])
 
     with timer("Training"):
-        dual_net.train(working_dir, tf_records, generation_num)
+        dual_net.train(working_dir, tf_records, generation_num, packed=packed)
         dual_net.export_model(working_dir, model_save_path)
     qmeas.stop_time('train')
 
@@ -123,19 +129,21 @@ def validate(
         working_dir: 'tf.estimator working directory',
         *tf_record_dirs: 'Directories where holdout data are',
         checkpoint_name: 'Which checkpoint to evaluate (None=latest)'=None,
-        validate_name: 'Name for validation set (i.e., selfplay or human)'=None):
+        validate_name: 'Name for validation set (i.e., selfplay or human)'=None,
+        packed: 'Validate on packed holdout files instead of tf.Examples'=goparams.PACKED_RECORDS):
     qmeas.start_time('validate')
     tf_records = []
+    pattern = '*' + preprocessing.PACKED_SUFFIX if packed else '*.zz'
     with timer("Building lists of holdout files"):
         for record_dir in tf_record_dirs:
-            tf_records.extend(gfile.Glob(os.path.join(record_dir, '*.zz')))
+            tf_records.extend(gfile.Glob(os.path.join(record_dir, pattern)))
 
     first_record = os.path.basename(tf_records[0])
     last_record = os.path.basename(tf_records[-1])
     with timer("Validating from {} to {}".format(first_record, last_record)):
         dual_net.validate(
             working_dir, tf_records, checkpoint_name=checkpoint_name,
-            name=validate_name)
+            packed=packed, name=validate_name)
     qmeas.stop_time('validate')
 
 
@@ -190,6 +198,37 @@ def evaluate_evenly(
 
 
 
+def _record_suffix(packed):
+    return preprocessing.PACKED_SUFFIX if packed else '.tfrecord.zz'
+
+
+def _write_selfplay_game(player, output_dir, holdout_dir, clean_sgf, full_sgf,
+                         holdout_pct, packed=goparams.PACKED_RECORDS):
+    output_name = '{}-{}'.format(int(time.time() * 1000 * 1000), socket.gethostname())
+    game_data = player.extract_data()
+    with gfile.GFile(os.path.join(clean_sgf, '{}.sgf'.format(output_name)), 'w') as f:
+        f.write(player.to_sgf(use_comments=False))
+    with gfile.GFile(os.path.join(full_sgf, '{}.sgf'.format(output_name)), 'w') as f:
+        f.write(player.to_sgf())
+
+    # Hold out 5% of games for evaluation. Holdout games are only read by
+    # validate, so they are written packed when validate reads packed files;
+    # the others are read by gather (or the replay buffer) as tf.Examples.
+    if random.random() < holdout_pct:
+        if packed:
+            fname = os.path.join(
+                holdout_dir, output_name + preprocessing.PACKED_SUFFIX)
+            preprocessing.write_packed_examples(
+                fname, preprocessing.pack_selfplay_examples(game_data))
+            return
+        fname = os.path.join(holdout_dir, "{}.tfrecord.zz".format(output_name))
+    else:
+        fname = os.path.join(output_dir, "{}.tfrecord.zz".format(output_name))
+
+    tf_examples = preprocessing.make_dataset_from_selfplay(game_data)
+    preprocessing.write_tf_examples(fname, tf_examples)
+
+
 def selfplay(
         load_file: "The path to the network model files",
         output_dir: "Where to write the games"="data/selfplay",
@@ -214,22 +253,8 @@ def selfplay(
         player = selfplay_mcts.play(
             network, readouts, resign_threshold, verbose)
 
-    output_name = '{}-{}'.format(int(time.time() * 1000 * 1000), socket.gethostname())
-    game_data = player.extract_data()
-    with gfile.GFile(os.path.join(clean_sgf, '{}.sgf'.format(output_name)), 'w') as f:
-        f.write(player.to_sgf(use_comments=False))
-    with gfile.GFile(os.path.join(full_sgf, '{}.sgf'.format(output_name)), 'w') as f:
-        f.write(player.to_sgf())
-
-    tf_examples = preprocessing.make_dataset_from_selfplay(game_data)
-
-    # Hold out 5% of games for evaluation.
-    if random.random() < holdout_pct:
-        fname = os.path.join(holdout_dir, "{}.tfrecord.zz".format(output_name))
-    else:
-        fname = os.path.join(output_dir, "{}.tfrecord.zz".format(output_name))
-
-    preprocessing.write_tf_examples(fname, tf_examples)
+    _write_selfplay_game(player, output_dir, holdout_dir, clean_sgf, full_sgf,
+                         holdout_pct)
     qmeas.stop_time('selfplay')
 
 
@@ -254,30 +279,125 @@ def selfplay_cache_model(
         player = selfplay_mcts.play(
             network, readouts, resign_threshold, verbose)
 
-    output_name = '{}-{}'.format(int(time.time() * 1000 * 1000), socket.gethostname())
-    game_data = player.extract_data()
-    with gfile.GFile(os.path.join(clean_sgf, '{}.sgf'.format(output_name)), 'w') as f:
-        f.write(player.to_sgf(use_comments=False))
-    with gfile.GFile(os.path.join(full_sgf, '{}.sgf'.format(output_name)), 'w') as f:
-        f.write(player.to_sgf())
+    _write_selfplay_game(player, output_dir, holdout_dir, clean_sgf, full_sgf,
+                         holdout_pct)
+    qmeas.stop_time('selfplay')
 
-    tf_examples = preprocessing.make_dataset_from_selfplay(game_data)
 
-    # Hold out 5% of games for evaluation.
-    if random.random() < holdout_pct:
-        fname = os.path.join(holdout_dir, "{}.tfrecord.zz".format(output_name))
-    else:
-        fname = os.path.join(output_dir, "{}.tfrecord.zz".format(output_name))
 
-    preprocessing.write_tf_examples(fname, tf_examples)
+def selfplay_batched(
+        load_file: "The path to the network model files",
+        output_dir: "Where to write the games"="data/selfplay",
+        holdout_dir: "Where to write the games"="data/holdout",
+        output_sgf: "Where to write the sgfs"="sgf/",
+        readouts: 'How many simulations to run per move'=100,
+        games: 'How many games to play'=16,
+        games_in_flight: 'How many games to play at the same time'=16,
+        batch_size: 'Most positions to send to the network at once'=256,
+        verbose: '>=2 will print debug info, >=3 will print boards' = 1,
+        resign_threshold: 'absolute value of threshold to resign at' = 0.95,
+        holdout_pct: 'how many games to hold out for validation' = 0.05):
+    qmeas.start_time('selfplay')
+    clean_sgf = os.path.join(output_sgf, 'clean')
+    full_sgf = os.path.join(output_sgf, 'full')
+    _ensure_dir_exists(clean_sgf)
+    _ensure_dir_exists(full_sgf)
+    _ensure_dir_exists(output_dir)
+    _ensure_dir_exists(holdout_dir)
+
+    with timer("Loading weights from %s ... " % load_file):
+        network = dual_net.DualNetwork(load_file)
+
+    driver = selfplay_mcts.BatchedSelfplay(
+        network, readouts, resign_threshold, verbose,
+        games_in_flight=games_in_flight, batch_size=batch_size)
+    with timer("Playing %d games" % games):
+        for player in driver.play(games):
+            _write_selfplay_game(player, output_dir, holdout_dir, clean_sgf,
+                                 full_sgf, holdout_pct)
+    print("%.1f games/hour, %.1f positions/sec" % (
+        driver.games_per_hour(), driver.positions_per_sec()))
+    qmeas.record('selfplay_games_per_hour', driver.games_per_hour())
+    qmeas.record('selfplay_positions_per_sec', driver.positions_per_sec())
+    if isinstance(driver.network, EvalCache):
+        print("Eval cache hit rate: %.3f" % driver.network.hit_rate())
+        qmeas.record('eval_cache_hit_rate', driver.network.hit_rate())
     qmeas.stop_time('selfplay')
 
 
+def _gather_shard(shard):
+    '''Shuffles one shard of a model's selfplay records into training chunks.
+    Runs in a gather worker process.
+
+    Returns the shard's record files and how many examples were written.'''
+    (model_name, record_files, output_directory, examples_per_record,
+     buffer_size, packed) = shard
+    # name the chunks after the shard's files, so that shards gathered by
+    # later calls don't overwrite them.
+    shard_key = hashlib.md5('\n'.join(record_files).encode()).hexdigest()[:8]
+    pattern = os.path.join(output_directory, '{}-{}-{{}}{}'.format(
+        model_name, shard_key, _record_suffix(packed)))
+    examples = preprocessing.stream_shuffle_tf_examples(
+        record_files, buffer_size)
+    if packed:
+        num_examples = preprocessing.write_packed_example_chunks(
+            pattern, examples, examples_per_record)
+    else:
+        num_examples = preprocessing.write_tf_example_chunks(
+            pattern, examples, examples_per_record)
+    return record_files, num_examples
+
+
+def _gather_parallel(new_gamedata, output_directory, examples_per_record,
+                     meta_file, workers, packed=False):
+    '''Gathers with a pool of worker processes, each streaming one shard of
+    a model's files into chunks. Returns the number of files processed.'''
+    # split models into more shards when there are fewer models than workers,
+    # and divide the shuffle buffer between the workers.
+    shards_per_model = max(1, workers // max(1, len(new_gamedata)))
+    buffer_size = max(examples_per_record,
+                      preprocessing.SHUFFLE_BUFFER_SIZE // workers)
+    shards = []
+    for model_name, record_files in sorted(new_gamedata.items()):
+        for i in range(min(shards_per_model, len(record_files))):
+            shards.append((model_name, record_files[i::shards_per_model],
+                           output_directory, examples_per_record, buffer_size,
+                           packed))
+
+    num_files, num_examples = 0, 0
+    start = time.time()
+    with multiprocessing.Pool(workers) as pool:
+        for record_files, shard_examples in tqdm(
+                pool.imap_unordered(_gather_shard, shards), total=len(shards)):
+            # appended as soon as each shard's chunks are written, so an
+            # interrupted gather only redoes the unfinished shards. Each name
+            # starts a new line, as the serial gather writes meta.txt
+            # without a trailing newline.
+            with gfile.GFile(meta_file, 'a') as f:
+                f.write(''.join('\n' + name for name in record_files))
+            num_files += len(record_files)
+            num_examples += shard_examples
+    elapsed = time.time() - start
+
+    # ru_maxrss is in kilobytes on Linux.
+    peak_rss_mb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+    examples_per_sec = num_examples / elapsed if elapsed else 0
+    print("Gathered %d examples from %d shards: %.1f examples/sec, "
+          "peak RSS %.1f MB" % (num_examples, len(shards), examples_per_sec,
+                                peak_rss_mb))
+    qmeas.record('gather_examples_per_sec', examples_per_sec)
+    qmeas.record('gather_peak_rss_mb', peak_rss_mb)
+    return num_files
+
 
 def gather(
         input_directory: 'where to look for games'='data/selfplay/',
         output_directory: 'where to put collected games'='data/training_chunks/',
-        examples_per_record: 'how many tf.examples to gather in each chunk'=EXAMPLES_PER_RECORD):
+        examples_per_record: 'how many tf.examples to gather in each chunk'=EXAMPLES_PER_RECORD,
+        workers: 'processes to gather with; 0 shuffles serially in a TF session'=goparams.GATHER_WORKERS,
+        packed: 'write packed chunks instead of tf.Examples'=goparams.PACKED_RECORDS):
     qmeas.start_time('gather')
     _ensure_dir_exists(output_directory)
     models = [model_dir.strip('/')
@@ -301,16 +421,37 @@ def gather(
 
     num_already_processed = len(already_processed)
 
+    if workers:
+        # only the new files of each model are gathered, and meta.txt is
+        # appended to instead of rewritten.
+        new_gamedata = {
+            model_name: sorted(set(record_files) - already_processed)
+            for model_name, record_files in model_gamedata.items()}
+        new_gamedata = {model_name: record_files
+                        for model_name, record_files in new_gamedata.items()
+                        if record_files}
+        num_processed = _gather_parallel(new_gamedata, output_directory,
+                                         examples_per_record, meta_file,
+                                         int(workers), packed)
+        print("Processed %s new files" % num_processed)
+        qmeas.stop_time('gather')
+        return
+
     for model_name, record_files in sorted(model_gamedata.items()):
         if set(record_files) <= already_processed:
             continue
         print("Gathering files for %s:" % model_name)
         for i, example_batch in enumerate(
                 tqdm(preprocessing.shuffle_tf_examples(examples_per_record, record_files))):
-            output_record = os.path.join(output_directory,
-                                         '{}-{}.tfrecord.zz'.format(model_name, str(i)))
-            preprocessing.write_tf_examples(
-                output_record, example_batch, serialize=False)
+            output_record = os.path.join(output_directory, '{}-{}{}'.format(
+                model_name, str(i), _record_suffix(packed)))
+            if packed:
+                preprocessing.write_packed_examples(
+                    output_record, preprocessing.pack_examples(
+                        *preprocessing.parse_serialized_examples(example_batch)))
+            else:
+                preprocessing.write_tf_examples(
+                    output_record, example_batch, serialize=False)
         already_processed.update(record_files)
 
     print("Processed %s new files" %
@@ -322,7 +463,8 @@ def gather(
 
 parser = argparse.ArgumentParser()
 argh.add_commands(parser, [gtp, bootstrap, train,
-                           selfplay, gather, evaluate, validate])
+                           selfplay, selfplay_batched, gather, evaluate,
+                           validate])
 
 if __name__ == '__main__':
     cloud_logging.configure()
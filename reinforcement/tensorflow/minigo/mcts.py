@@ -50,6 +50,19 @@ class DummyNode(object):
         self.child_W = collections.defaultdict(float)
 
 
+def discard_subtree(node):
+    """Unlinks every node below `node`.
+
+    Parents and children reference each other, so a discarded subtree would
+    otherwise only be reclaimed by the cyclic garbage collector. Breaking the
+    links lets reference counting free it immediately."""
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        pending.extend(node.children.values())
+        node.children.clear()
+
+
 class MCTSNode(object):
     """A node of a MCTS search tree.
 
@@ -86,7 +99,7 @@ class MCTSNode(object):
 
     @property
     def child_action_score(self):
-        return self.child_Q * self.position.to_play + self.child_U - self.illegal_moves
+        return self.child_Q * self.to_play + self.child_U - self.illegal_moves
 
     @property
     def child_Q(self):
@@ -120,7 +133,15 @@ class MCTSNode(object):
     @property
     def Q_perspective(self):
         "Return value of position, from perspective of player to play."
-        return self.Q * self.position.to_play
+        return self.Q * self.to_play
+
+    @property
+    def to_play(self):
+        return self.position.to_play
+
+    @property
+    def last_move_was_pass(self):
+        return bool(self.position.recent) and self.position.recent[-1].move is None
 
     def select_leaf(self):
         current = self
@@ -132,9 +153,7 @@ class MCTSNode(object):
                 break
             # HACK: if last move was a pass, always investigate double-pass first
             # to avoid situations where we auto-lose by passing too early.
-            if (current.position.recent
-                and current.position.recent[-1].move is None
-                    and current.child_N[pass_move] == 0):
+            if current.last_move_was_pass and current.child_N[pass_move] == 0:
                 current = current.maybe_add_child(pass_move)
                 continue
 
@@ -151,6 +170,19 @@ class MCTSNode(object):
                 new_position, fmove=fcoord, parent=self)
         return self.children[fcoord]
 
+    def promote_to_root(self):
+        """Detaches this child of the search root so that it can become the
+        new root, keeping its subtree and visit counts. The old root and all
+        of the siblings' subtrees are freed. Returns the new root."""
+        parent = self.parent
+        N, W = self.N, self.W
+        self.position  # a lazy node must hold its own position as the root.
+        parent.children.pop(self.fmove, None)
+        discard_subtree(parent)
+        self.parent = DummyNode()
+        self.N, self.W = N, W
+        return self
+
     def add_virtual_loss(self, up_to):
         """Propagate a virtual loss up to the root node.
 
@@ -161,7 +193,7 @@ class MCTSNode(object):
         self.losses_applied += 1
         # This is a "win" for the current node; hence a loss for its parent node
         # who will be deciding whether to investigate this node again.
-        loss = self.position.to_play
+        loss = self.to_play
         self.W += loss
         if self.parent is None or self is up_to:
             return
@@ -169,7 +201,7 @@ class MCTSNode(object):
 
     def revert_virtual_loss(self, up_to):
         self.losses_applied -= 1
-        revert = -1 * self.position.to_play
+        revert = -1 * self.to_play
         self.W += revert
         if self.parent is None or self is up_to:
             return
@@ -296,3 +328,111 @@ class MCTSNode(object):
             p_rel[key])
             for key in sort_order][:15]))
         return ''.join(output)
+
+
+class LazyMCTSNode(MCTSNode):
+    """A MCTSNode that only holds a go.Position while it needs one.
+
+    Children store just the move that led to them. A child's position is
+    materialized when it is first used (typically when the leaf is sent to
+    the network), by replaying the moves from the nearest ancestor that still
+    holds a position. Once a node has been expanded its position is dropped
+    again, unless it is the search root or its move number is a multiple of
+    `position_interval`. Everything that select_leaf and the backup need
+    (to_play, the move number, trailing passes) is derived from the tree
+    itself, so most expanded interior nodes carry no board, liberty tracker
+    or move history.
+
+    The kept positions bound the replay of a new leaf to `position_interval`
+    moves, at the cost of holding about 1 / position_interval of the
+    positions an MCTSNode tree holds. With a `position_interval` of 0 only
+    the root keeps its position, and leaves replay from there.
+    """
+
+    def __init__(self, position=None, fmove=None, parent=None,
+                 position_interval=0):
+        if parent is None:
+            parent = DummyNode()
+        self.parent = parent
+        self.fmove = fmove
+        self._position = position
+        if position is not None:
+            self.position_interval = position_interval
+            self._to_play = position.to_play
+            self.move_number = position.n
+            self.trailing_passes = 0
+            for player_move in reversed(position.recent[-2:]):
+                if player_move.move is not None:
+                    break
+                self.trailing_passes += 1
+        else:
+            self.position_interval = parent.position_interval
+            self._to_play = -parent.to_play
+            self.move_number = parent.move_number + 1
+            if fmove == go.N * go.N:
+                self.trailing_passes = parent.trailing_passes + 1
+            else:
+                self.trailing_passes = 0
+        self.is_expanded = False
+        self.losses_applied = 0
+        self._illegal_moves = None
+        self.child_N = np.zeros([go.N * go.N + 1], dtype=np.float32)
+        self.child_W = np.zeros([go.N * go.N + 1], dtype=np.float32)
+        self.original_prior = np.zeros([go.N * go.N + 1], dtype=np.float32)
+        self.child_prior = np.zeros([go.N * go.N + 1], dtype=np.float32)
+        self.children = {}
+
+    @property
+    def position(self):
+        if self._position is None:
+            moves = []
+            node = self
+            while node._position is None:
+                moves.append(coords.from_flat(node.fmove))
+                node = node.parent
+            position = node._position.play_move(moves.pop())
+            while moves:
+                position.play_move(moves.pop(), mutate=True)
+            self._position = position
+        return self._position
+
+    @property
+    def illegal_moves(self):
+        if self._illegal_moves is None:
+            self._illegal_moves = 1000 * (1 - self.position.all_legal_moves())
+        return self._illegal_moves
+
+    @property
+    def to_play(self):
+        if self._position is not None:
+            # the root's position may be flipped in place by GTP.
+            return self._position.to_play
+        return self._to_play
+
+    @property
+    def last_move_was_pass(self):
+        return self.trailing_passes > 0
+
+    def maybe_add_child(self, fcoord):
+        """ Adds child node for fcoord if it doesn't already exist, and returns it. """
+        if fcoord not in self.children:
+            self.children[fcoord] = LazyMCTSNode(fmove=fcoord, parent=self)
+        return self.children[fcoord]
+
+    def incorporate_results(self, move_probabilities, value, up_to):
+        if self.is_expanded:
+            self.revert_visits(up_to=up_to)
+            return
+        # children are chosen using the legal moves of this position, so
+        # compute them before the position is released.
+        self.illegal_moves
+        super().incorporate_results(move_probabilities, value, up_to)
+        if self is not up_to and not self._keeps_position():
+            self._position = None
+
+    def _keeps_position(self):
+        return (self.position_interval > 0 and
+                self.move_number % self.position_interval == 0)
+
+    def is_done(self):
+        return self.trailing_passes >= 2 or self.move_number >= MAX_DEPTH
@@ -0,0 +1,348 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Monte Carlo Tree Search with the tree stored as a struct of arrays.
+
+ArrayTree keeps the statistics of every node in preallocated numpy arrays
+indexed by node id, instead of one MCTSNode object (holding four numpy arrays
+and a dict) per node:
+
+  child_N, child_W, child_prior, original_prior, illegal_moves:
+      [capacity, N * N + 1] float32. Row i holds the statistics of node i's
+      children, exactly like the arrays of the same name on MCTSNode.
+  parent, fmove, to_play, is_expanded, losses_applied: [capacity] per node.
+  edge: [capacity] per node, the flat index of the node's own statistics.
+
+As with MCTSNode, a node's own N and W live in its parent's row, at flat
+index edge = parent * (N * N + 1) + fmove. Row 0 is a dummy parent for the
+root. Selection walks node ids iteratively, and virtual losses and backups
+update the whole path to the root with a single fancy-indexing op on the
+flattened arrays.
+
+ArrayNode is a lightweight handle onto a node id that implements the MCTSNode
+API, so MCTSPlayerMixin can drive either kind of tree.
+"""
+
+import math
+import numpy as np
+
+import coords
+import go
+from mcts import MCTSNode, c_PUCT
+
+# Number of nodes to allocate up front; the arrays double when full.
+INITIAL_CAPACITY = 1024
+
+_ROW_ARRAYS = ('child_N', 'child_W', 'child_prior', 'original_prior',
+               'illegal_moves')
+_NODE_ARRAYS = ('parent', 'fmove', 'edge', 'to_play', 'is_expanded',
+                'losses_applied')
+
+
+class ArrayTree(object):
+    """A MCTS search tree stored as a struct of arrays.
+
+    position: the go.Position at the root of the tree.
+    capacity: how many nodes to preallocate.
+    """
+
+    def __init__(self, position, capacity=INITIAL_CAPACITY):
+        self.capacity = max(capacity, 2)
+        self.num_nodes = 0
+        self._allocate(self.capacity)
+        self.positions = []
+        self.children = []  # per node, a map of flattened moves to node ids
+        self._handles = []
+        # node 0 is the dummy parent of the root.
+        self._new_node(None, -1, None)
+        self._new_node(position, 0, None)
+
+    def _allocate(self, capacity):
+        num_moves = go.N * go.N + 1
+        for name in _ROW_ARRAYS:
+            setattr(self, name, np.zeros([capacity, num_moves], dtype=np.float32))
+        self.parent = np.zeros([capacity], dtype=np.int32)
+        self.fmove = np.zeros([capacity], dtype=np.int32)
+        self.edge = np.zeros([capacity], dtype=np.int64)
+        self.to_play = np.zeros([capacity], dtype=np.int8)
+        self.is_expanded = np.zeros([capacity], dtype=np.bool_)
+        self.losses_applied = np.zeros([capacity], dtype=np.int32)
+        self.flat_N = self.child_N.reshape(-1)
+        self.flat_W = self.child_W.reshape(-1)
+
+    def _grow(self):
+        old_arrays = {name: getattr(self, name)
+                      for name in _ROW_ARRAYS + _NODE_ARRAYS}
+        self.capacity *= 2
+        self._allocate(self.capacity)
+        for name, old in old_arrays.items():
+            getattr(self, name)[:len(old)] = old
+
+    def _new_node(self, position, parent, fmove):
+        if self.num_nodes == self.capacity:
+            self._grow()
+        node = self.num_nodes
+        self.num_nodes += 1
+        self.parent[node] = parent
+        self.fmove[node] = -1 if fmove is None else fmove
+        self.edge[node] = max(parent, 0) * (go.N * go.N + 1) + (fmove or 0)
+        if position is not None:
+            self.to_play[node] = position.to_play
+            self.illegal_moves[node] = 1000 * (1 - position.all_legal_moves())
+        self.positions.append(position)
+        self.children.append({})
+        self._handles.append(None)
+        return node
+
+    @property
+    def root(self):
+        return self.node(1)
+
+    @property
+    def nbytes(self):
+        'Bytes used by the node statistics (positions not included).'
+        return sum(getattr(self, name).nbytes
+                   for name in _ROW_ARRAYS + _NODE_ARRAYS)
+
+    def node(self, node):
+        'Returns the ArrayNode handle for a node id.'
+        handle = self._handles[node]
+        if handle is None:
+            handle = self._handles[node] = ArrayNode(self, node)
+        return handle
+
+    def add_child(self, node, fcoord):
+        child = self.children[node].get(fcoord)
+        if child is None:
+            position = self.positions[node].play_move(coords.from_flat(fcoord))
+            child = self._new_node(position, node, fcoord)
+            self.children[node][fcoord] = child
+        return child
+
+    def action_score(self, node):
+        child_N = self.child_N[node]
+        N = self.flat_N[self.edge[node]]
+        return (self.child_W[node] / (1 + child_N) * self.positions[node].to_play +
+                c_PUCT * math.sqrt(1 + N) * self.child_prior[node] / (1 + child_N) -
+                self.illegal_moves[node])
+
+    def path(self, node, up_to):
+        'Returns the node ids from node up to and including up_to.'
+        path = [node]
+        while node != up_to and self.parent[node] > 0:
+            node = int(self.parent[node])
+            path.append(node)
+        return path
+
+    def reroot(self, new_root):
+        """Compacts the tree down to the subtree under new_root, which becomes
+        node 1. Handles to nodes of the old tree are invalidated.
+
+        Returns the handle of the new root."""
+        order = [0, new_root]
+        i = 1
+        while i < len(order):
+            order.extend(self.children[order[i]].values())
+            i += 1
+        remap = np.zeros([self.num_nodes], dtype=np.int32)
+        remap[order] = np.arange(len(order))
+        old_ids = np.array(order)
+        root_N = self.flat_N[self.edge[new_root]]
+        root_W = self.flat_W[self.edge[new_root]]
+
+        old_arrays = {name: getattr(self, name)[old_ids]
+                      for name in _ROW_ARRAYS + _NODE_ARRAYS}
+        self.capacity = max(INITIAL_CAPACITY, 2 * len(order))
+        self._allocate(self.capacity)
+        for name, old in old_arrays.items():
+            getattr(self, name)[:len(old)] = old
+        self.parent[2:len(order)] = remap[self.parent[2:len(order)]]
+        self.parent[1] = 0
+        num_moves = go.N * go.N + 1
+        self.edge[:len(order)] = (self.parent[:len(order)] * num_moves +
+                                  self.edge[:len(order)] % num_moves)
+        self.edge[0] = 0
+        self.child_N[0] = 0
+        self.child_W[0] = 0
+        self.flat_N[self.edge[1]] = root_N
+        self.flat_W[self.edge[1]] = root_W
+
+        self.num_nodes = len(order)
+        self.positions = [self.positions[old] for old in order]
+        self.children = [{fcoord: int(remap[child])
+                          for fcoord, child in self.children[old].items()}
+                         for old in order]
+        self._handles = [None] * len(order)
+        return self.root
+
+
+class ArrayNode(MCTSNode):
+    """A handle onto a node of an ArrayTree, with the MCTSNode interface.
+
+    Handles are cached by the tree, so a node always has the same handle
+    until the tree is rerooted.
+    """
+
+    def __init__(self, tree, node):
+        self.tree = tree
+        self.id = node
+
+    @property
+    def position(self):
+        return self.tree.positions[self.id]
+
+    @property
+    def parent(self):
+        parent = self.tree.parent[self.id]
+        return self.tree.node(parent) if parent > 0 else None
+
+    @property
+    def fmove(self):
+        fmove = self.tree.fmove[self.id]
+        return None if fmove < 0 else int(fmove)
+
+    @property
+    def children(self):
+        return {fcoord: self.tree.node(child)
+                for fcoord, child in self.tree.children[self.id].items()}
+
+    @property
+    def is_expanded(self):
+        return bool(self.tree.is_expanded[self.id])
+
+    @is_expanded.setter
+    def is_expanded(self, value):
+        self.tree.is_expanded[self.id] = value
+
+    @property
+    def losses_applied(self):
+        return int(self.tree.losses_applied[self.id])
+
+    @property
+    def illegal_moves(self):
+        return self.tree.illegal_moves[self.id]
+
+    @property
+    def child_N(self):
+        return self.tree.child_N[self.id]
+
+    @child_N.setter
+    def child_N(self, value):
+        self.tree.child_N[self.id] = value
+
+    @property
+    def child_W(self):
+        return self.tree.child_W[self.id]
+
+    @child_W.setter
+    def child_W(self, value):
+        self.tree.child_W[self.id] = value
+
+    @property
+    def child_prior(self):
+        return self.tree.child_prior[self.id]
+
+    @child_prior.setter
+    def child_prior(self, value):
+        self.tree.child_prior[self.id] = value
+
+    @property
+    def original_prior(self):
+        return self.tree.original_prior[self.id]
+
+    @original_prior.setter
+    def original_prior(self, value):
+        self.tree.original_prior[self.id] = value
+
+    @property
+    def child_action_score(self):
+        return self.tree.action_score(self.id)
+
+    @property
+    def N(self):
+        return self.tree.flat_N[self.tree.edge[self.id]]
+
+    @N.setter
+    def N(self, value):
+        self.tree.flat_N[self.tree.edge[self.id]] = value
+
+    @property
+    def W(self):
+        return self.tree.flat_W[self.tree.edge[self.id]]
+
+    @W.setter
+    def W(self, value):
+        self.tree.flat_W[self.tree.edge[self.id]] = value
+
+    def select_leaf(self):
+        tree = self.tree
+        current = self.id
+        pass_move = go.N * go.N
+        while True:
+            tree.flat_N[tree.edge[current]] += 1
+            # if a node has never been evaluated, we have no basis to select a child.
+            if not tree.is_expanded[current]:
+                break
+            # HACK: if last move was a pass, always investigate double-pass first
+            # to avoid situations where we auto-lose by passing too early.
+            recent = tree.positions[current].recent
+            if (recent and recent[-1].move is None
+                    and tree.child_N[current, pass_move] == 0):
+                current = tree.add_child(current, pass_move)
+                continue
+
+            best_move = int(np.argmax(tree.action_score(current)))
+            current = tree.add_child(current, best_move)
+        return tree.node(current)
+
+    def maybe_add_child(self, fcoord):
+        """ Adds child node for fcoord if it doesn't already exist, and returns it. """
+        return self.tree.node(self.tree.add_child(self.id, int(fcoord)))
+
+    def promote_to_root(self):
+        return self.tree.reroot(self.id)
+
+    def add_virtual_loss(self, up_to):
+        """Propagate a virtual loss up to the root node.
+
+        Args:
+            up_to: The node to propagate until. (Keep track of this! You'll
+                need it to reverse the virtual loss later.)
+        """
+        tree = self.tree
+        path = tree.path(self.id, up_to.id)
+        # This is a "win" for each node; hence a loss for its parent node
+        # who will be deciding whether to investigate this node again.
+        tree.flat_W[tree.edge[path]] += tree.to_play[path]
+        tree.losses_applied[path] += 1
+
+    def revert_virtual_loss(self, up_to):
+        tree = self.tree
+        path = tree.path(self.id, up_to.id)
+        tree.flat_W[tree.edge[path]] -= tree.to_play[path]
+        tree.losses_applied[path] -= 1
+
+    def revert_visits(self, up_to):
+        tree = self.tree
+        tree.flat_N[tree.edge[tree.path(self.id, up_to.id)]] -= 1
+
+    def backup_value(self, value, up_to):
+        """Propagates a value estimation up to the root node.
+
+        Args:
+            value: the value to be propagated (1 = black wins, -1 = white wins)
+            up_to: the node to propagate until.
+        """
+        tree = self.tree
+        tree.flat_W[tree.edge[tree.path(self.id, up_to.id)]] += value
@@ -0,0 +1,89 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares moves/sec of go.Position (LibertyTracker) and fast_go.Position.
+
+Random games are generated once with go.Position, then replayed with each
+engine the way MCTS uses them: a non-mutating play_move followed by
+all_legal_moves for every new node.
+
+The board size comes from goparams, so run once per size:
+python oneoffs/go_engine_benchmark.py
+GOPARAMS=path/to/19x19.json python oneoffs/go_engine_benchmark.py
+"""
+import sys; sys.path.insert(0, '.')
+import argparse
+import random
+import time
+
+import numpy as np
+
+import coords
+import fast_go
+import go
+
+ENGINES = [('liberty_tracker', go.Position), ('fast', fast_go.Position)]
+
+
+def random_games(num_games, seed):
+    rng = random.Random(seed)
+    games = []
+    for _ in range(num_games):
+        pos = go.Position()
+        moves = []
+        while len(moves) < go.N * go.N and not pos.is_game_over():
+            legal = np.flatnonzero(pos.all_legal_moves()[:-1])
+            move = coords.from_flat(int(rng.choice(legal))) if len(legal) else None
+            pos = pos.play_move(move)
+            moves.append(move)
+        games.append(moves)
+    return games
+
+
+def time_engine(position_cls, games, with_legal_moves):
+    num_moves = 0
+    start = time.time()
+    for moves in games:
+        pos = position_cls()
+        for move in moves:
+            pos = pos.play_move(move)
+            if with_legal_moves:
+                pos.all_legal_moves()
+        pos.score()
+        num_moves += len(moves)
+    return num_moves / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    games = random_games(args.games, args.seed)
+    print("%dx%d, %d games, %d moves" % (
+        go.N, go.N, len(games), sum(map(len, games))))
+    for with_legal_moves in (False, True):
+        label = 'play_move + all_legal_moves' if with_legal_moves else 'play_move'
+        results = {name: time_engine(cls, games, with_legal_moves)
+                   for name, cls in ENGINES}
+        for name, moves_per_sec in results.items():
+            print("  %-28s %-16s %10.0f moves/sec (%.2fx)" % (
+                label, name, moves_per_sec,
+                moves_per_sec / results['liberty_tracker']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares Position.score and Position.all_legal_moves against the flood fill
+and per-spot suicide checks they replaced, on random late-game positions.
+
+Results of both implementations are checked to be identical.
+
+The board size comes from goparams, so run once per size:
+python oneoffs/go_scoring_benchmark.py
+GOPARAMS=path/to/19x19.json python oneoffs/go_scoring_benchmark.py
+"""
+import sys; sys.path.insert(0, '.')
+import argparse
+import time
+
+import numpy as np
+
+import fast_go
+import go
+from go import BLACK, WHITE, EMPTY, UNKNOWN, N
+from oneoffs.go_engine_benchmark import random_games
+
+
+def reference_score(position):
+    working_board = np.copy(position.board)
+    while EMPTY in working_board:
+        unassigned_spaces = np.where(working_board == EMPTY)
+        c = unassigned_spaces[0][0], unassigned_spaces[1][0]
+        territory, borders = go.find_reached(working_board, c)
+        border_colors = set(working_board[b] for b in borders)
+        X_border = BLACK in border_colors
+        O_border = WHITE in border_colors
+        if X_border and not O_border:
+            territory_color = BLACK
+        elif O_border and not X_border:
+            territory_color = WHITE
+        else:
+            territory_color = UNKNOWN  # dame, or seki
+        go.place_stones(working_board, territory_color, territory)
+
+    return (np.count_nonzero(working_board == BLACK) -
+            np.count_nonzero(working_board == WHITE) - position.komi)
+
+
+def reference_all_legal_moves(position):
+    legal_moves = np.ones([N, N], dtype=np.int8)
+    legal_moves[position.board != EMPTY] = 0
+    adjacent = np.ones([N+2, N+2], dtype=np.int8)
+    adjacent[1:-1, 1:-1] = np.abs(position.board)
+    num_adjacent_stones = (adjacent[:-2, 1:-1] + adjacent[1:-1, :-2] +
+                           adjacent[2:, 1:-1] + adjacent[1:-1, 2:])
+    surrounded_spots = np.multiply(
+        (position.board == EMPTY),
+        (num_adjacent_stones == 4))
+    for coord in np.transpose(np.nonzero(surrounded_spots)):
+        if position.is_move_suicidal(tuple(coord)):
+            legal_moves[tuple(coord)] = 0
+    if position.ko is not None:
+        legal_moves[position.ko] = 0
+    return np.concatenate([legal_moves.ravel(), [1]])
+
+
+def late_game_positions(games, fraction):
+    positions = []
+    for moves in games:
+        pos = go.Position()
+        for move in moves[:int(len(moves) * fraction)]:
+            pos = pos.play_move(move)
+        positions.append(pos)
+    return positions
+
+
+def time_per_position(fn, positions, repeats):
+    start = time.time()
+    for _ in range(repeats):
+        for pos in positions:
+            fn(pos)
+    return (time.time() - start) / repeats / len(positions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--fraction', type=float, default=0.8,
+                        help='How far into each game to take the position.')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    positions = late_game_positions(
+        random_games(args.games, args.seed), args.fraction)
+    fast_positions = [fast_go.Position(board=np.copy(pos.board), ko=pos.ko,
+                                       to_play=pos.to_play)
+                      for pos in positions]
+    for pos in positions:
+        assert pos.score() == reference_score(pos)
+        assert np.array_equal(pos.all_legal_moves(),
+                              reference_all_legal_moves(pos))
+
+    print("%dx%d, %d positions" % (N, N, len(positions)))
+    cases = [
+        ('score', 'flood fill', reference_score, positions),
+        ('score', 'labeling', go.Position.score, positions),
+        ('score', 'fast_go', fast_go.Position.score, fast_positions),
+        ('all_legal_moves', 'per spot', reference_all_legal_moves, positions),
+        ('all_legal_moves', 'vectorized', go.Position.all_legal_moves, positions),
+        ('all_legal_moves', 'fast_go', fast_go.Position.all_legal_moves,
+         fast_positions),
+    ]
+    for name, impl, fn, cases_positions in cases:
+        seconds = time_per_position(fn, cases_positions, args.repeats)
+        print("  %-16s %-12s %8.1f us/position" % (name, impl, seconds * 1e6))
+
+
+if __name__ == '__main__':
+    main()
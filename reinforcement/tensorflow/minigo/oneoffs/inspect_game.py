@@ -41,7 +41,7 @@ def analyze_symmetries(sgf_file, load_file):
         if i < 200:
             continue
         feats = features.extract_features(pwc.position)
-        variants = [symmetries.apply_symmetry_feat(s, feats) for s in symmetries.SYMMETRIES]
+        variants = symmetries.all_symmetries_feat([feats])
         values = net.sess.run(
             net.inference_output['value_output'],
             feed_dict={net.inference_input['pos_tensor']: variants})
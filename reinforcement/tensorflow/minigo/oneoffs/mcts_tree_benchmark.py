@@ -0,0 +1,125 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares readouts/sec and bytes/node of the MCTS tree implementations.
+
+The network is replaced by random priors so that only tree work is timed.
+Bytes are measured with tracemalloc and include the go.Positions held by the
+tree.
+
+With --network_ms, every network call also sleeps that long (like a session
+run, which releases the GIL), and readouts/sec with pipelined search is
+reported next to the serial tree_search loop.
+
+python oneoffs/mcts_tree_benchmark.py --readouts=1600
+python oneoffs/mcts_tree_benchmark.py --network_ms=5 --num_parallel=16
+"""
+import sys; sys.path.insert(0, '.')
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+import go
+from strategies import MCTSPlayerMixin
+
+TREES = [
+    ('MCTSNode', {}),
+    ('LazyMCTSNode/0', {'lazy_positions': True, 'lazy_position_interval': 0}),
+    ('LazyMCTSNode/2', {'lazy_positions': True, 'lazy_position_interval': 2}),
+    ('LazyMCTSNode/4', {'lazy_positions': True, 'lazy_position_interval': 4}),
+    ('LazyMCTSNode/8', {'lazy_positions': True, 'lazy_position_interval': 8}),
+    ('ArrayTree', {'array_tree': True}),
+]
+
+
+class RandomNet():
+    def __init__(self, seed, network_ms=0):
+        self.rng = np.random.RandomState(seed)
+        self.network_ms = network_ms
+
+    def run_many(self, positions):
+        if self.network_ms:
+            time.sleep(self.network_ms / 1000)
+        probs = self.rng.random_sample([len(positions), go.N * go.N + 1])
+        probs /= probs.sum(axis=1, keepdims=True)
+        values = self.rng.uniform(-1, 1, size=len(positions))
+        return probs.astype(np.float32), values
+
+
+def count_nodes(root):
+    if hasattr(root, 'tree'):
+        return root.tree.num_nodes - 1
+    count, queue = 0, [root]
+    while queue:
+        node = queue.pop()
+        count += 1
+        queue.extend(node.children.values())
+    return count
+
+
+def run(kwargs, readouts, num_parallel, seed):
+    player = MCTSPlayerMixin(RandomNet(seed), num_parallel=num_parallel,
+                             **kwargs)
+    tracemalloc.start()
+    player.initialize_game()
+    start = time.time()
+    while player.root.N < readouts:
+        player.tree_search()
+    elapsed = time.time() - start
+    nbytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    nodes = count_nodes(player.root)
+    return player.root.N / elapsed, nbytes / nodes, nodes
+
+
+def time_search(kwargs, readouts, num_parallel, seed, network_ms, pipelined):
+    player = MCTSPlayerMixin(RandomNet(seed, network_ms),
+                             num_parallel=num_parallel, pipelined=pipelined,
+                             **kwargs)
+    player.initialize_game()
+    start = time.time()
+    player.search(readouts)
+    return player.root.N / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--readouts', type=int, default=800)
+    parser.add_argument('--num_parallel', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--network_ms', type=float, default=0,
+                        help='Simulated latency of each network call.')
+    args = parser.parse_args()
+
+    print("%dx%d, %d readouts" % (go.N, go.N, args.readouts))
+    for name, kwargs in TREES:
+        # time without tracemalloc, which slows allocation down a lot.
+        readouts_per_sec = time_search(
+            kwargs, args.readouts, args.num_parallel, args.seed,
+            args.network_ms, pipelined=False)
+        _, bytes_per_node, nodes = run(
+            kwargs, args.readouts, args.num_parallel, args.seed)
+        print("  %-14s %8.0f readouts/sec %8.0f bytes/node (%d nodes)" % (
+            name, readouts_per_sec, bytes_per_node, nodes))
+        if args.network_ms:
+            print("  %-14s %8.0f readouts/sec (pipelined)" % (
+                '', time_search(kwargs, args.readouts, args.num_parallel,
+                                args.seed, args.network_ms, pipelined=True)))
+
+
+if __name__ == '__main__':
+    main()
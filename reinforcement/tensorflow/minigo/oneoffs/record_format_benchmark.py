@@ -0,0 +1,101 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares ZLIB tf.Example records with packed records (see preprocessing.py):
+bytes/position on disk, and examples/sec through get_input_tensors.
+
+Positions come from random games; policies are sparse like MCTS visit
+counts.
+
+python oneoffs/record_format_benchmark.py --positions=20000
+"""
+import sys; sys.path.insert(0, '.')
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import features
+import go
+import preprocessing
+from oneoffs.go_engine_benchmark import random_games
+
+
+def make_examples(num_positions, seed):
+    rng = np.random.RandomState(seed)
+    positions = []
+    while len(positions) < num_positions:
+        for moves in random_games(10, seed + len(positions)):
+            pos = go.Position()
+            for move in moves:
+                positions.append(pos)
+                pos = pos.play_move(move)
+    positions = positions[:num_positions]
+    x = features.bulk_extract_features(positions)
+    pis = rng.dirichlet([0.03] * (go.N * go.N + 1), size=num_positions)
+    values = rng.choice([-1.0, 1.0], size=num_positions)
+    return x, pis.astype(np.float32), values
+
+
+def examples_per_sec(filename, packed, batch_size, num_batches):
+    with tf.Graph().as_default(), tf.Session() as sess:
+        x, labels = preprocessing.get_input_tensors(
+            batch_size, [filename], shuffle_records=False,
+            shuffle_examples=False, filter_amount=1.0, packed=packed)
+        sess.run([x, labels])  # warm up
+        start = time.time()
+        for _ in range(num_batches):
+            sess.run([x, labels])
+        return batch_size * num_batches / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--positions', type=int, default=10000)
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--batches', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    x, pis, values = make_examples(args.positions, args.seed)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        zlib_file = os.path.join(tmpdir, 'examples.tfrecord.zz')
+        packed_file = os.path.join(tmpdir, 'examples' + preprocessing.PACKED_SUFFIX)
+        preprocessing.write_tf_examples(zlib_file, map(
+            preprocessing.make_tf_example, x, pis, values))
+        preprocessing.write_packed_examples(
+            packed_file, preprocessing.pack_examples(x, pis, values))
+
+        start = time.time()
+        records = preprocessing.read_packed_examples(packed_file)
+        preprocessing.unpack_features(np.asarray(records['x']))
+        mmap_per_sec = len(records) / (time.time() - start)
+
+        print("%dx%d, %d positions" % (go.N, go.N, args.positions))
+        for name, filename, packed in [('zlib tf.Example', zlib_file, False),
+                                       ('packed', packed_file, True)]:
+            print("  %-16s %8.1f bytes/position %10.0f examples/sec" % (
+                name, os.path.getsize(filename) / args.positions,
+                examples_per_sec(filename, packed, args.batch_size,
+                                 args.batches)))
+        print("  %-16s %30.0f examples/sec (numpy memmap + unpack)" % (
+            'packed', mmap_per_sec))
+
+
+if __name__ == '__main__':
+    main()
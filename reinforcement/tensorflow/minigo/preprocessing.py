@@ -14,9 +14,11 @@
 
 '''Utilities to create, read, write tf.Examples.'''
 import functools
+import itertools
 import numpy as np
 import tensorflow as tf
 import random
+import struct
 
 import coords
 import features as features_lib
@@ -35,6 +37,24 @@ TF_RECORD_CONFIG = tf.python_io.TFRecordOptions(
 # SHUFFLE_BUFFER_SIZE = int(2*1e6)
 SHUFFLE_BUFFER_SIZE = goparams.SHUFFLE_BUFFER_SIZE
 
+# Packed records: an alternative to ZLIB tf.Examples. A file is a fixed
+# header followed by fixed-size records, each holding the feature planes as
+# bits (np.packbits), then pi and the outcome as little-endian float32. There
+# is no codec to run and no proto to parse, and files can be memory-mapped
+# (read_packed_examples) or read with tf.data.FixedLengthRecordDataset.
+PACKED_SUFFIX = '.packed'
+PACKED_MAGIC = b'MGPK'
+PACKED_VERSION = 1
+PACKED_HEADER = PACKED_MAGIC + struct.pack(
+    '<III', PACKED_VERSION, go.N, features_lib.NEW_FEATURES_PLANES)
+PACKED_FEATURE_BYTES = (
+    go.N * go.N * features_lib.NEW_FEATURES_PLANES + 7) // 8
+PACKED_RECORD_DTYPE = np.dtype([
+    ('x', np.uint8, PACKED_FEATURE_BYTES),
+    ('pi', '<f4', go.N * go.N + 1),
+    ('outcome', '<f4'),
+])
+
 # Constructing tf.Examples
 
 
@@ -80,6 +100,143 @@ def write_tf_examples(filename, tf_examples, serialize=True):
             else:
                 writer.write(ex)
 
+
+def write_tf_example_chunks(filename_pattern, tf_examples, chunk_size):
+    '''Writes serialized tf.Examples into a series of tf.records, streaming
+    them so that at most one example is held at a time.
+
+    Args:
+        filename_pattern: filename with a '{}' for the index of the chunk
+        tf_examples: An iterable of serialized tf.Examples
+        chunk_size: how many examples to write to each file
+    Returns:
+        The number of examples written.
+    '''
+    writer = None
+    num_examples = 0
+    try:
+        for num_examples, ex in enumerate(tf_examples, 1):
+            if (num_examples - 1) % chunk_size == 0:
+                if writer is not None:
+                    writer.close()
+                writer = tf.python_io.TFRecordWriter(
+                    filename_pattern.format((num_examples - 1) // chunk_size),
+                    options=TF_RECORD_CONFIG)
+            writer.write(ex)
+    finally:
+        if writer is not None:
+            writer.close()
+    return num_examples
+
+
+def write_packed_example_chunks(filename_pattern, tf_examples, chunk_size):
+    '''Like write_tf_example_chunks, but writes each chunk as a packed
+    record file, holding at most one chunk of examples at a time.
+
+    Returns:
+        The number of examples written.
+    '''
+    tf_examples = iter(tf_examples)
+    num_examples = 0
+    chunk = list(itertools.islice(tf_examples, chunk_size))
+    while chunk:
+        write_packed_examples(
+            filename_pattern.format(num_examples // chunk_size),
+            pack_examples(*parse_serialized_examples(chunk)))
+        num_examples += len(chunk)
+        chunk = list(itertools.islice(tf_examples, chunk_size))
+    return num_examples
+
+
+def pack_examples(features, pis, values):
+    '''
+    Args:
+        features: [B, N, N, FEATURE_DIM] nparray of 0/1 uint8
+        pis: [B, N * N + 1] nparray of float32
+        values: [B] floats
+    Returns:
+        A [B] nparray of PACKED_RECORD_DTYPE records.
+    '''
+    features = np.asarray(features, dtype=np.uint8)
+    assert features.max(initial=0) <= 1, "Only binary planes can be packed"
+    records = np.zeros([len(features)], dtype=PACKED_RECORD_DTYPE)
+    records['x'] = np.packbits(features.reshape([len(features), -1]), axis=1)
+    records['pi'] = pis
+    records['outcome'] = values
+    return records
+
+
+def unpack_features(packed_x):
+    '''Inverse of the packing of pack_examples: [B, PACKED_FEATURE_BYTES]
+    uint8 to [B, N, N, FEATURE_DIM] uint8.'''
+    bits = np.unpackbits(packed_x, axis=1)[
+        :, :go.N * go.N * features_lib.NEW_FEATURES_PLANES]
+    return bits.reshape([-1, go.N, go.N, features_lib.NEW_FEATURES_PLANES])
+
+
+def write_packed_examples(filename, records):
+    '''
+    Args:
+        filename: Where to write the packed records
+        records: An nparray of PACKED_RECORD_DTYPE, see pack_examples
+    '''
+    with tf.gfile.GFile(filename, 'wb') as f:
+        f.write(PACKED_HEADER)
+        f.write(np.ascontiguousarray(records, PACKED_RECORD_DTYPE).tobytes())
+
+
+def read_packed_examples(filename):
+    '''Memory-maps a file written by write_packed_examples.
+
+    Returns:
+        A read-only [num_examples] nparray of PACKED_RECORD_DTYPE records.
+    '''
+    with open(filename, 'rb') as f:
+        header = f.read(len(PACKED_HEADER))
+    if header != PACKED_HEADER:
+        raise ValueError("%s is not a packed record file for %dx%d boards "
+                         "with %d planes" % (filename, go.N, go.N,
+                                             features_lib.NEW_FEATURES_PLANES))
+    return np.memmap(filename, dtype=PACKED_RECORD_DTYPE, mode='r',
+                     offset=len(PACKED_HEADER))
+
+
+def parse_tf_examples(tf_records):
+    '''Reads the tf.Examples of a list of ZLIB tf.Records into numpy.
+
+    Returns:
+        A tuple of [B, N, N, FEATURE_DIM] uint8 features, [B, N * N + 1]
+        float32 pis and [B] float32 values.
+    '''
+    return parse_serialized_examples(
+        ex for tf_record in tf_records
+        for ex in tf.python_io.tf_record_iterator(
+            tf_record, options=TF_RECORD_CONFIG))
+
+
+def parse_serialized_examples(serialized_examples):
+    '''Like parse_tf_examples, for an iterable of serialized tf.Examples.'''
+    features, pis, values = [], [], []
+    for ex in serialized_examples:
+        example = tf.train.Example.FromString(ex).features.feature
+        features.append(np.frombuffer(
+            example['x'].bytes_list.value[0], dtype=np.uint8))
+        pis.append(np.frombuffer(
+            example['pi'].bytes_list.value[0], dtype=np.float32))
+        values.append(example['outcome'].float_list.value[0])
+    features = np.reshape(features, [len(values), go.N, go.N,
+                                     features_lib.NEW_FEATURES_PLANES])
+    pis = np.reshape(pis, [len(values), go.N * go.N + 1])
+    return features, pis, np.array(values, dtype=np.float32)
+
+
+def convert_to_packed(tf_records, filename):
+    '''Rewrites the tf.Examples of a list of ZLIB tf.Records as one packed
+    record file. Returns the number of examples.'''
+    features, pis, values = parse_tf_examples(tf_records)
+    write_packed_examples(filename, pack_examples(features, pis, values))
+    return len(values)
+
 # Read tf.Example from files
 
 
@@ -107,10 +264,40 @@ def batch_parse_tf_example(batch_size, example_batch):
     return (x, {'pi_tensor': pi, 'value_tensor': outcome})
 
 
+def batch_parse_packed_examples(batch_size, record_batch):
+    '''
+    Args:
+        record_batch: a batch of packed records (see PACKED_RECORD_DTYPE)
+    Returns:
+        A tuple (feature_tensor, dict of output tensors), like
+        batch_parse_tf_example
+    '''
+    raw = tf.decode_raw(record_batch, tf.uint8)
+    raw.set_shape([batch_size, PACKED_RECORD_DTYPE.itemsize])
+    packed_x = raw[:, :PACKED_FEATURE_BYTES]
+    # np.packbits puts the first bit in the most significant position.
+    shifts = tf.constant(np.arange(7, -1, -1), dtype=tf.uint8)
+    bits = tf.bitwise.bitwise_and(
+        tf.bitwise.right_shift(packed_x[:, :, tf.newaxis], shifts), 1)
+    x = tf.reshape(bits, [batch_size, PACKED_FEATURE_BYTES * 8])
+    x = x[:, :go.N * go.N * features_lib.NEW_FEATURES_PLANES]
+    x = tf.cast(x, tf.float32)
+    x = tf.reshape(x, [batch_size, go.N, go.N,
+                       features_lib.NEW_FEATURES_PLANES])
+    pi_offset = PACKED_RECORD_DTYPE.fields['pi'][1]
+    outcome_offset = PACKED_RECORD_DTYPE.fields['outcome'][1]
+    pi = tf.reshape(raw[:, pi_offset:outcome_offset],
+                    [batch_size, go.N * go.N + 1, 4])
+    pi = tf.bitcast(pi, tf.float32)
+    outcome = tf.bitcast(raw[:, outcome_offset:], tf.float32)
+    outcome = tf.reshape(outcome, [batch_size])
+    return (x, {'pi_tensor': pi, 'value_tensor': outcome})
+
+
 def read_tf_records(batch_size, tf_records, num_repeats=None,
                     shuffle_records=True, shuffle_examples=True,
                     shuffle_buffer_size=None,
-                    filter_amount=1.0):
+                    filter_amount=1.0, packed=False):
     '''
     Args:
         batch_size: batch size to return
@@ -120,6 +307,7 @@ def read_tf_records(batch_size, tf_records, num_repeats=None,
         shuffle_examples: whether to shuffle the tf.Examples
         shuffle_buffer_size: how big of a buffer to fill before shuffling.
         filter_amount: what fraction of records to keep
+        packed: whether the files hold packed records instead of tf.Examples
     Returns:
         a tf dataset of batched tensors
     '''
@@ -136,9 +324,13 @@ def read_tf_records(batch_size, tf_records, num_repeats=None,
     #   moving to the next file
     # The idea is to shuffle both the order of the files being read,
     # and the examples being read from the files.
-    dataset = record_list.interleave(lambda x:
-                                     tf.data.TFRecordDataset(
-                                         x, compression_type='ZLIB'),
+    if packed:
+        def read_file(x): return tf.data.FixedLengthRecordDataset(
+            x, PACKED_RECORD_DTYPE.itemsize, header_bytes=len(PACKED_HEADER))
+    else:
+        def read_file(x): return tf.data.TFRecordDataset(
+            x, compression_type='ZLIB')
+    dataset = record_list.interleave(read_file,
                                      cycle_length=64, block_length=16)
     dataset = dataset.filter(lambda x: tf.less(
         tf.random_uniform([1]), filter_amount)[0])
@@ -156,7 +348,7 @@ def read_tf_records(batch_size, tf_records, num_repeats=None,
 def get_input_tensors(batch_size, tf_records, num_repeats=None,
                       shuffle_records=True, shuffle_examples=True,
                       shuffle_buffer_size=None,
-                      filter_amount=0.05):
+                      filter_amount=0.05, packed=False):
     '''Read tf.Records and prepare them for ingestion by dual_net.  See
     `read_tf_records` for parameter documentation.
 
@@ -168,10 +360,10 @@ def get_input_tensors(batch_size, tf_records, num_repeats=None,
                               shuffle_records=shuffle_records,
                               shuffle_examples=shuffle_examples,
                               shuffle_buffer_size=shuffle_buffer_size,
-                              filter_amount=filter_amount)
+                              filter_amount=filter_amount, packed=packed)
     dataset = dataset.filter(lambda t: tf.equal(tf.shape(t)[0], batch_size))
-    dataset = dataset.map(functools.partial(
-        batch_parse_tf_example, batch_size))
+    parse = batch_parse_packed_examples if packed else batch_parse_tf_example
+    dataset = dataset.map(functools.partial(parse, batch_size))
     return dataset.make_one_shot_iterator().get_next()
 
 # End-to-end utility functions
@@ -188,6 +380,15 @@ def make_dataset_from_selfplay(data_extracts):
     return tf_examples
 
 
+def pack_selfplay_examples(data_extracts):
+    '''Like make_dataset_from_selfplay, but returns packed records (see
+    pack_examples).'''
+    positions, pis, results = zip(*data_extracts)
+    return pack_examples(
+        [features_lib.extract_features(pos) for pos in positions], pis,
+        results)
+
+
 def make_dataset_from_sgf(sgf_filename, tf_record):
     pwcs = sgf_wrapper.replay_sgf_file(sgf_filename)
     tf_examples = map(_make_tf_example_from_pwc, pwcs)
@@ -219,3 +420,35 @@ def shuffle_tf_examples(gather_size, records_to_shuffle):
             yield list(result)
         except tf.errors.OutOfRangeError:
             break
+
+
+def stream_shuffle_tf_examples(records_to_shuffle, buffer_size, seed=None):
+    '''Read through tf.Records and yield shuffled, but unparsed tf.Examples,
+    holding at most buffer_size of them in memory.
+
+    Unlike shuffle_tf_examples, this needs no TF session, so it can run in
+    many worker processes at once. The order of the files is shuffled, and
+    examples are shuffled through a buffer like tf.data.Dataset.shuffle.
+
+    Args:
+        records_to_shuffle: A list of filenames
+        buffer_size: how many examples to shuffle between
+        seed: seed for the random order
+    Returns:
+        An iterator yielding bytes, which are serialized tf.Examples.
+    '''
+    rng = random.Random(seed)
+    records_to_shuffle = list(records_to_shuffle)
+    rng.shuffle(records_to_shuffle)
+    buffer = []
+    for record in records_to_shuffle:
+        for ex in tf.python_io.tf_record_iterator(
+                record, options=TF_RECORD_CONFIG):
+            if len(buffer) < buffer_size:
+                buffer.append(ex)
+            else:
+                i = rng.randrange(buffer_size)
+                yield buffer[i]
+                buffer[i] = ex
+    rng.shuffle(buffer)
+    yield from buffer
@@ -0,0 +1,189 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A replay buffer of the most recent selfplay positions, for training.
+
+Training from gathered chunks re-reads, decompresses and reshuffles the
+whole window of chunks every generation. Instead, a ReplayBuffer keeps the
+positions of the last few generations in memory, in a ring of packed
+records (see preprocessing.PACKED_RECORD_DTYPE, ~8x smaller than uint8
+planes), and only reads the selfplay files that are new since the last
+generation. Training batches are sampled uniformly from the buffer.
+
+The buffer is created once per run of the training loop, and only saved to
+(and restored from) an uncompressed .npz when the loop shuts down (and
+starts), so that a restart doesn't need to re-read the selfplay files.
+"""
+
+import io
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import gfile
+
+import features as features_lib
+import go
+import preprocessing
+import shipname
+
+
+def _file_generation(filename):
+    'The generation of a selfplay file, from its model directory.'
+    model_dir = os.path.basename(os.path.dirname(filename))
+    generation = shipname.detect_model_num(model_dir)
+    return -1 if generation is None else generation
+
+
+class ReplayBuffer(object):
+    """A ring buffer of training examples, tagged with their generation.
+
+    capacity: how many examples to hold; the oldest are overwritten first.
+    generations: how many of the most recent generations to sample from.
+    """
+
+    def __init__(self, capacity, generations):
+        self.capacity = capacity
+        self.generations = generations
+        self.records = np.zeros([capacity],
+                                dtype=preprocessing.PACKED_RECORD_DTYPE)
+        self.generation = np.full([capacity], -1, dtype=np.int32)
+        self.next = 0  # where the next example is written
+        self.ingested = set()  # selfplay files already in the buffer
+        self._valid = None
+
+    def __len__(self):
+        return len(self.valid_indices())
+
+    @property
+    def latest_generation(self):
+        return int(self.generation.max())
+
+    def valid_indices(self):
+        'Indices of the examples of the last `generations` generations.'
+        if self._valid is None:
+            oldest = self.latest_generation - self.generations + 1
+            self._valid = np.flatnonzero(
+                (self.generation >= oldest) & (self.generation >= 0))
+        return self._valid
+
+    def add_examples(self, features, pis, values, generation, rng=np.random):
+        '''Adds a batch of examples from one generation, overwriting the
+        oldest examples when full. A batch larger than the buffer is
+        subsampled uniformly.'''
+        records = preprocessing.pack_examples(features, pis, values)
+        if len(records) > self.capacity:
+            records = records[np.sort(rng.choice(
+                len(records), self.capacity, replace=False))]
+        indices = (self.next + np.arange(len(records))) % self.capacity
+        self.records[indices] = records
+        self.generation[indices] = generation
+        self.next = (self.next + len(records)) % self.capacity
+        self._valid = None
+
+    def ingest(self, selfplay_dir, files_per_batch=64, rng=np.random):
+        '''Adds the examples of the selfplay files (in model subdirectories
+        of selfplay_dir) that are not in the buffer yet.
+
+        Only the model directories of the last `generations` generations are
+        read, `files_per_batch` files at a time. Each generation's files are
+        read in random order, so that when they hold more examples than fit,
+        the ones kept are a uniform sample of its games.
+
+        Returns the number of examples added.'''
+        model_dirs = []
+        for model_dir in gfile.ListDirectory(selfplay_dir):
+            generation = shipname.detect_model_num(model_dir.strip('/'))
+            if generation is not None:
+                model_dirs.append((generation, model_dir))
+        latest = max([self.latest_generation] +
+                     [generation for generation, _ in model_dirs])
+        oldest = latest - self.generations + 1
+
+        num_examples = 0
+        for generation, model_dir in sorted(model_dirs):
+            if generation < oldest:
+                continue
+            record_files = sorted(set(gfile.Glob(os.path.join(
+                selfplay_dir, model_dir, '*.tfrecord.zz'))) - self.ingested)
+            rng.shuffle(record_files)
+            for i in range(0, len(record_files), files_per_batch):
+                batch = record_files[i:i + files_per_batch]
+                features, pis, values = preprocessing.parse_tf_examples(batch)
+                if len(values):
+                    self.add_examples(features, pis, values, generation, rng)
+                self.ingested.update(batch)
+                num_examples += len(values)
+
+        # files of generations outside the window are never read again.
+        self.ingested = {
+            filename for filename in self.ingested
+            if _file_generation(filename) >= oldest}
+        return num_examples
+
+    def sample(self, batch_size, rng=np.random):
+        '''Returns a uniformly sampled batch of (features, pis, values), with
+        features as float32 like batch_parse_tf_example.'''
+        indices = rng.choice(self.valid_indices(), size=batch_size)
+        records = self.records[indices]
+        features = preprocessing.unpack_features(records['x'])
+        return (features.astype(np.float32), records['pi'],
+                records['outcome'])
+
+    def get_input_tensors(self, batch_size, seed=None):
+        '''Returns sampled training batches as tensors, in the format of
+        preprocessing.get_input_tensors.'''
+        if not len(self):
+            raise ValueError(
+                "The replay buffer has no examples of the last {} "
+                "generations to train on".format(self.generations))
+        rng = np.random.RandomState(seed)
+
+        def batches():
+            while True:
+                yield self.sample(batch_size, rng)
+
+        dataset = tf.data.Dataset.from_generator(
+            batches, (tf.float32, tf.float32, tf.float32),
+            ([batch_size, go.N, go.N, features_lib.NEW_FEATURES_PLANES],
+             [batch_size, go.N * go.N + 1], [batch_size]))
+        dataset = dataset.prefetch(4)
+        x, pi, outcome = dataset.make_one_shot_iterator().get_next()
+        return (x, {'pi_tensor': pi, 'value_tensor': outcome})
+
+    def save(self, filename):
+        # zipfile seeks in the file it writes, which a GFile can't do.
+        buf = io.BytesIO()
+        np.savez(buf, records=self.records, generation=self.generation,
+                 next=self.next,
+                 ingested=np.array(sorted(self.ingested), dtype=np.str_))
+        with gfile.GFile(filename, 'wb') as f:
+            f.write(buf.getvalue())
+
+    @staticmethod
+    def restore(filename, capacity, generations):
+        '''Loads a buffer saved with save(), or returns an empty one if the
+        file doesn't exist or was saved with a different capacity.'''
+        buffer = ReplayBuffer(capacity, generations)
+        if not gfile.Exists(filename):
+            return buffer
+        with gfile.GFile(filename, 'rb') as f:
+            saved = np.load(f)
+            if len(saved['records']) != capacity:
+                return buffer
+            buffer.records = saved['records']
+            buffer.generation = saved['generation']
+            buffer.next = int(saved['next'])
+            buffer.ingested = set(saved['ingested'].tolist())
+        return buffer
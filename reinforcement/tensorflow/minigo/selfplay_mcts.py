@@ -20,6 +20,8 @@ import sys
 
 import coords
 import go
+import goparams
+from eval_cache import EvalCache
 from gtp_wrapper import MCTSPlayer
 
 SIMULTANEOUS_LEAVES = 8
@@ -46,16 +48,14 @@ def play(network, readouts, resign_threshold, verbosity=0):
     # Must run this once at the start, so that noise injection actually
     # affects the first move of the game.
     first_node = player.root.select_leaf()
-    prob, val = network.run(first_node.position)
-    first_node.incorporate_results(prob, val, first_node)
+    probs, vals = player.evaluate([first_node.position])
+    first_node.incorporate_results(probs[0], vals[0], first_node)
 
     while True:
         start = time.time()
         player.root.inject_noise()
-        current_readouts = player.root.N
         # we want to do "X additional readouts", rather than "up to X readouts".
-        while player.root.N < current_readouts + readouts:
-            player.tree_search()
+        player.search(readouts)
 
         if (verbosity >= 3):
             print(player.root.position)
@@ -84,5 +84,137 @@ def play(network, readouts, resign_threshold, verbosity=0):
         print("%s: %.3f" % (player.result_string, player.root.Q), file=sys.stderr)
         print(player.root.position,
               player.root.position.score(), file=sys.stderr)
+        if isinstance(player.network, EvalCache):
+            print("Eval cache hit rate: %.3f" % player.network.hit_rate(),
+                  file=sys.stderr)
 
     return player
+
+
+class BatchedSelfplay(object):
+    '''Plays several self-play games at once, sharing one network.
+
+    Every step selects up to `num_parallel` leaves from each game in flight
+    and evaluates all of them with a single `run_many` call (split into
+    chunks of at most `batch_size` positions), so the network sees batches
+    of roughly games_in_flight * num_parallel positions instead of 8.
+
+    Each game follows the same schedule as `play`: noise is injected into
+    the root once it has been expanded, then `readouts` more readouts are
+    done before picking a move.
+
+    With `eval_cache_size`, all games share one eval_cache.EvalCache. With
+    `all_symmetries`, every position is evaluated under all 8 symmetries and
+    the results are averaged.
+    '''
+
+    def __init__(self, network, readouts, resign_threshold, verbosity=0,
+                 games_in_flight=16, batch_size=256,
+                 num_parallel=SIMULTANEOUS_LEAVES,
+                 eval_cache_size=goparams.EVAL_CACHE_SIZE,
+                 all_symmetries=goparams.EVAL_ALL_SYMMETRIES):
+        if eval_cache_size:
+            network = EvalCache(network, eval_cache_size)
+        self.network = network
+        self.readouts = readouts
+        self.resign_threshold = resign_threshold
+        self.verbosity = verbosity
+        self.games_in_flight = games_in_flight
+        self.batch_size = batch_size
+        self.num_parallel = num_parallel
+        self.all_symmetries = all_symmetries
+        self.games_finished = 0
+        self.positions_evaluated = 0
+        self.start_time = time.time()
+
+    def games_per_hour(self):
+        return self.games_finished * 3600.0 / (time.time() - self.start_time)
+
+    def positions_per_sec(self):
+        return self.positions_evaluated / (time.time() - self.start_time)
+
+    def _new_game(self):
+        player = MCTSPlayer(self.network,
+                            resign_threshold=self.resign_threshold,
+                            verbosity=self.verbosity,
+                            num_parallel=self.num_parallel,
+                            all_symmetries=self.all_symmetries)
+        # Disable resign in 5% of games
+        if random.random() < 0.05:
+            player.resign_threshold = -1.0
+        player.initialize_game()
+        # readouts to reach before moving; None until noise is injected.
+        player.target_readouts = None
+        return player
+
+    def _run_many(self, positions):
+        move_probs, values = [], []
+        for i in range(0, len(positions), self.batch_size):
+            batch = positions[i:i + self.batch_size]
+            if self.all_symmetries:
+                probs, vals = self.network.run_many(batch, all_symmetries=True)
+            else:
+                probs, vals = self.network.run_many(batch)
+            move_probs.extend(probs)
+            values.extend(vals)
+        self.positions_evaluated += len(positions)
+        return move_probs, values
+
+    def _maybe_move(self, player):
+        '''Plays a move once the root has been searched enough. Returns
+        True if the game is over.'''
+        if player.target_readouts is None:
+            # noise only affects the search once the root is expanded.
+            if not player.root.is_expanded:
+                return False
+            player.root.inject_noise()
+            player.target_readouts = player.root.N + self.readouts
+        if player.root.N < player.target_readouts:
+            return False
+
+        if player.should_resign():
+            player.set_result(-1 * player.root.position.to_play,
+                              was_resign=True)
+            return True
+        player.play_move(player.pick_move())
+        player.target_readouts = None
+        if player.root.is_done():
+            player.set_result(player.root.position.result(), was_resign=False)
+            return True
+        if (self.verbosity >= 2) or (self.verbosity >= 1 and player.root.position.n % 10 == 9):
+            print("%d: Q: %.5f, %.1f positions/sec" % (
+                player.root.position.n, player.root.Q,
+                self.positions_per_sec()), flush=True)
+        return False
+
+    def play(self, num_games):
+        '''Plays `num_games` games, yielding each player as its game ends.'''
+        games_started = 0
+        players = []
+        while players or games_started < num_games:
+            while len(players) < self.games_in_flight and games_started < num_games:
+                players.append(self._new_game())
+                games_started += 1
+
+            leaves = [player.select_leaves() for player in players]
+            positions = [leaf.position for game in leaves for leaf in game]
+            if positions:
+                move_probs, values = self._run_many(positions)
+            start = 0
+            for player, game_leaves in zip(players, leaves):
+                end = start + len(game_leaves)
+                player.incorporate_leaves(
+                    game_leaves, move_probs[start:end], values[start:end])
+                start = end
+
+            still_playing = []
+            for player in players:
+                if self._maybe_move(player):
+                    self.games_finished += 1
+                    if self.verbosity >= 2:
+                        print("%s: %.3f" % (player.result_string, player.root.Q),
+                              file=sys.stderr)
+                    yield player
+                else:
+                    still_playing.append(player)
+            players = still_playing
@@ -24,6 +24,7 @@ import sys
 import time
 import shutil
 import dual_net
+import inference_server
 import preprocessing
 import numpy
 import random
@@ -54,6 +55,10 @@ TRAINING_CHUNK_DIR = os.path.join(BASE_DIR, 'data', 'training_chunks')
 
 ESTIMATOR_WORKING_DIR = os.path.join(BASE_DIR, 'estimator_working_dir')
 
+# Where loop_selfplay.py starts the inference server, if
+# goparams.INFERENCE_SERVER is set.
+INFERENCE_ADDRESS = os.path.join(BASE_DIR, 'inference.sock')
+
 # What percent of games to holdout from training per generation
 
 HOLDOUT_PCT = goparams.HOLDOUT_PCT
@@ -240,7 +245,11 @@ def rl_loop():
         preprocessing.SHUFFLE_BUFFER_SIZE = 1000
 
     _, model_name = get_latest_model()
-    network = selfplay_laod_model(model_name)
+    if goparams.INFERENCE_SERVER:
+        network = inference_server.RemoteNetwork(
+            INFERENCE_ADDRESS, save_file=os.path.join(MODELS_DIR, model_name))
+    else:
+        network = selfplay_laod_model(model_name)
     def count_games():
       # returns number of games in the selfplay directory
       if not os.path.exists(os.path.join(SELFPLAY_DIR, model_name)):
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import ThreadPoolExecutor
 import copy
 import math
 import os
@@ -23,9 +24,12 @@ import sgf_wrapper
 import coords
 import gtp
 import numpy as np
-from mcts import MCTSNode, MAX_DEPTH
+from eval_cache import EvalCache
+from mcts import MCTSNode, LazyMCTSNode, MAX_DEPTH
+import mcts_array
 
 import go
+import goparams
 
 # When to do deterministic move selection.  ~30 moves on a 19x19, ~8 on 9x9
 TEMPERATURE_CUTOFF = int((go.N * go.N) / 12)
@@ -63,9 +67,29 @@ def time_recommendation(move_num, seconds_per_move=5, time_limit=15*60,
 class MCTSPlayerMixin:
     # If `simulations_per_move` is nonzero, it will perform that many reads
     # before playing. Otherwise, it uses `seconds_per_move` of wall time.
+    # If `lazy_positions` is set, the tree is built from LazyMCTSNodes, which
+    # only keep a go.Position on the root, on leaves awaiting evaluation and
+    # on expanded nodes every `lazy_position_interval` moves.
+    # If `array_tree` is set, the tree is a mcts_array.ArrayTree instead.
+    # If `reuse_tree` is set, the subtree under each played move (ours or the
+    # opponent's) becomes the new root and the rest of the tree is freed;
+    # otherwise search restarts from an empty tree after every move.
+    # If `pipelined` is set, readouts use pipelined_tree_search, which selects
+    # the next batch of leaves while the network evaluates the current one.
+    # If `eval_cache_size` is nonzero, network evaluations are memoized in an
+    # eval_cache.EvalCache of that size (unless `network` already is one).
+    # If `all_symmetries` is set, every leaf is evaluated under all 8
+    # symmetries of the board and the results are averaged.
     def __init__(self, network, seconds_per_move=5, simulations_per_move=0,
                  resign_threshold=-0.90, verbosity=0, two_player_mode=False,
-                 num_parallel=8):
+                 num_parallel=8, lazy_positions=goparams.LAZY_MCTS_POSITIONS,
+                 lazy_position_interval=goparams.LAZY_MCTS_POSITION_INTERVAL,
+                 array_tree=goparams.ARRAY_MCTS_TREE, reuse_tree=True,
+                 eval_cache_size=goparams.EVAL_CACHE_SIZE,
+                 pipelined=goparams.PIPELINED_SEARCH,
+                 all_symmetries=goparams.EVAL_ALL_SYMMETRIES):
+        if eval_cache_size and not isinstance(network, EvalCache):
+            network = EvalCache(network, eval_cache_size)
         self.network = network
         self.seconds_per_move = seconds_per_move
         self.simulations_per_move = simulations_per_move
@@ -76,23 +100,40 @@ class MCTSPlayerMixin:
         else:
             self.temp_threshold = TEMPERATURE_CUTOFF
         self.num_parallel = num_parallel
+        self.lazy_positions = lazy_positions
+        self.lazy_position_interval = lazy_position_interval
+        self.array_tree = array_tree
+        self.reuse_tree = reuse_tree
+        self.pipelined = pipelined
+        self.all_symmetries = all_symmetries
+        self._executor = None
         self.qs = []
         self.comments = []
         self.searches_pi = []
+        self.reused_readouts = []
         self.root = None
         self.result = 0
         self.result_string = None
         self.resign_threshold = -abs(resign_threshold)
         super().__init__()
 
+    def _new_root(self, position):
+        if self.array_tree:
+            return mcts_array.ArrayTree(position).root
+        elif self.lazy_positions:
+            return LazyMCTSNode(
+                position, position_interval=self.lazy_position_interval)
+        return MCTSNode(position)
+
     def initialize_game(self, position=None):
         if position is None:
-            position = go.Position()
-        self.root = MCTSNode(position)
+            position = go.new_position()
+        self.root = self._new_root(position)
         self.result = 0
         self.result_string = None
         self.comments = []
         self.searches_pi = []
+        self.reused_readouts = []
         self.qs = []
 
     def suggest_move(self, position):
@@ -103,15 +144,19 @@ class MCTSPlayerMixin:
         start = time.time()
 
         if self.simulations_per_move == 0:
-            while time.time() - start < self.seconds_per_move:
-                self.tree_search()
+            if self.pipelined:
+                self.pipelined_tree_search(
+                    float('inf'), deadline=start + self.seconds_per_move)
+            else:
+                while time.time() - start < self.seconds_per_move:
+                    self.tree_search()
         else:
             current_readouts = self.root.N
-            while self.root.N < current_readouts + self.simulations_per_move:
-                self.tree_search()
+            self.search(self.simulations_per_move)
             if self.verbosity > 0:
-                print("%d: Searched %d times in %s seconds\n\n" % (
-                    position.n, self.simulations_per_move, time.time() - start), file=sys.stderr)
+                print("%d: Searched %d times (%d reused) in %s seconds\n\n" % (
+                    position.n, self.simulations_per_move, current_readouts,
+                    time.time() - start), file=sys.stderr)
 
         # print some stats on anything with probability > 1%
         if self.verbosity > 2:
@@ -129,23 +174,33 @@ class MCTSPlayerMixin:
           this roots visit counts into the class' running tally, `searches_pi`
           - Makes the node associated with this move the root, for future
             `inject_noise` calls.
+          - Records how many readouts of the new root were kept from earlier
+            searches in `reused_readouts`.
         '''
         if not self.two_player_mode:
             self.searches_pi.append(
                 self.root.children_as_pi(self.root.position.n < self.temp_threshold))
         self.qs.append(self.root.Q)  # Save our resulting Q.
         self.comments.append(self.root.describe())
+        fcoord = coords.to_flat(c)
         try:
-            self.root = self.root.maybe_add_child(coords.to_flat(c))
+            child = self.root.maybe_add_child(fcoord)
+            # a lazily created child only discovers an illegal move once its
+            # position is materialized.
+            self.position = child.position  # for showboard
         except go.IllegalMove:
             print("Illegal move")
+            self.root.children.pop(fcoord, None)
             if not self.two_player_mode:
                 self.searches_pi.pop()
             self.qs.pop()
             self.comments.pop()
             return False
-        self.position = self.root.position  # for showboard
-        del self.root.parent.children
+        if self.reuse_tree:
+            self.root = child.promote_to_root()
+        else:
+            self.root = self._new_root(child.position)
+        self.reused_readouts.append(int(self.root.N))
         return True  # GTP requires positive result.
 
     def pick_move(self):
@@ -163,7 +218,69 @@ class MCTSPlayerMixin:
             assert self.root.child_N[fcoord] != 0
         return coords.from_flat(fcoord)
 
+    def evaluate(self, positions):
+        '''Runs the network on `positions`, averaging over all symmetries
+        if `all_symmetries` is set.'''
+        if self.all_symmetries:
+            return self.network.run_many(positions, all_symmetries=True)
+        return self.network.run_many(positions)
+
     def tree_search(self, num_parallel=None):
+        leaves = self.select_leaves(num_parallel)
+        if leaves:
+            move_probs, values = self.evaluate(
+                [leaf.position for leaf in leaves])
+            self.incorporate_leaves(leaves, move_probs, values)
+
+    def search(self, readouts):
+        '''Does `readouts` more readouts from the current root.'''
+        target = self.root.N + readouts
+        if self.pipelined:
+            self.pipelined_tree_search(target)
+            return
+        while self.root.N < target:
+            self.tree_search()
+
+    def pipelined_tree_search(self, target_readouts, num_parallel=None,
+                              deadline=None):
+        '''Searches until the root has `target_readouts` visits (or until
+        time.time() passes `deadline`), overlapping tree work with network
+        evaluation.
+
+        The network runs one batch of leaves on a worker thread while the
+        next batch is selected here, so leaves are selected with the virtual
+        losses of both batches in flight. Only this thread touches the tree;
+        the worker only sees the batch's positions. A leaf selected again
+        before its first evaluation came back is reverted by
+        incorporate_results, as within a batch. Nothing is in flight when
+        this returns.
+        '''
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        pending = None
+        while True:
+            searching = self.root.N < target_readouts and (
+                deadline is None or time.time() < deadline)
+            if not searching and pending is None:
+                break
+            leaves = []
+            if searching:
+                leaves = self.select_leaves(num_parallel)
+            if pending is not None:
+                pending_leaves, result = pending
+                self.incorporate_leaves(pending_leaves, *result.result())
+                pending = None
+            if leaves:
+                pending = (leaves, self._executor.submit(
+                    self.evaluate, [leaf.position for leaf in leaves]))
+
+    def select_leaves(self, num_parallel=None):
+        '''Selects up to `num_parallel` leaves for evaluation, with virtual
+        losses applied. Finished games are scored directly.
+
+        The caller must pass the network's results for the leaves to
+        `incorporate_leaves`, which lets several players share one batch.
+        '''
         if num_parallel is None:
             num_parallel = self.num_parallel
         leaves = []
@@ -180,12 +297,12 @@ class MCTSPlayerMixin:
                 continue
             leaf.add_virtual_loss(up_to=self.root)
             leaves.append(leaf)
-        if leaves:
-            move_probs, values = self.network.run_many(
-                [leaf.position for leaf in leaves])
-            for leaf, move_prob, value in zip(leaves, move_probs, values):
-                leaf.revert_virtual_loss(up_to=self.root)
-                leaf.incorporate_results(move_prob, value, up_to=self.root)
+        return leaves
+
+    def incorporate_leaves(self, leaves, move_probs, values):
+        for leaf, move_prob, value in zip(leaves, move_probs, values):
+            leaf.revert_virtual_loss(up_to=self.root)
+            leaf.incorporate_results(move_prob, value, up_to=self.root)
 
     def show_path_to_root(self, node):
         pos = node.position
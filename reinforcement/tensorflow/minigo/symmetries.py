@@ -54,6 +54,22 @@ assert set(INVERSES.keys()) == set(IMPLS.keys())
 SYMMETRIES = list(INVERSES.keys())
 
 # A symmetry is just a string describing the transformation.
+SYMMETRY_INDEX = {s: i for i, s in enumerate(SYMMETRIES)}
+
+
+def _make_gather_indices():
+    '''Returns a [8, N * N + 1] table of indices, such that applying
+    symmetry i to a flattened board (plus pass move) x gives
+    x[indices[i]]. The first N * N columns also gather the points of
+    feature planes, and the pass move always maps to itself.'''
+    points = np.arange(go.N * go.N).reshape([go.N, go.N])
+    return np.array([np.append(IMPLS[s](points).ravel(), go.N * go.N)
+                     for s in SYMMETRIES])
+
+
+GATHER_INDICES = _make_gather_indices()
+INVERSE_GATHER_INDICES = GATHER_INDICES[
+    [SYMMETRY_INDEX[INVERSES[s]] for s in SYMMETRIES]]
 
 
 def invert_symmetry(s):
@@ -65,18 +81,60 @@ def apply_symmetry_feat(s, features):
 
 
 def apply_symmetry_pi(s, pi):
-    pi = np.copy(pi)
     # rotate all moves except for the pass move at end
-    pi[:-1] = IMPLS[s](pi[:-1].reshape([go.N, go.N])).ravel()
-    return pi
+    return np.asarray(pi)[GATHER_INDICES[SYMMETRY_INDEX[s]]]
+
+
+def _gather_points(indices, features):
+    '''Gathers the points of a [B, N, N, C] batch of features with a
+    [B, N * N] array of flat indices.'''
+    features = np.asarray(features)
+    # a single take over the rows of [B * N * N, C] is much faster than
+    # indexing [B, N * N, C] with two index arrays.
+    offsets = np.arange(len(features))[:, None] * (go.N * go.N)
+    return features.reshape([-1, features.shape[-1]]).take(
+        (offsets + indices).ravel(), axis=0).reshape(features.shape)
+
+
+def apply_symmetries_feat(symmetries, features):
+    '''Applies symmetries[i] to features[i] for a [B, N, N, C] batch.'''
+    ids = [SYMMETRY_INDEX[s] for s in symmetries]
+    return _gather_points(GATHER_INDICES[ids, :-1], features)
+
+
+def apply_symmetries_pi(symmetries, pis):
+    '''Applies symmetries[i] to pis[i] for a [B, N * N + 1] batch.'''
+    ids = [SYMMETRY_INDEX[s] for s in symmetries]
+    pis = np.asarray(pis)
+    return pis[np.arange(len(pis))[:, None], GATHER_INDICES[ids]]
 
 
 def randomize_symmetries_feat(features):
     symmetries_used = [random.choice(SYMMETRIES) for f in features]
-    return symmetries_used, [apply_symmetry_feat(s, f)
-                             for s, f in zip(symmetries_used, features)]
+    return symmetries_used, apply_symmetries_feat(symmetries_used, features)
 
 
 def invert_symmetries_pi(symmetries, pis):
-    return [apply_symmetry_pi(invert_symmetry(s), pi)
-            for s, pi in zip(symmetries, pis)]
+    ids = [SYMMETRY_INDEX[s] for s in symmetries]
+    pis = np.asarray(pis)
+    return pis[np.arange(len(pis))[:, None], INVERSE_GATHER_INDICES[ids]]
+
+
+def all_symmetries_feat(features):
+    '''Returns a [B * 8, N, N, C] batch holding all 8 symmetries of each
+    position in a [B, N, N, C] batch, in the order of SYMMETRIES.'''
+    features = np.asarray(features)
+    offsets = np.arange(len(features))[:, None, None] * (go.N * go.N)
+    indices = offsets + GATHER_INDICES[:, :-1]
+    return features.reshape([-1, features.shape[-1]]).take(
+        indices.ravel(), axis=0).reshape((-1,) + features.shape[1:])
+
+
+def average_symmetries(pis, values):
+    '''Undoes all_symmetries_feat on the outputs of the network: inverts
+    each of the [B * 8, N * N + 1] policies, and averages the policies
+    and values of the 8 symmetries of every position.'''
+    pis = np.asarray(pis).reshape([-1, len(SYMMETRIES), go.N * go.N + 1])
+    pis = pis[:, np.arange(len(SYMMETRIES))[:, None], INVERSE_GATHER_INDICES]
+    values = np.asarray(values).reshape([-1, len(SYMMETRIES)])
+    return pis.mean(axis=1), values.mean(axis=1)
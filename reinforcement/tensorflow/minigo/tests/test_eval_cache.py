@@ -0,0 +1,161 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+import eval_cache
+import features
+import go
+import symmetries
+from tests import test_utils
+from eval_cache import EvalCache
+from strategies import MCTSPlayerMixin
+
+
+class PlanesNet():
+    '''An equivariant fake network: the policy weights each point by its
+    stones in all history planes.'''
+
+    def __init__(self):
+        self.evaluated = 0
+        self.modes = set()
+
+    def run_many(self, positions, use_random_symmetry=True,
+                 all_symmetries=False):
+        self.evaluated += len(positions)
+        self.modes.add(all_symmetries)
+        probs, values = [], []
+        for position in positions:
+            f = features.extract_features(position).astype(np.float32)
+            weights = f[:, :, :16] * np.arange(1, 17)
+            prob = np.append(weights.sum(axis=2).ravel() + 1, 1)
+            probs.append(prob / prob.sum())
+            # tells averaged evaluations apart.
+            values.append(float(f.sum()) / 1000 + all_symmetries)
+        return probs, values
+
+
+def play(moves):
+    position = go.Position()
+    for move in moves:
+        position = position.play_move(move)
+    return position
+
+
+MOVES = [(2, 2), (6, 6), (2, 6), (6, 2), (4, 4), (3, 5), (5, 3), (1, 7),
+         (7, 1), (0, 3), (3, 0), (8, 5)]
+
+
+class TestEvalCache(test_utils.MiniGoUnitTest):
+    def test_hashes_match_transformed_features(self):
+        f = features.extract_features(play(MOVES[:5]))[:, :, :16]
+        occupied = f.ravel() != 0
+        hashes = np.bitwise_xor.reduce(eval_cache.ZOBRIST[:, occupied], axis=1)
+        identity = symmetries.SYMMETRIES.index('identity')
+        for i, s in enumerate(symmetries.SYMMETRIES):
+            transformed = symmetries.apply_symmetry_feat(s, f).ravel() != 0
+            self.assertEqual(
+                hashes[i], np.bitwise_xor.reduce(
+                    eval_cache.ZOBRIST[identity, transformed]))
+
+    def test_player_to_move_is_hashed(self):
+        position = play(MOVES[:3])
+        self.assertNotEqual(eval_cache.canonical_hash(position)[0],
+                            eval_cache.canonical_hash(
+                                position.flip_playerturn())[0])
+
+    def test_transposition_hits(self):
+        # the first and third black moves are swapped; after 8 more moves
+        # the network sees the same history.
+        transposed = [MOVES[2], MOVES[1], MOVES[0]] + MOVES[3:]
+        net = PlanesNet()
+        cache = EvalCache(net)
+        probs, values = cache.run_many([play(MOVES), play(transposed)])
+        self.assertEqual(net.evaluated, 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqualNPArray(probs[0], probs[1])
+        # too recent to be a transposition.
+        cache.run(play(transposed[:4]))
+        self.assertEqual(net.evaluated, 2)
+
+    def test_symmetric_positions_hit(self):
+        net = PlanesNet()
+        cache = EvalCache(net)
+        for s in symmetries.SYMMETRIES:
+            board = np.zeros([go.N, go.N], dtype=np.int8)
+            moves = []
+            for move in MOVES[:6]:
+                board[move] = 1
+                transformed = symmetries.apply_symmetry_feat(s, board)
+                moves.append(tuple(np.argwhere(transformed)[0]))
+                board[move] = 0
+            position = play(moves)
+            prob, value = cache.run(position)
+            expected_probs, expected_values = net.run_many([position])
+            np.testing.assert_allclose(prob, expected_probs[0], rtol=1e-6)
+            self.assertAlmostEqual(value, expected_values[0])
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hits, 7)
+        self.assertAlmostEqual(cache.hit_rate(), 7 / 8)
+
+    def test_lru_eviction(self):
+        positions = [play(MOVES[:i]) for i in range(1, 5)]
+        net = PlanesNet()
+        cache = EvalCache(net, max_size=2)
+        # positions repeated within a batch are evaluated once.
+        cache.run_many(positions[:2] + positions[:2])
+        self.assertEqual(net.evaluated, 2)
+        cache.run(positions[0])
+        cache.run(positions[2])  # evicts positions[1]
+        self.assertEqual(len(cache.entries), 2)
+        cache.run(positions[0])
+        self.assertEqual(net.evaluated, 3)
+        cache.run(positions[1])
+        self.assertEqual(net.evaluated, 4)
+        # batches larger than the cache still get all of their results.
+        probs, values = cache.run_many(positions)
+        self.assertEqual(len(probs), 4)
+        self.assertEqual(len(cache.entries), 2)
+
+    def test_all_symmetries_cached_separately(self):
+        position = play(MOVES[:5])
+        net = PlanesNet()
+        cache = EvalCache(net)
+        _, single = cache.run(position)
+        _, averaged = cache.run(position, all_symmetries=True)
+        self.assertEqual(net.evaluated, 2)
+        self.assertEqual(net.modes, {False, True})
+        self.assertAlmostEqual(averaged, single + 1)
+        self.assertAlmostEqual(cache.run(position)[1], single)
+        self.assertAlmostEqual(
+            cache.run(position, all_symmetries=True)[1], averaged)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_player_uses_cache(self):
+        player = MCTSPlayerMixin(PlanesNet(), simulations_per_move=40,
+                                 eval_cache_size=1000)
+        self.assertIsInstance(player.network, EvalCache)
+        player.initialize_game()
+        for i in range(3):
+            player.play_move(player.suggest_move(player.root.position))
+        cache = player.network
+        self.assertEqual(cache.network.evaluated, cache.misses)
+        self.assertGreater(cache.hits, 0)
+
+    def test_player_all_symmetries(self):
+        player = MCTSPlayerMixin(PlanesNet(), simulations_per_move=16,
+                                 eval_cache_size=1000, all_symmetries=True)
+        player.initialize_game()
+        player.play_move(player.suggest_move(player.root.position))
+        self.assertEqual(player.network.network.modes, {True})
@@ -0,0 +1,106 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import random
+import numpy as np
+
+import coords
+import fast_go
+import features
+import go
+from tests import test_utils
+
+EMPTY_ROW = '.' * go.N + '\n'
+
+
+def random_game(seed, max_moves=150):
+    '''Plays a random game with go.Position and returns the list of moves.'''
+    rng = random.Random(seed)
+    pos = go.Position()
+    moves = []
+    while len(moves) < max_moves and not pos.is_game_over():
+        legal = np.flatnonzero(pos.all_legal_moves())
+        move = coords.from_flat(int(rng.choice(legal)))
+        pos = pos.play_move(move)
+        moves.append(move)
+    return moves
+
+
+class TestFastPosition(test_utils.MiniGoUnitTest):
+    def assertEquivalentPositions(self, slow, fast):
+        self.assertEqualPositions(slow, fast)
+        self.assertEqualNPArray(slow.board_deltas, fast.board_deltas)
+        self.assertEqualNPArray(slow.all_legal_moves(),
+                                fast.all_legal_moves())
+        self.assertEqual(slow.score(), fast.score())
+        self.assertEqualNPArray(features.extract_features(slow),
+                                features.extract_features(fast))
+
+    def test_random_games_match_liberty_tracker(self):
+        for seed in range(5):
+            slow = go.Position()
+            fast = fast_go.Position()
+            for move in random_game(seed):
+                slow = slow.play_move(move)
+                fast = fast.play_move(move)
+                self.assertEqual(slow.is_move_legal(move),
+                                 fast.is_move_legal(move))
+            self.assertEquivalentPositions(slow, fast)
+
+    def test_build_from_board(self):
+        board = test_utils.load_board('''
+            .XOXXOO..
+            XO.OXOX..
+            XXO..X...
+        ''' + EMPTY_ROW * 6)
+        slow = go.Position(board=board, to_play=go.WHITE)
+        fast = fast_go.Position(board=np.copy(board), to_play=go.WHITE)
+        self.assertEquivalentPositions(slow, fast)
+        for move in ((0, 0), (0, 2), (1, 2), (2, 3)):
+            self.assertEqual(slow.is_move_legal(move),
+                             fast.is_move_legal(move))
+
+    def test_capture_and_ko(self):
+        board = test_utils.load_board('''
+            .XO......
+            XO.......
+        ''' + EMPTY_ROW * 7)
+        fast = fast_go.Position(board=board, to_play=go.WHITE)
+        fast = fast.play_move((0, 0))
+        self.assertEqual(fast.caps, (0, 1))
+        self.assertEqual(fast.ko, (0, 1))
+        self.assertFalse(fast.is_move_legal((0, 1)))
+        with self.assertRaises(go.IllegalMove):
+            fast.play_move((0, 1))
+        fast = fast.pass_move().pass_move()
+        self.assertTrue(fast.is_move_legal((0, 1)))
+
+    def test_play_move_does_not_mutate(self):
+        fast = fast_go.Position()
+        fast.play_move((3, 3))
+        self.assertEqualNPArray(fast.board, go.EMPTY_BOARD)
+        copied = copy.deepcopy(fast).play_move((3, 3), mutate=True)
+        self.assertEqual(fast.n, 0)
+        self.assertEqual(copied.n, 1)
+
+    def test_new_position(self):
+        engine = go.goparams.GO_ENGINE
+        try:
+            go.goparams.GO_ENGINE = 'fast'
+            self.assertIsInstance(go.new_position(), fast_go.Position)
+            go.goparams.GO_ENGINE = 'default'
+            self.assertNotIsInstance(go.new_position(), fast_go.Position)
+        finally:
+            go.goparams.GO_ENGINE = engine
@@ -12,12 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import itertools
 import numpy as np
 
+import fast_go
 import features
 import go
 from tests import test_utils
+from tests.test_fast_go import random_game
 
 EMPTY_ROW = '.' * go.N + '\n'
 TEST_BOARD = test_utils.load_board('''
@@ -150,3 +153,45 @@ class TestFeatureExtraction(test_utils.MiniGoUnitTest):
         # move at (0, 7) would capture 3 stones
         self.assertEqual(f[0, 7, 2], 1)
         self.assertEqual(f[0, 7, 1], 0)
+
+    def test_cached_features_match_extraction(self):
+        def from_scratch(position):
+            return np.concatenate([f(position) for f in features.NEW_FEATURES],
+                                  axis=2)
+
+        # passes are part of the history too.
+        games = [(go.EMPTY_BOARD, random_game(1, max_moves=40) + [None, None]),
+                 (TEST_BOARD, [(5, 5), (6, 6), None, (8, 8), (1, 1)])]
+        for (board, moves), position_cls in itertools.product(
+                games, (go.Position, fast_go.Position)):
+            position = position_cls(board=np.copy(board))
+            features.extract_features(position)
+            for move in moves:
+                position = position.play_move(move)
+                self.assertIsNotNone(position.cached_features)
+                self.assertEqualNPArray(position.cached_features,
+                                        from_scratch(position))
+            position.play_move(None, mutate=True)
+            self.assertEqualNPArray(features.extract_features(position),
+                                    from_scratch(position))
+
+    def test_cached_features_are_read_only(self):
+        position = go.Position().play_move((3, 3))
+        f = features.extract_features(position)
+        self.assertIs(f, features.extract_features(position))
+        with self.assertRaises(ValueError):
+            f[0, 0, 0] = 1
+        # changing the player to move invalidates the cache.
+        flipped = position.flip_playerturn()
+        self.assertIsNone(flipped.cached_features)
+        self.assertIs(copy.deepcopy(position).cached_features, f)
+
+    def test_bulk_extract_into_buffer(self):
+        positions = [go.Position().play_move((i, 0)) for i in range(3)]
+        buffer = features.feature_buffer(5)
+        self.assertIs(features.feature_buffer(3, buffer), buffer)
+        output = features.bulk_extract_features(positions, output=buffer)
+        self.assertEqual(output.shape[0], 3)
+        self.assertTrue(np.shares_memory(output, buffer))
+        for position, f in zip(positions, output):
+            self.assertEqualNPArray(f, features.extract_features(position))
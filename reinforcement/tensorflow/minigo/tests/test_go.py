@@ -16,6 +16,7 @@ import numpy as np
 import unittest
 
 import coords
+import fast_go
 from go import Position, PlayerMove, LibertyTracker, WHITE, BLACK, EMPTY
 import go
 import sgf_wrapper
@@ -78,6 +79,24 @@ class TestBasicFunctions(test_utils.MiniGoUnitTest):
         for ne in not_eyes:
             self.assertEqual(go.is_eyeish(board, ne), None, str(ne))
 
+    def test_label_chains(self):
+        board = test_utils.load_board('''
+            .XX...XXX
+            X.X...X.X
+            XX.....X.
+            ........X
+            XXXX.....
+            OOOX....O
+            X.OXX.OO.
+            .XO.X.O.O
+            XXO.X.OO.
+        ''')
+        labels = go.label_chains(board).reshape([go.N, go.N])
+        for c in go.ALL_COORDS:
+            chain, _ = go.find_reached(board, c)
+            with self.subTest(coord=c):
+                self.assertEqual(labels[c], min(x * go.N + y for x, y in chain))
+
 
 class TestLibertyTracker(test_utils.MiniGoUnitTest):
     def test_lib_tracker_init(self):
@@ -357,6 +376,26 @@ class TestPosition(test_utils.MiniGoUnitTest):
             assert(position.board[move] == go.EMPTY)
             self.assertFalse(position.is_move_suicidal(move), str(move))
 
+    def test_suicide_by_color_not_to_play(self):
+        board = test_utils.load_board('''
+            ...O.O...
+            ....O....
+            XO.....O.
+            OXO...OXO
+            O.XO.OX.O
+            OXO...OOX
+            XO.......
+            ......XXO
+            .....XOO.
+        ''')
+        for engine in (Position, fast_go.Position):
+            position = engine(board=np.copy(board), to_play=WHITE)
+            for move in coords_from_kgs_set('E9 H5'):
+                with self.assertRaises(go.IllegalMove):
+                    position.play_move(move, color=BLACK)
+            position = position.play_move(coords.from_kgs('B5'), color=BLACK)
+            self.assertEqual(position.board[coords.from_kgs('B5')], BLACK)
+
     def test_legal_moves(self):
         board = test_utils.load_board('''
             .O.O.XOX.
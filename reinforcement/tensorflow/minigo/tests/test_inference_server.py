@@ -0,0 +1,140 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client
+
+import numpy as np
+
+import features
+import go
+from tests import test_utils
+from inference_server import InferenceServer, RemoteNetwork
+
+
+class FeatureSumNet():
+    '''Returns outputs that identify which features were evaluated.'''
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def run_features(self, processed):
+        self.batch_sizes.append(len(processed))
+        sums = processed.reshape(len(processed), -1).sum(axis=1)
+        probs = np.zeros([len(processed), go.N * go.N + 1], dtype=np.float32)
+        probs[:, -1] = sums
+        return probs, sums.astype(np.float32)
+
+
+class BrokenNet():
+    def run_features(self, processed):
+        raise ValueError('broken network')
+
+
+class TestInferenceServer(test_utils.MiniGoUnitTest):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.address = os.path.join(self.tmpdir.name, 'inference.sock')
+        self.net = FeatureSumNet()
+        # a long deadline, so that requests from all workers share a batch.
+        self.server = InferenceServer(self.net, self.address,
+                                      max_batch_size=8, max_latency=1.0)
+        self.errors = []
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.start()
+
+    def _serve(self):
+        try:
+            self.server.serve_forever()
+        except Exception as e:
+            self.errors.append(e)
+
+    def tearDown(self):
+        self.server.close()
+        self.thread.join(timeout=5)
+        self.tmpdir.cleanup()
+        self.assertFalse(self.thread.is_alive())
+        self.assertEqual(self.errors, [])
+
+    def test_batches_across_workers(self):
+        positions = [go.Position().play_move((i, i)) for i in range(4)]
+        results = [None] * 4
+
+        def worker(i):
+            network = RemoteNetwork(self.address)
+            results[i] = network.run_many([positions[i]] * 2,
+                                          use_random_symmetry=False)
+            network.close()
+
+        workers = [threading.Thread(target=worker, args=(i,))
+                   for i in range(4)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+        self.assertEqual(self.net.batch_sizes, [8])
+        for position, (probs, values) in zip(positions, results):
+            expected = features.extract_features(position).sum()
+            self.assertEqualNPArray(values, [expected] * 2)
+            self.assertEqual(probs.shape, (2, go.N * go.N + 1))
+
+    def test_run_with_symmetries(self):
+        network = RemoteNetwork(self.address)
+        position = go.Position().play_move((0, 1))
+        probs, value = network.run(position)
+        self.assertEqual(value, features.extract_features(position).sum())
+        # the pass move is unchanged by symmetries.
+        self.assertEqual(probs[-1], value)
+        network.close()
+
+    def test_close(self):
+        self.server.close()
+        self.thread.join(timeout=5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertEqual(self.net.batch_sizes, [])
+
+    def test_close_serves_queued_requests(self):
+        position = go.Position().play_move((0, 1))
+        processed = features.extract_features(position)[np.newaxis]
+        conn = Client(self.address, family='AF_UNIX')
+        # the batch is still filling, so close() arrives before it runs.
+        self.server.max_latency = 60
+        conn.send(processed)
+        time.sleep(0.5)
+        self.server.close()
+        self.thread.join(timeout=5)
+        self.assertFalse(self.thread.is_alive())
+
+        probs, values = conn.recv()
+        self.assertEqualNPArray(values, [processed.sum()])
+        self.assertEqual(self.net.batch_sizes, [1])
+        conn.close()
+
+    def test_network_error(self):
+        self.server.network = BrokenNet()
+        network = RemoteNetwork(self.address)
+        with self.assertRaises(EOFError):
+            network.run(go.Position(), use_random_symmetry=False)
+        network.close()
+
+        # the server keeps serving other workers.
+        self.server.network = self.net
+        network = RemoteNetwork(self.address)
+        network.run(go.Position(), use_random_symmetry=False)
+        self.assertEqual(self.net.batch_sizes, [1])
+        network.close()
@@ -14,6 +14,7 @@
 
 import copy
 import unittest
+import unittest.mock as mock
 import numpy as np
 
 import coords
@@ -21,7 +22,7 @@ import go
 from go import Position
 from tests import test_utils
 
-from mcts import MCTSNode, MAX_DEPTH
+from mcts import MCTSNode, LazyMCTSNode, MAX_DEPTH
 
 ALMOST_DONE_BOARD = test_utils.load_board('''
 .XO.XO.OO
@@ -157,6 +158,29 @@ class TestMctsNodes(test_utils.MiniGoUnitTest):
         self.assertEqual(child, child2)
         self.assertEqual(current_children, root.children)
 
+    def test_promote_to_root(self):
+        probs = np.array([0.02] * (go.N * go.N + 1), dtype=np.float32)
+        probs[17] = 0.5
+        root = MCTSNode(go.Position())
+        for i in range(20):
+            root.select_leaf().incorporate_results(probs, 0.1, up_to=root)
+        child = root.children[17]
+        N, W = child.N, child.W
+        sibling = root.maybe_add_child(18)
+        grandchildren = dict(child.children)
+
+        new_root = child.promote_to_root()
+        self.assertIs(new_root, child)
+        self.assertEqual(new_root.N, N)
+        self.assertEqual(new_root.W, W)
+        self.assertIsNone(new_root.parent.parent)
+        self.assertEqual(new_root.children, grandchildren)
+        # the old root and the siblings are unlinked from the kept subtree.
+        self.assertEqual(root.children, {})
+        self.assertEqual(sibling.children, {})
+        new_root.select_leaf().incorporate_results(probs, 0.1, up_to=new_root)
+        self.assertEqual(new_root.N, N + 1)
+
     def test_never_select_illegal_moves(self):
         probs = np.array([0.02] * (go.N * go.N + 1))
         # let's say the NN were to accidentally put a high weight on an illegal move
@@ -192,3 +216,76 @@ class TestMctsNodes(test_utils.MiniGoUnitTest):
         # hasn't yet been sent to neural net for eval + result incorporation
         leaf2 = root.select_leaf()
         self.assertIs(leaf1, leaf2)
+
+
+class TestLazyMctsNodes(test_utils.MiniGoUnitTest):
+    def test_matches_eager_tree(self):
+        np.random.seed(1)
+        probs = np.random.random([go.N * go.N + 1]).astype(np.float32)
+        probs /= probs.sum()
+        eager = MCTSNode(SEND_TWO_RETURN_ONE)
+        lazy = LazyMCTSNode(SEND_TWO_RETURN_ONE)
+        for i in range(50):
+            eager_leaf = eager.select_leaf()
+            lazy_leaf = lazy.select_leaf()
+            self.assertEqual(eager_leaf.fmove, lazy_leaf.fmove)
+            self.assertEqual(eager_leaf.position.to_play, lazy_leaf.to_play)
+            self.assertEqual(eager_leaf.is_done(), lazy_leaf.is_done())
+            if eager_leaf.is_done():
+                value = 1 if eager_leaf.position.score() > 0 else -1
+                eager_leaf.backup_value(value, up_to=eager)
+                lazy_leaf.backup_value(value, up_to=lazy)
+                continue
+            self.assertEqualPositions(eager_leaf.position, lazy_leaf.position)
+            value = (i % 3 - 1) * 0.5
+            eager_leaf.incorporate_results(probs, value, up_to=eager)
+            lazy_leaf.incorporate_results(probs, value, up_to=lazy)
+        self.assertEqualNPArray(eager.child_N, lazy.child_N)
+        self.assertEqualNPArray(eager.child_W, lazy.child_W)
+
+    def test_positions_released_after_expansion(self):
+        probs = np.array([0.001] * (go.N * go.N + 1))
+        probs[17] = 0.999
+        root = LazyMCTSNode(go.Position())
+        root.select_leaf().incorporate_results(probs, 0, root)
+        leaf = root.select_leaf()
+        self.assertIsNone(leaf._position)
+        leaf.incorporate_results(probs, 0, root)
+        self.assertIsNone(leaf._position)
+        self.assertIsNotNone(root._position)
+        grandchild = root.select_leaf()
+        self.assertEqual(grandchild.parent, leaf)
+        self.assertEqual(grandchild.position.n, 2)
+        self.assertEqual(grandchild.position.recent[0].move,
+                         coords.from_flat(leaf.fmove))
+
+    def test_positions_kept_every_interval(self):
+        probs = np.array([0.02] * (go.N * go.N + 1), dtype=np.float32)
+        root = LazyMCTSNode(go.Position(), position_interval=2)
+        root.select_leaf().incorporate_results(probs, 0, root)
+        child = root.maybe_add_child(17)
+        child.incorporate_results(probs, 0, root)
+        grandchild = child.maybe_add_child(18)
+        grandchild.incorporate_results(probs, 0, root)
+        self.assertIsNone(child._position)
+        self.assertIsNotNone(grandchild._position)
+        self.assertEqual(grandchild.position.n, 2)
+
+        # a new leaf below the grandchild replays one move, not three.
+        leaf = grandchild.maybe_add_child(19)
+        with mock.patch.object(go.Position, 'play_move', autospec=True,
+                               side_effect=go.Position.play_move) as play_move:
+            self.assertEqual(leaf.position.n, 3)
+        self.assertEqual(play_move.call_count, 1)
+
+    def test_do_not_explore_past_finish(self):
+        probs = np.array([0.02] * (go.N * go.N + 1), dtype=np.float32)
+        root = LazyMCTSNode(go.Position())
+        root.select_leaf().incorporate_results(probs, 0, root)
+        first_pass = root.maybe_add_child(coords.to_flat(None))
+        first_pass.incorporate_results(probs, 0, root)
+        second_pass = first_pass.maybe_add_child(coords.to_flat(None))
+        self.assertTrue(second_pass.is_done())
+        self.assertTrue(second_pass.position.is_game_over())
+        with self.assertRaises(AssertionError):
+            second_pass.incorporate_results(probs, 0, root)
@@ -0,0 +1,111 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+import go
+from tests import test_utils
+from tests.test_mcts import SEND_TWO_RETURN_ONE
+from tests.test_strategies import DummyNet
+
+from mcts import MCTSNode
+from mcts_array import ArrayTree
+from strategies import MCTSPlayerMixin
+
+
+def random_probs(seed):
+    probs = np.random.RandomState(seed).random_sample(
+        [go.N * go.N + 1]).astype(np.float32)
+    return probs / probs.sum()
+
+
+class TestArrayTree(test_utils.MiniGoUnitTest):
+    def test_matches_mcts_node(self):
+        eager = MCTSNode(SEND_TWO_RETURN_ONE)
+        # a small capacity exercises growing the arrays.
+        tree = ArrayTree(SEND_TWO_RETURN_ONE, capacity=4)
+        root = tree.root
+        for i in range(60):
+            leaves = []
+            for j in range(3):
+                eager_leaf = eager.select_leaf()
+                array_leaf = root.select_leaf()
+                self.assertEqual(eager_leaf.fmove, array_leaf.fmove)
+                if eager_leaf.is_done():
+                    value = 1 if eager_leaf.position.score() > 0 else -1
+                    eager_leaf.backup_value(value, up_to=eager)
+                    array_leaf.backup_value(value, up_to=root)
+                    continue
+                eager_leaf.add_virtual_loss(up_to=eager)
+                array_leaf.add_virtual_loss(up_to=root)
+                leaves.append((eager_leaf, array_leaf))
+            for eager_leaf, array_leaf in leaves:
+                probs = random_probs(i)
+                value = (i % 5 - 2) * 0.3
+                eager_leaf.revert_virtual_loss(up_to=eager)
+                array_leaf.revert_virtual_loss(up_to=root)
+                eager_leaf.incorporate_results(probs, value, up_to=eager)
+                array_leaf.incorporate_results(probs, value, up_to=root)
+        self.assertEqual(eager.N, root.N)
+        self.assertAlmostEqual(eager.Q, root.Q, places=5)
+        self.assertEqualNPArray(eager.child_N, root.child_N)
+        np.testing.assert_allclose(eager.child_W, root.child_W, atol=1e-5)
+        # the paths end with a Q, which may differ in float rounding.
+        self.assertEqual(eager.most_visited_path().split('Q:')[0],
+                         root.most_visited_path().split('Q:')[0])
+        self.assertNoPendingVirtualLosses(root)
+
+    def test_handles_are_cached(self):
+        root = ArrayTree(go.Position()).root
+        child = root.maybe_add_child(17)
+        self.assertIs(child, root.maybe_add_child(17))
+        self.assertIs(child.parent, root)
+        self.assertIs(root.children[17], child)
+        self.assertEqual(child.fmove, 17)
+        self.assertIsNone(root.fmove)
+        self.assertEqual(child.position.n, 1)
+
+    def test_promote_to_root(self):
+        probs = random_probs(1)
+        root = ArrayTree(go.Position()).root
+        for i in range(30):
+            root.select_leaf().incorporate_results(probs, 0.1, up_to=root)
+        fmove = int(np.argmax(root.child_N))
+        child = root.maybe_add_child(fmove)
+        N, child_N = child.N, np.copy(child.child_N)
+        grandchildren = sorted(child.children)
+
+        new_root = child.promote_to_root()
+        tree = new_root.tree
+        self.assertEqual(new_root.N, N)
+        self.assertEqual(new_root.fmove, fmove)
+        self.assertEqualNPArray(new_root.child_N, child_N)
+        self.assertEqual(sorted(new_root.children), grandchildren)
+        self.assertEqual(tree.num_nodes, 2 + int(np.sum(
+            [len(c) for c in tree.children[1:]])))
+        for grandchild in new_root.children.values():
+            self.assertIs(grandchild.parent, new_root)
+        # search continues from the compacted tree.
+        new_root.select_leaf().incorporate_results(probs, 0.1, up_to=new_root)
+        self.assertEqual(new_root.N, N + 1)
+
+    def test_player_with_array_tree(self):
+        player = MCTSPlayerMixin(DummyNet(), array_tree=True,
+                                 simulations_per_move=20)
+        player.initialize_game()
+        for i in range(10):
+            move = player.suggest_move(player.root.position)
+            self.assertTrue(player.play_move(move))
+        self.assertEqual(player.root.position.n, 10)
+        self.assertNoPendingVirtualLosses(player.root)
@@ -15,6 +15,7 @@
 import itertools
 import tensorflow as tf
 import numpy as np
+import os
 import tempfile
 
 import coords
@@ -38,10 +39,11 @@ class TestPreprocessing(test_utils.MiniGoUnitTest):
             raw_data.append((feature, pi, value))
         return raw_data
 
-    def extract_data(self, tf_record, filter_amount=1):
+    def extract_data(self, tf_record, filter_amount=1, packed=False):
         pos_tensor, label_tensors = preprocessing.get_input_tensors(
             1, [tf_record], num_repeats=1, shuffle_records=False,
-            shuffle_examples=False, filter_amount=filter_amount)
+            shuffle_examples=False, filter_amount=filter_amount,
+            packed=packed)
         recovered_data = []
         with tf.Session() as sess:
             while True:
@@ -79,6 +81,24 @@ class TestPreprocessing(test_utils.MiniGoUnitTest):
 
         self.assertEqualData(raw_data, recovered_data)
 
+    def test_packed_round_trip(self):
+        np.random.seed(1)
+        raw_data = self.create_random_data(10)
+        x, pis, values = map(np.array, zip(*raw_data))
+        records = preprocessing.pack_examples(x, pis, values)
+        # values are stored as float32, like the outcome of tf.Examples.
+        raw_data = [(f, pi, np.float32(value)) for f, pi, value in raw_data]
+
+        with tempfile.NamedTemporaryFile() as f:
+            preprocessing.write_packed_examples(f.name, records)
+            recovered_data = self.extract_data(f.name, packed=True)
+            mapped = preprocessing.read_packed_examples(f.name)
+            self.assertEqualNPArray(
+                preprocessing.unpack_features(mapped['x']), x)
+            self.assertEqualNPArray(mapped['pi'], pis)
+
+        self.assertEqualData(raw_data, recovered_data)
+
     def test_filter(self):
         raw_data = self.create_random_data(100)
         tfexamples = list(map(preprocessing.make_tf_example, *zip(*raw_data)))
@@ -123,6 +143,62 @@ class TestPreprocessing(test_utils.MiniGoUnitTest):
 
         self.assertEqualData(original_data, recovered_data)
 
+    def test_stream_shuffle_to_chunks(self):
+        np.random.seed(1)
+        raw_data = self.create_random_data(10)
+        tfexamples = list(map(preprocessing.make_tf_example, *zip(*raw_data)))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            start_files = [os.path.join(tmpdir, 'start-%d' % i)
+                           for i in range(2)]
+            preprocessing.write_tf_examples(start_files[0], tfexamples[:6])
+            preprocessing.write_tf_examples(start_files[1], tfexamples[6:])
+            # a buffer smaller than a file still sees every example once.
+            examples = preprocessing.stream_shuffle_tf_examples(
+                start_files, buffer_size=3, seed=1)
+            pattern = os.path.join(tmpdir, 'chunk-{}')
+            num_written = preprocessing.write_tf_example_chunks(
+                pattern, examples, chunk_size=4)
+            self.assertEqual(num_written, 10)
+
+            # 2 chunks of 4, 1 incomplete chunk of 2.
+            chunks = [self.extract_data(pattern.format(i)) for i in range(3)]
+            self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 2])
+            self.assertFalse(os.path.exists(pattern.format(3)))
+            original_data = self.extract_data(start_files[0]) + \
+                self.extract_data(start_files[1])
+            recovered_data = list(itertools.chain.from_iterable(chunks))
+
+        def sort_key(nparray_tuple): return nparray_tuple[2]
+        self.assertEqualData(sorted(original_data, key=sort_key),
+                             sorted(recovered_data, key=sort_key))
+
+    def test_stream_shuffle_to_packed_chunks(self):
+        np.random.seed(1)
+        raw_data = self.create_random_data(10)
+        tfexamples = list(map(preprocessing.make_tf_example, *zip(*raw_data)))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            start_file = os.path.join(tmpdir, 'start')
+            preprocessing.write_tf_examples(start_file, tfexamples)
+            examples = preprocessing.stream_shuffle_tf_examples(
+                [start_file], buffer_size=3, seed=1)
+            pattern = os.path.join(tmpdir, 'chunk-{}.packed')
+            num_written = preprocessing.write_packed_example_chunks(
+                pattern, examples, chunk_size=4)
+            self.assertEqual(num_written, 10)
+
+            chunks = [self.extract_data(pattern.format(i), packed=True)
+                      for i in range(3)]
+            self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 2])
+            self.assertFalse(os.path.exists(pattern.format(3)))
+            original_data = self.extract_data(start_file)
+            recovered_data = list(itertools.chain.from_iterable(chunks))
+
+        def sort_key(nparray_tuple): return nparray_tuple[2]
+        self.assertEqualData(sorted(original_data, key=sort_key),
+                             sorted(recovered_data, key=sort_key))
+
     def test_make_dataset_from_sgf(self):
         with tempfile.NamedTemporaryFile() as sgf_file, \
                 tempfile.NamedTemporaryFile() as record_file:
@@ -0,0 +1,126 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import numpy as np
+
+import features
+import go
+import preprocessing
+from replay_buffer import ReplayBuffer
+from tests import test_utils
+
+
+def random_examples(num_examples, value):
+    x = np.random.randint(0, 2, size=[
+        num_examples, go.N, go.N, features.NEW_FEATURES_PLANES]).astype(np.uint8)
+    pis = np.random.random([num_examples, go.N * go.N + 1]).astype(np.float32)
+    return x, pis, np.full([num_examples], value, dtype=np.float32)
+
+
+def write_selfplay_file(selfplay_dir, model_dir, name, num_examples, value):
+    os.makedirs(os.path.join(selfplay_dir, model_dir), exist_ok=True)
+    filename = os.path.join(selfplay_dir, model_dir, name + '.tfrecord.zz')
+    preprocessing.write_tf_examples(filename, [
+        preprocessing.make_tf_example(*example)
+        for example in zip(*random_examples(num_examples, value))])
+    return filename
+
+
+class TestReplayBuffer(test_utils.MiniGoUnitTest):
+    def setUp(self):
+        np.random.seed(1)
+        super().setUp()
+
+    def test_sample_round_trip(self):
+        buffer = ReplayBuffer(capacity=10, generations=2)
+        x, pis, values = random_examples(1, 0.5)
+        buffer.add_examples(x, pis, values, generation=1)
+        sampled_x, sampled_pis, sampled_values = buffer.sample(3)
+        self.assertEqual(sampled_x.dtype, np.float32)
+        for i in range(3):
+            self.assertEqualNPArray(sampled_x[i], x[0])
+            self.assertEqualNPArray(sampled_pis[i], pis[0])
+            self.assertEqual(sampled_values[i], 0.5)
+
+    def test_window_of_generations(self):
+        buffer = ReplayBuffer(capacity=10, generations=2)
+        for generation in range(3):
+            buffer.add_examples(*random_examples(3, generation),
+                                generation=generation)
+        # generation 0 is still in the ring, but too old to sample.
+        self.assertEqual(len(buffer), 6)
+        _, _, values = buffer.sample(100)
+        self.assertEqual(set(values), {1, 2})
+
+    def test_ring_overwrites_oldest(self):
+        buffer = ReplayBuffer(capacity=10, generations=5)
+        buffer.add_examples(*random_examples(8, 0), generation=0)
+        buffer.add_examples(*random_examples(4, 1), generation=1)
+        self.assertEqual(len(buffer), 10)
+        self.assertEqual(sorted(buffer.records['outcome']), [0] * 6 + [1] * 4)
+        # more examples than fit are subsampled uniformly.
+        x, pis, _ = random_examples(1000, 0)
+        values = np.arange(1000, dtype=np.float32)
+        buffer.add_examples(x, pis, values, generation=2)
+        self.assertEqualNPArray(buffer.generation, [2] * 10)
+        self.assertEqual(len(set(buffer.records['outcome'])), 10)
+        self.assertLess(buffer.records['outcome'].min(), 990)
+
+    def test_ingest(self):
+        buffer = ReplayBuffer(capacity=100, generations=2)
+        with tempfile.TemporaryDirectory() as selfplay_dir:
+            old = write_selfplay_file(selfplay_dir, '000001-old', 'a', 3, 1)
+            write_selfplay_file(selfplay_dir, '000002-mid', 'a', 2, 2)
+            write_selfplay_file(selfplay_dir, '000003-new', 'a', 2, 3)
+            write_selfplay_file(selfplay_dir, '000003-new', 'b', 2, 3)
+            # generation 1 is outside the window, so it is not read.
+            self.assertEqual(buffer.ingest(selfplay_dir, files_per_batch=1), 6)
+            self.assertEqual(sorted(buffer.records['outcome'][:6]),
+                             [2, 2, 3, 3, 3, 3])
+            self.assertEqual(len(buffer.ingested), 3)
+            self.assertNotIn(old, buffer.ingested)
+
+            # only new files are read, and files of generations that left
+            # the window are forgotten.
+            self.assertEqual(buffer.ingest(selfplay_dir), 0)
+            write_selfplay_file(selfplay_dir, '000004-next', 'a', 1, 4)
+            self.assertEqual(buffer.ingest(selfplay_dir), 1)
+            self.assertEqual(len(buffer), 5)
+            self.assertEqual(
+                sorted(os.path.basename(os.path.dirname(filename))
+                       for filename in buffer.ingested),
+                ['000003-new', '000003-new', '000004-next'])
+
+    def test_empty_buffer(self):
+        buffer = ReplayBuffer(capacity=10, generations=2)
+        with self.assertRaises(ValueError):
+            buffer.get_input_tensors(batch_size=4)
+
+    def test_save_restore(self):
+        buffer = ReplayBuffer(capacity=10, generations=2)
+        buffer.add_examples(*random_examples(4, 1), generation=3)
+        buffer.ingested.add('000003-name/game.tfrecord.zz')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'replay.npz')
+            buffer.save(filename)
+            restored = ReplayBuffer.restore(filename, 10, 2)
+            # a different capacity starts over.
+            resized = ReplayBuffer.restore(filename, 20, 2)
+        self.assertEqualNPArray(restored.records['x'], buffer.records['x'])
+        self.assertEqualNPArray(restored.generation, buffer.generation)
+        self.assertEqual(restored.next, 4)
+        self.assertEqual(restored.ingested, buffer.ingested)
+        self.assertEqual(len(resized), 0)
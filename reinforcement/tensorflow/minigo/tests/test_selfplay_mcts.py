@@ -0,0 +1,105 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest.mock as mock
+
+import go
+from tests import test_utils
+from tests.test_strategies import DummyNet
+from selfplay_mcts import BatchedSelfplay
+
+
+class RecordingNet(DummyNet):
+    '''A DummyNet that records the size of every run_many call.'''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batch_sizes = []
+
+    def run_many(self, positions):
+        self.batch_sizes.append(len(positions))
+        return super().run_many(positions)
+
+
+class TestBatchedSelfplay(test_utils.MiniGoUnitTest):
+    def setUp(self):
+        # black always loses, so every game resigns before its first move.
+        self.net = RecordingNet(fake_value=-0.99)
+        # and none of them has resigning disabled.
+        patcher = mock.patch('random.random', return_value=0.5)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_driver(self, **kwargs):
+        return BatchedSelfplay(self.net, readouts=16, resign_threshold=0.9,
+                               eval_cache_size=0, **kwargs)
+
+    def test_games_share_batches(self):
+        driver = self.make_driver(games_in_flight=3, num_parallel=4)
+        players = list(driver.play(3))
+
+        self.assertEqual(len(players), 3)
+        # every call evaluates up to 4 leaves from each of the 3 games.
+        self.assertEqual(self.net.batch_sizes[0], 12)
+        self.assertEqual(max(self.net.batch_sizes), 12)
+        for player in players:
+            self.assertEqual(player.result, go.WHITE)
+            self.assertEqual(player.result_string, 'W+R')
+            self.assertGreaterEqual(player.root.N, 16)
+
+    def test_splits_batches(self):
+        driver = self.make_driver(games_in_flight=3, num_parallel=4,
+                                  batch_size=5)
+        list(driver.play(3))
+
+        self.assertEqual(max(self.net.batch_sizes), 5)
+        # 12 positions are split into 5 + 5 + 2.
+        self.assertIn(2, self.net.batch_sizes)
+        self.assertEqual(sum(self.net.batch_sizes), driver.positions_evaluated)
+
+    def test_replaces_finished_games(self):
+        driver = self.make_driver(games_in_flight=2, num_parallel=4)
+        new_game = driver._new_game
+        in_flight = []
+
+        def record_new_game():
+            in_flight.append(len(in_flight) - driver.games_finished)
+            return new_game()
+
+        driver._new_game = record_new_game
+        players, calls = [], []
+        for player in driver.play(5):
+            players.append(player)
+            calls.append(len(self.net.batch_sizes))
+
+        self.assertEqual(len(players), 5)
+        self.assertEqual(len(set(map(id, players))), 5)
+        self.assertEqual(driver.games_finished, 5)
+        # games ended while more were left to play were replaced, but never
+        # more than 2 games were in flight.
+        self.assertEqual(len(in_flight), 5)
+        self.assertEqual(in_flight[:2], [0, 1])
+        self.assertLess(max(in_flight), 2)
+        # finished games are retired, so nothing is evaluated after the last.
+        self.assertEqual(calls[-1], len(self.net.batch_sizes))
+
+    def test_counters(self):
+        driver = self.make_driver(games_in_flight=2)
+        list(driver.play(2))
+
+        self.assertEqual(driver.games_finished, 2)
+        self.assertEqual(driver.positions_evaluated,
+                         sum(self.net.batch_sizes))
+        self.assertGreater(driver.games_per_hour(), 0)
+        self.assertGreater(driver.positions_per_sec(), 0)
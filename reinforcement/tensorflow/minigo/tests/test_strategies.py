@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
 import unittest
 import unittest.mock as mock
 import numpy as np
@@ -111,6 +112,47 @@ class TestMCTSPlayerMixin(test_utils.MiniGoUnitTest):
             # but we should have used at least 95% of our time by the end.
             self.assertGreater(total_time_spent, time_limit * 0.95)
 
+    def test_lazy_positions_game(self):
+        player = MCTSPlayerMixin(DummyNet(), lazy_positions=True,
+                                 simulations_per_move=20)
+        player.initialize_game()
+        for i in range(10):
+            move = player.suggest_move(player.root.position)
+            self.assertTrue(player.play_move(move))
+        self.assertEqual(player.root.position.n, 10)
+        self.assertEqual(len(player.searches_pi), 10)
+        # an illegal move is rejected without changing the root.
+        root = player.root
+        occupied = player.root.position.recent[-1].move
+        self.assertFalse(player.play_move(occupied))
+        self.assertIs(player.root, root)
+
+    def test_tree_reuse(self):
+        # peaked priors, so that both players explore the same replies.
+        probs = np.random.RandomState(1).random_sample(go.N * go.N + 1) ** 8
+        net = DummyNet(fake_priors=probs / probs.sum())
+        black = MCTSPlayerMixin(net, two_player_mode=True,
+                                simulations_per_move=30)
+        white = MCTSPlayerMixin(net, two_player_mode=True,
+                                simulations_per_move=30)
+        fresh = MCTSPlayerMixin(net, two_player_mode=True,
+                                simulations_per_move=30, reuse_tree=False)
+        for player in (black, white, fresh):
+            player.initialize_game()
+        for i in range(6):
+            active = white if i % 2 else black
+            move = active.suggest_move(active.root.position)
+            for player in (black, white, fresh):
+                self.assertTrue(player.play_move(move))
+        self.assertEqual(len(black.reused_readouts), 6)
+        # black searched white's replies, so keeps readouts after them.
+        self.assertGreater(black.reused_readouts[1], 0)
+        self.assertGreater(white.reused_readouts[2], 0)
+        self.assertEqual(fresh.reused_readouts, [0] * 6)
+        self.assertIsNone(black.root.parent.parent)
+        self.assertEqual(black.root.position.n, 6)
+        self.assertNoPendingVirtualLosses(black.root)
+
     def test_inject_noise(self):
         player = initialize_basic_player()
         sum_priors = np.sum(player.root.child_prior)
@@ -203,6 +245,42 @@ class TestMCTSPlayerMixin(test_utils.MiniGoUnitTest):
         # no virtual losses should be pending
         self.assertNoPendingVirtualLosses(player.root)
 
+    def test_pipelined_tree_search(self):
+        player = initialize_almost_done_player()
+        # the next batch is selected while the previous one is evaluated, so
+        # the first batches pile onto the unexpanded root.
+        player.pipelined_tree_search(40, num_parallel=4)
+        self.assertGreaterEqual(player.root.N, 40)
+        flattened = coords.to_flat(coords.from_kgs('D9'))
+        self.assertEqual(np.argmax(player.root.child_N), flattened)
+        self.assertGreater(player.root.children[flattened].Q, 0)
+        # nothing is left in flight
+        self.assertNoPendingVirtualLosses(player.root)
+
+    def test_pipelined_game(self):
+        player = MCTSPlayerMixin(DummyNet(), pipelined=True,
+                                 simulations_per_move=20)
+        player.initialize_game()
+        for i in range(10):
+            readouts = player.root.N
+            move = player.suggest_move(player.root.position)
+            self.assertGreaterEqual(player.root.N, readouts + 20)
+            self.assertNoPendingVirtualLosses(player.root)
+            self.assertTrue(player.play_move(move))
+        self.assertEqual(player.root.position.n, 10)
+
+    def test_pipelined_timed_search(self):
+        player = MCTSPlayerMixin(DummyNet(), pipelined=True,
+                                 seconds_per_move=0.2)
+        player.initialize_game()
+        with mock.patch.object(player, 'tree_search') as tree_search:
+            start = time.time()
+            player.suggest_move(player.root.position)
+        self.assertLess(time.time() - start, 2)
+        tree_search.assert_not_called()
+        self.assertGreater(player.root.N, 0)
+        self.assertNoPendingVirtualLosses(player.root)
+
     def test_ridiculously_parallel_tree_search(self):
         player = initialize_almost_done_player()
         # Test that an almost complete game
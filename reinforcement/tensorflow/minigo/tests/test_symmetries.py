@@ -86,3 +86,35 @@ class TestSymmetryOperations(test_utils.MiniGoUnitTest):
                     self.assertEqual(
                         old_coord,
                         transformed_board[coords.from_flat(new_coord)])
+
+    def test_batched_symmetries(self):
+        feats = np.random.random([8, go.N, go.N, 3])
+        pis = np.random.random([8, go.N ** 2 + 1])
+        syms = symmetries.SYMMETRIES
+        batched_f = symmetries.apply_symmetries_feat(syms, feats)
+        batched_pi = symmetries.apply_symmetries_pi(syms, pis)
+        inverted_pi = symmetries.invert_symmetries_pi(syms, pis)
+        for i, s in enumerate(syms):
+            with self.subTest(symmetry=s):
+                self.assertEqualNPArray(apply_f(s, feats[i]), batched_f[i])
+                self.assertEqualNPArray(apply_p(s, pis[i]), batched_pi[i])
+                self.assertEqualNPArray(
+                    apply_p(symmetries.invert_symmetry(s), pis[i]),
+                    inverted_pi[i])
+
+    def test_average_symmetries(self):
+        feats = np.random.random([2, go.N, go.N, 3])
+        variants = symmetries.all_symmetries_feat(feats)
+        self.assertEqual(variants.shape, (16, go.N, go.N, 3))
+        for i, s in enumerate(symmetries.SYMMETRIES):
+            self.assertEqualNPArray(apply_f(s, feats[1]), variants[8 + i])
+
+        # an equivariant network: the policy is the first feature plane.
+        pis = np.concatenate([variants[:, :, :, 0].reshape([16, -1]),
+                              np.ones([16, 1])], axis=1)
+        values = np.arange(16)
+        avg_pis, avg_values = symmetries.average_symmetries(pis, values)
+        for i in range(2):
+            expected = np.append(feats[i, :, :, 0].ravel(), 1)
+            np.testing.assert_allclose(expected, avg_pis[i])
+        self.assertEqualNPArray([3.5, 11.5], avg_values)
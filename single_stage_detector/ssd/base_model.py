@@ -140,10 +140,18 @@ class Loss(nn.Module):
         1. Confidence Loss: All labels, with hard negative mining
         2. Localization Loss: Only on positive labels
         Suppose input dboxes has the shape 8732x4
+
+        mining selects how the 3:1 hard negatives are found: "sort" ranks
+        all negatives with two full sorts per image, "topk" takes the
+        largest negative losses with one topk per batch. Both give the
+        same loss, unless losses tie at the cut.
     """
 
-    def __init__(self, dboxes):
+    def __init__(self, dboxes, mining="sort"):
         super(Loss, self).__init__()
+        if mining not in ("sort", "topk"):
+            raise ValueError('Invalid mining chosen')
+        self.mining = mining
         self.scale_xy = 1.0/dboxes.scale_xy
         self.scale_wh = 1.0/dboxes.scale_wh
 
@@ -187,14 +195,25 @@ class Loss(nn.Module):
         # postive mask will never selected
         con_neg = con.clone()
         con_neg[mask] = 0
-        _, con_idx = con_neg.sort(dim=1, descending=True)
-        _, con_rank = con_idx.sort(dim=1)
 
         # number of negative three times positive
         neg_num = torch.clamp(3*pos_num, max=mask.size(1)).unsqueeze(-1)
-        neg_mask = con_rank < neg_num
 
-        closs = (con*(mask.float() + neg_mask.float())).sum(dim=1)
+        if self.mining == "topk":
+            closs = (con*mask.float()).sum(dim=1)
+            k = int(neg_num.max())
+            if k > 0:
+                # the neg_num largest negative losses of each row
+                con_top, _ = con_neg.topk(k, dim=1)
+                rank = torch.arange(k, dtype=torch.long,
+                                    device=con.device).unsqueeze(0)
+                closs = closs + (con_top*(rank < neg_num).float()).sum(dim=1)
+        else:
+            _, con_idx = con_neg.sort(dim=1, descending=True)
+            _, con_rank = con_idx.sort(dim=1)
+            neg_mask = con_rank < neg_num
+
+            closs = (con*(mask.float() + neg_mask.float())).sum(dim=1)
 
         # avoid no object detected
         total_loss = sl1 + closs
@@ -0,0 +1,76 @@
+""" SSDCropping.sample vs sample_sequential: per-sample time, and a check
+    that both draw crops from the same distribution.
+
+    For each ground truth layout, the crops of both samplers are compared
+    with two-sample Kolmogorov-Smirnov statistics on the crop left, top,
+    width and height (keeping the image counted as a 0 x 0 crop at 0, 0),
+    against the 99.9% critical value.
+"""
+import random
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+
+from utils import SSDCropping
+
+
+LAYOUTS = {
+    "one large box": [[0.1, 0.1, 0.9, 0.8]],
+    "small boxes": [[0.40, 0.40, 0.45, 0.46], [0.7, 0.1, 0.74, 0.15],
+                    [0.05, 0.8, 0.1, 0.83]],
+    "many boxes": [[0.1*i, 0.05*i, 0.1*i + 0.15, 0.05*i + 0.3]
+                   for i in range(8)],
+}
+
+
+def parse_args():
+    parser = ArgumentParser(description="Benchmark SSD crop sampling")
+    parser.add_argument('--num-samples', '-n', type=int, default=5000,
+                        help='number of crops drawn from each sampler')
+    parser.add_argument('--seed', '-s', type=int, default=0)
+    return parser.parse_args()
+
+
+def draw(sample, boxes, num_samples):
+    labels = torch.ones(len(boxes), dtype=torch.long)
+    crops = np.zeros((num_samples, 4))
+    start = time.time()
+    for i in range(num_samples):
+        crop, _, _ = sample(torch.tensor(boxes), labels)
+        if crop is not None:
+            left, top, right, bottom = crop
+            crops[i] = (left, top, right - left, bottom - top)
+    return crops, (time.time() - start)/num_samples
+
+
+def ks_statistic(a, b):
+    values = np.sort(np.concatenate([a, b]))
+    cdf_a = np.searchsorted(np.sort(a), values, side="right")/len(a)
+    cdf_b = np.searchsorted(np.sort(b), values, side="right")/len(b)
+    return np.abs(cdf_a - cdf_b).max()
+
+
+def main():
+    args = parse_args()
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    random.seed(args.seed)
+
+    cropping = SSDCropping()
+    n = args.num_samples
+    critical = 1.95*np.sqrt(2.0/n)
+    for name, boxes in sorted(LAYOUTS.items()):
+        seq, seq_time = draw(cropping.sample_sequential, boxes, n)
+        vec, vec_time = draw(cropping.sample, boxes, n)
+        stats = [ks_statistic(seq[:, j], vec[:, j]) for j in range(4)]
+        print("{}: sequential {:.3f} ms, vectorized {:.3f} ms per sample"
+              .format(name, 1e3*seq_time, 1e3*vec_time))
+        print("    KS left/top/width/height: {}, critical value {:.4f}: {}"
+              .format(" ".join("{:.4f}".format(x) for x in stats), critical,
+                      "same" if max(stats) < critical else "DIFFERENT"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+""" CPU images/sec of the coco_eval decode step, decode_batch vs
+    decode_batch_vectorized, on synthetic SSD300 outputs.
+
+    The class logits are scaled so that a realistic number of boxes per
+    class clears the 0.05 score threshold; with --with-model the SSD300
+    forward pass is included, as coco_eval runs it.
+"""
+import time
+from argparse import ArgumentParser
+
+import torch
+
+from train import dboxes300_coco
+from utils import Encoder
+
+
+def parse_args():
+    parser = ArgumentParser(description="Benchmark SSD detection decoding")
+    parser.add_argument('--batch-size', '-b', type=int, default=1,
+                        help='images decoded per call')
+    parser.add_argument('--iterations', '-n', type=int, default=20,
+                        help='number of batches to time')
+    parser.add_argument('--labels', type=int, default=81,
+                        help='number of classes including background')
+    parser.add_argument('--logit-scale', type=float, default=6.0,
+                        help='scale of the random class logits')
+    parser.add_argument('--with-model', action='store_true',
+                        help='include the SSD300 forward pass')
+    parser.add_argument('--seed', '-s', type=int, default=0)
+    return parser.parse_args()
+
+
+def time_decode(decode, inputs, model=None):
+    start = time.time()
+    nimages = 0
+    with torch.no_grad():
+        for img, ploc, plabel in inputs:
+            if model is not None:
+                ploc, plabel = model(img)
+            # scale_back_batch rescales its inputs in place
+            decode(ploc.clone(), plabel.clone(), 0.50, 200)
+            nimages += ploc.size(0)
+    return nimages / (time.time() - start)
+
+
+def main():
+    args = parse_args()
+    torch.manual_seed(args.seed)
+    encoder = Encoder(dboxes300_coco())
+    nboxes = encoder.nboxes
+
+    model = None
+    if args.with_model:
+        from ssd300 import SSD300
+        model = SSD300(args.labels)
+        model.eval()
+
+    inputs = []
+    for _ in range(args.iterations):
+        img = torch.randn(args.batch_size, 3, 300, 300)
+        ploc = 0.5*torch.randn(args.batch_size, 4, nboxes)
+        plabel = args.logit_scale*torch.randn(args.batch_size, args.labels,
+                                              nboxes)
+        inputs.append((img, ploc, plabel))
+
+    for name, decode in [("decode_batch", encoder.decode_batch),
+                         ("decode_batch_vectorized",
+                          encoder.decode_batch_vectorized)]:
+        print("{}: {:.2f} images/sec".format(
+            name, time_decode(decode, inputs, model)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+""" Throughput of SSD target encoding, Encoder.encode per image vs
+    Encoder.encode_batch per collated batch, on synthetic ground truth.
+"""
+import time
+from argparse import ArgumentParser
+
+import torch
+
+from train import dboxes300_coco
+from utils import Encoder
+
+
+def parse_args():
+    parser = ArgumentParser(description="Benchmark SSD target encoding")
+    parser.add_argument('--batch-size', '-b', type=int, default=32,
+                        help='images encoded per batch')
+    parser.add_argument('--iterations', '-n', type=int, default=20,
+                        help='number of batches to time')
+    parser.add_argument('--max-boxes', type=int, default=20,
+                        help='maximum number of ground truth boxes per image')
+    parser.add_argument('--max-num', type=int, default=200,
+                        help='ground truth padding, as in SSDTransformer')
+    parser.add_argument('--cuda', action='store_true',
+                        help='encode batches on the GPU')
+    parser.add_argument('--seed', '-s', type=int, default=0)
+    return parser.parse_args()
+
+
+def random_batch(batch_size, max_boxes, max_num):
+    bboxes = torch.zeros(batch_size, max_num, 4)
+    labels = torch.zeros(batch_size, max_num, dtype=torch.long)
+    for i in range(batch_size):
+        n = int(torch.randint(1, max_boxes + 1, (1,)))
+        lt = 0.8*torch.rand(n, 2)
+        bboxes[i, :n, :2] = lt
+        bboxes[i, :n, 2:] = lt + (1 - lt)*torch.rand(n, 2).clamp(min=0.05)
+        labels[i, :n] = torch.randint(1, 81, (n,))
+    return bboxes, labels
+
+
+def main():
+    args = parse_args()
+    torch.manual_seed(args.seed)
+    encoder = Encoder(dboxes300_coco())
+    batches = [random_batch(args.batch_size, args.max_boxes, args.max_num)
+               for _ in range(args.iterations)]
+    nimages = args.batch_size*args.iterations
+
+    start = time.time()
+    for bboxes, labels in batches:
+        for bbox, label in zip(bboxes, labels):
+            n = int((label > 0).sum())
+            encoder.encode(bbox[:n], label[:n])
+    print("encode: {:.1f} images/sec".format(nimages/(time.time() - start)))
+
+    if args.cuda:
+        batches = [(b.cuda(), l.cuda()) for b, l in batches]
+    start = time.time()
+    for bboxes, labels in batches:
+        encoder.encode_batch(bboxes, labels)
+    if args.cuda:
+        torch.cuda.synchronize()
+    print("encode_batch: {:.1f} images/sec".format(
+        nimages/(time.time() - start)))
+
+
+if __name__ == "__main__":
+    main()
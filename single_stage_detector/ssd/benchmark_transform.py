@@ -0,0 +1,63 @@
+""" Training samples/sec of one data loading worker, with images decoded
+    from JPEG or read from an ImageCache, and with the original or the
+    fused SSDTransformer augmentation.
+"""
+import os
+import random
+import time
+from argparse import ArgumentParser
+
+import torch
+
+from train import dboxes300_coco, open_image_cache
+from utils import COCODetection, SSDTransformer
+
+
+def parse_args():
+    parser = ArgumentParser(description="Benchmark SSD training samples")
+    parser.add_argument('--data', '-d', type=str, default='/coco',
+                        help='path to test and training data files')
+    parser.add_argument('--image-cache', type=str, default=None,
+                        help='directory of the val2017 image cache, built '
+                             'if missing')
+    parser.add_argument('--image-cache-size', type=int, default=None,
+                        help='longest side of cached images')
+    parser.add_argument('--num-samples', '-n', type=int, default=500,
+                        help='number of samples to time')
+    parser.add_argument('--seed', '-s', type=int, default=0)
+    return parser.parse_args()
+
+
+def time_samples(coco, indices):
+    start = time.time()
+    for idx in indices:
+        coco[idx]
+    return len(indices) / (time.time() - start)
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    dboxes = dboxes300_coco()
+    coco = COCODetection(os.path.join(args.data, "val2017"),
+                         os.path.join(args.data,
+                                      "annotations/instances_val2017.json"))
+    indices = random.sample(range(len(coco)), min(args.num_samples,
+                                                  len(coco)))
+    configs = [("jpeg", None, False)]
+    if args.image_cache is not None:
+        cache = open_image_cache(coco, args.image_cache,
+                                 args.image_cache_size)
+        configs += [("cache", cache, False), ("cache, fused", cache, True)]
+
+    for name, cache, fused in configs:
+        coco.image_cache = cache
+        coco.transform = SSDTransformer(dboxes, (300, 300), val=False,
+                                        fused=fused)
+        print("{}: {:.1f} samples/sec".format(name,
+                                              time_samples(coco, indices)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+""" voc_eval per class vs voc_eval_all on synthetic PASCAL VOC annotations
+    and detections: checks that the results are identical and times both.
+"""
+import os
+import shutil
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from eval import voc_eval, voc_eval_all
+
+
+CLASSES = ["aeroplane", "bicycle", "bird", "boat", "bottle", "bus", "car",
+           "cat", "chair", "cow"]
+
+
+def parse_args():
+    parser = ArgumentParser(description="Benchmark VOC AP evaluation")
+    parser.add_argument('--images', type=int, default=1000,
+                        help='number of synthetic images')
+    parser.add_argument('--dets-per-image', type=int, default=50,
+                        help='detections per image over all classes')
+    parser.add_argument('--seed', '-s', type=int, default=0)
+    return parser.parse_args()
+
+
+def random_box(rng):
+    x, y = rng.randint(1, 400, size=2)
+    w, h = rng.randint(5, 100, size=2)
+    return [x, y, x + w, y + h]
+
+
+def write_dataset(root, rng, num_images, dets_per_image):
+    annopath = os.path.join(root, "{}.xml")
+    names = ["{:06d}".format(i) for i in range(num_images)]
+    with open(os.path.join(root, "images.txt"), "w") as f:
+        f.write("\n".join(names) + "\n")
+
+    dets = {c: [] for c in CLASSES}
+    for name in names:
+        objects = []
+        for _ in range(rng.randint(0, 6)):
+            cls = CLASSES[rng.randint(len(CLASSES))]
+            box = random_box(rng)
+            objects.append(
+                "<object><name>{}</name><pose>Unspecified</pose>"
+                "<truncated>0</truncated><difficult>{}</difficult><bndbox>"
+                "<xmin>{}</xmin><ymin>{}</ymin><xmax>{}</xmax><ymax>{}</ymax>"
+                "</bndbox></object>".format(cls, int(rng.rand() < 0.1), *box))
+            # a few detections near each object, some duplicates
+            for _ in range(rng.randint(0, 3)):
+                jitter = rng.randint(-5, 6, size=4)
+                dets[cls].append((name, rng.rand(),
+                                  [b + j for b, j in zip(box, jitter)]))
+        with open(annopath.format(name), "w") as f:
+            f.write("<annotation>{}</annotation>".format("".join(objects)))
+        for _ in range(dets_per_image):
+            cls = CLASSES[rng.randint(len(CLASSES))]
+            dets[cls].append((name, rng.rand(), random_box(rng)))
+
+    detpath = os.path.join(root, "det_{}.txt")
+    for cls, lines in dets.items():
+        with open(detpath.format(cls), "w") as f:
+            for name, score, box in lines:
+                f.write("{} {:.6f} {:.1f} {:.1f} {:.1f} {:.1f}\n".format(
+                    name, score, *box))
+    return detpath, annopath.replace("{}", "%s")
+
+
+def main():
+    args = parse_args()
+    rng = np.random.RandomState(args.seed)
+    root = tempfile.mkdtemp()
+    try:
+        detpath, annopath = write_dataset(root, rng, args.images,
+                                          args.dets_per_image)
+        imagesetfile = os.path.join(root, "images.txt")
+        cachedir = os.path.join(root, "cache")
+
+        # fill the annotation cache first, which both use
+        voc_eval(detpath, annopath, imagesetfile, CLASSES[0], cachedir)
+
+        start = time.time()
+        expected = {c: voc_eval(detpath, annopath, imagesetfile, c, cachedir)
+                    for c in CLASSES}
+        serial = time.time() - start
+
+        start = time.time()
+        results = voc_eval_all(detpath, annopath, imagesetfile, CLASSES,
+                               cachedir)
+        vectorized = time.time() - start
+
+        for c in CLASSES:
+            rec, prec, ap = expected[c]
+            assert np.array_equal(rec, results[c][0]), c
+            assert np.array_equal(prec, results[c][1]), c
+            assert ap == results[c][2], c
+        print("identical APs, mAP {:.4f}".format(
+            np.mean([expected[c][2] for c in CLASSES])))
+        print("voc_eval: {:.2f} s, voc_eval_all: {:.2f} s".format(
+            serial, vectorized))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
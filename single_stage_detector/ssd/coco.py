@@ -355,6 +355,45 @@ class COCO:
         res.createIndex()
         return res
 
+    def loadBboxRes(self, data):
+        """
+        Load bbox results from a numpy array [Nx7] of {imageID,x1,y1,w,h,score,class}
+        rows, as loadRes does for bbox results but faster: the columns are
+        converted in one pass, categories are shared rather than deep-copied
+        and no segmentation polygons are made, since bbox evaluation does not
+        use them.
+        :param   data (numpy.ndarray) : detections
+        :return: res (obj)            : result api object
+        """
+        res = COCO()
+        res.dataset['images'] = [img for img in self.dataset['images']]
+        res.dataset['categories'] = self.dataset['categories']
+
+        print('Loading and preparing results...')
+        tic = time.time()
+        assert(type(data) == np.ndarray and data.shape[1] == 7)
+        img_ids = data[:, 0].astype(np.int64)
+        assert np.isin(img_ids, self.getImgIds()).all(), \
+               'Results do not correspond to current coco set'
+        cat_ids = data[:, 6].astype(np.int64).tolist()
+        bboxes = data[:, 1:5].tolist()
+        areas = (data[:, 3]*data[:, 4]).tolist()
+        scores = data[:, 5].tolist()
+        res.dataset['annotations'] = [{
+            'image_id'   : img_id,
+            'bbox'       : bb,
+            'score'      : score,
+            'category_id': cat_id,
+            'area'       : area,
+            'id'         : id+1,
+            'iscrowd'    : 0,
+            } for id, (img_id, bb, score, cat_id, area) in enumerate(
+                zip(img_ids.tolist(), bboxes, scores, cat_ids, areas))]
+        print('DONE (t={:0.2f}s)'.format(time.time()- tic))
+
+        res.createIndex()
+        return res
+
     def download(self, tarDir = None, imgIds = [] ):
         '''
         Download COCO images from mscoco.org server.
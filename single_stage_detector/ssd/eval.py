@@ -86,29 +86,11 @@ cachedir: Directory for caching the annotations
 # assumes imagesetfile is a text file with each line an image name
 # cachedir caches the annotations in a pickle file
 # first load gt
-    if not os.path.isdir(cachedir):
-        os.mkdir(cachedir)
-    cachefile = os.path.join(cachedir, 'annots.pkl')
     # read list of images
     with open(imagesetfile, 'r') as f:
         lines = f.readlines()
     imagenames = [x.strip() for x in lines]
-    if not os.path.isfile(cachefile):
-        # load annots
-        recs = {}
-        for i, imagename in enumerate(imagenames):
-            recs[imagename] = parse_rec(annopath % (imagename))
-            if i % 100 == 0:
-                print('Reading annotation for {:d}/{:d}'.format(
-                   i + 1, len(imagenames)))
-        # save
-        print('Saving cached annotations to {:s}'.format(cachefile))
-        with open(cachefile, 'wb') as f:
-            pickle.dump(recs, f)
-    else:
-        # load
-        with open(cachefile, 'rb') as f:
-            recs = pickle.load(f)
+    recs = load_recs(annopath, imagenames, cachedir)
 
     # extract gt objects for this class
     class_recs = {}
@@ -191,3 +173,146 @@ cachedir: Directory for caching the annotations
 
     return rec, prec, ap
 
+
+
+def load_recs(annopath, imagenames, cachedir):
+    """ Annotations of imagenames, cached in cachedir as voc_eval does """
+    if not os.path.isdir(cachedir):
+        os.mkdir(cachedir)
+    cachefile = os.path.join(cachedir, 'annots.pkl')
+    if not os.path.isfile(cachefile):
+        # load annots
+        recs = {}
+        for i, imagename in enumerate(imagenames):
+            recs[imagename] = parse_rec(annopath % (imagename))
+            if i % 100 == 0:
+                print('Reading annotation for {:d}/{:d}'.format(
+                   i + 1, len(imagenames)))
+        # save
+        print('Saving cached annotations to {:s}'.format(cachefile))
+        with open(cachefile, 'wb') as f:
+            pickle.dump(recs, f)
+    else:
+        # load
+        with open(cachefile, 'rb') as f:
+            recs = pickle.load(f)
+    return recs
+
+
+def read_dets(detfile, image_index):
+    """ Image indices, confidences and boxes of the detections in detfile,
+        parsed in one pass, or None if it has none
+    """
+    with open(detfile, 'r') as f:
+        tokens = f.read().split()
+    if not tokens:
+        return None
+    tokens = np.array(tokens).reshape(-1, 6)
+    images = np.array([image_index[x] for x in tokens[:, 0]], dtype=np.int64)
+    return images, tokens[:, 1].astype(float), tokens[:, 2:].astype(float)
+
+
+def voc_eval_all(detpath,
+                 annopath,
+                 imagesetfile,
+                 classnames,
+                 cachedir,
+                 ovthresh=0.5,
+                 use_07_metric=True):
+    """{classname: (rec, prec, ap)} = voc_eval_all(detpath,
+                                               annopath,
+                                               imagesetfile,
+                                               classnames,
+                                               cachedir,
+                                               [ovthresh],
+                                               [use_07_metric])
+Same results as voc_eval for each of classnames, with the annotations
+loaded once for all classes and each class's detections matched with
+array operations instead of one Python iteration per detection.
+"""
+    with open(imagesetfile, 'r') as f:
+        imagenames = [x.strip() for x in f.readlines()]
+    image_index = {name: i for i, name in enumerate(imagenames)}
+    recs = load_recs(annopath, imagenames, cachedir)
+
+    # all ground truth objects, grouped by image
+    objs = [(i, obj) for i, name in enumerate(imagenames)
+            for obj in recs[name]]
+    gt_image = np.array([i for i, _ in objs], dtype=np.int64)
+    gt_name = np.array([obj['name'] for _, obj in objs])
+    gt_bbox = np.array([obj['bbox'] for _, obj in objs],
+                       dtype=float).reshape(-1, 4)
+    gt_difficult = np.array([obj['difficult'] for _, obj in objs],
+                            dtype=bool)
+
+    results = {}
+    for classname in classnames:
+        dets = read_dets(detpath.format(classname), image_index)
+        if dets is None:
+            results[classname] = (-1., -1., -1.)
+            continue
+        images, confidence, BB = dets
+
+        # the class's ground truth, padded to (images, G)
+        sel = gt_name == classname
+        cls_image, cls_bbox, cls_difficult = \
+            gt_image[sel], gt_bbox[sel], gt_difficult[sel]
+        npos = np.sum(~cls_difficult)
+        counts = np.bincount(cls_image, minlength=len(imagenames))
+        G = max(counts.max() if counts.size else 0, 1)
+        starts = np.cumsum(counts) - counts
+        slot = np.arange(cls_image.size) - starts[cls_image]
+        BBGT = np.zeros((len(imagenames), G, 4))
+        BBGT[cls_image, slot] = cls_bbox
+        valid = np.zeros((len(imagenames), G), dtype=bool)
+        valid[cls_image, slot] = True
+        difficult = np.zeros((len(imagenames), G), dtype=bool)
+        difficult[cls_image, slot] = cls_difficult
+
+        # sort by confidence
+        sorted_ind = np.argsort(-confidence)
+        BB = BB[sorted_ind, :]
+        images = images[sorted_ind]
+
+        # overlaps of every detection with its image's ground truth
+        gt = BBGT[images]
+        bb = BB[:, None, :]
+        ixmin = np.maximum(gt[:, :, 0], bb[:, :, 0])
+        iymin = np.maximum(gt[:, :, 1], bb[:, :, 1])
+        ixmax = np.minimum(gt[:, :, 2], bb[:, :, 2])
+        iymax = np.minimum(gt[:, :, 3], bb[:, :, 3])
+        iw = np.maximum(ixmax - ixmin, 0.)
+        ih = np.maximum(iymax - iymin, 0.)
+        inters = iw * ih
+        with np.errstate(divide='ignore', invalid='ignore'):
+            uni = ((bb[:, :, 2] - bb[:, :, 0]) * (bb[:, :, 3] - bb[:, :, 1]) +
+                   (gt[:, :, 2] - gt[:, :, 0]) *
+                   (gt[:, :, 3] - gt[:, :, 1]) - inters)
+            overlaps = inters / uni
+        overlaps[~valid[images]] = -np.inf
+        ovmax = np.max(overlaps, axis=1)
+        jmax = np.argmax(overlaps, axis=1)
+
+        # the first detection to match a non difficult object is a TP, later
+        # ones are FPs; matches of difficult objects are neither
+        nd = images.size
+        with np.errstate(invalid='ignore'):
+            matched = ovmax > ovthresh
+        hit_difficult = matched & difficult[images, jmax]
+        hits = np.flatnonzero(matched & ~hit_difficult)
+        _, first = np.unique(images[hits]*G + jmax[hits], return_index=True)
+        tp = np.zeros(nd)
+        tp[hits[first]] = 1.
+        fp = (~hit_difficult).astype(float) - tp
+
+        # compute precision recall
+        fp = np.cumsum(fp)
+        tp = np.cumsum(tp)
+        rec = tp / float(npos)
+        # avoid divide by zero in case the first detection matches a difficult
+        # ground truth
+        prec = tp / np.maximum(tp + fp, np.finfo(np.float64).eps)
+        ap = voc_ap(rec, prec, use_07_metric)
+        results[classname] = (rec, prec, ap)
+
+    return results
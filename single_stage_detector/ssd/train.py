@@ -1,6 +1,6 @@
 import os
 from argparse import ArgumentParser
-from utils import DefaultBoxes, Encoder, COCODetection
+from utils import DefaultBoxes, Encoder, COCODetection, ImageCache
 from base_model import Loss
 from utils import SSDTransformer
 from ssd300 import SSD300
@@ -8,6 +8,7 @@ import torch
 from torch.autograd import Variable
 from torch.utils.data import DataLoader
 import time
+import multiprocessing
 import numpy as np
 
 
@@ -35,6 +36,29 @@ def parse_args():
     parser.add_argument('--evaluation', nargs='*', type=int,
                         default=[120000, 160000, 180000, 200000, 220000, 240000],
                         help='iterations at which to evaluate')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='directory of memory-mapped annotation caches')
+    parser.add_argument('--image-cache', type=str, default=None,
+                        help='directory of decoded image caches, built on '
+                             'first use')
+    parser.add_argument('--image-cache-size', type=int, default=None,
+                        help='longest side of cached images, default is '
+                             'the original size')
+    parser.add_argument('--fused-augment', action='store_true',
+                        help='use the fused training augmentation')
+    parser.add_argument('--mining', type=str, default='sort',
+                        choices=['sort', 'topk'],
+                        help='hard negative mining of the loss')
+    parser.add_argument('--batch-encode', action='store_true',
+                        help='encode training targets per batch after '
+                             'collation instead of per image in workers')
+    parser.add_argument('--eval-batch-size', type=int, default=32,
+                        help='number of images for each evaluation batch')
+    parser.add_argument('--eval-workers', type=int, default=4,
+                        help='number of data loading workers for evaluation')
+    parser.add_argument('--async-eval', action='store_true',
+                        help='run COCOeval in a background process while '
+                             'training continues')
     return parser.parse_args()
 
 
@@ -56,51 +80,110 @@ def dboxes300_coco():
     return dboxes
 
 
-def coco_eval(model, coco, cocoGt, encoder, inv_map, threshold, use_cuda=True):
-    from pycocotools.cocoeval import COCOeval
-    print("")
+def predict(model, coco, encoder, inv_map, use_cuda=True, batch_size=32,
+            num_workers=4, max_output=200):
+    """ Detections of model on every image of coco as an Nx7 array of
+        {imageID,x1,y1,w,h,score,class} rows, the format COCO.loadBboxRes
+        takes. Images are loaded by a DataLoader and decoded in batches.
+    """
     model.eval()
     if use_cuda:
         model.cuda()
-    ret = []
+    dataloader = DataLoader(coco, batch_size=batch_size, shuffle=False,
+                            num_workers=num_workers)
+    # category id of each label, and room for max_output rows per image
+    cat_ids = np.zeros(max(inv_map) + 1)
+    cat_ids[list(inv_map.keys())] = list(inv_map.values())
+    ret = np.empty((len(coco)*max_output, 7))
+    nret = 0
+    idx = 0
     start = time.time()
-    for idx, image_id in enumerate(coco.img_keys):
-        img, (htot, wtot), _, _ = coco[idx]
-
+    for img, (htot, wtot), _, _ in dataloader:
+        print("Parsing image: {}/{}".format(idx+img.size(0), len(coco)), end="\r")
         with torch.no_grad():
-            print("Parsing image: {}/{}".format(idx+1, len(coco)), end="\r")
-            inp = img.unsqueeze(0)
             if use_cuda:
-                inp = inp.cuda()
-            ploc, plabel = model(inp)
-
-            try:
-                result = encoder.decode_batch(ploc, plabel, 0.50, 200)[0]
-            except:
-                #raise
+                img = img.cuda()
+            ploc, plabel = model(img)
+            results = encoder.decode_batch_vectorized(ploc, plabel, 0.50,
+                                                      max_output)
+
+        sizes = torch.stack([wtot, htot, wtot, htot], dim=1).double().numpy()
+        for i, (loc, label, prob) in enumerate(results):
+            n = loc.size(0)
+            if n == 0:
                 print("")
-                print("No object detected in idx: {}".format(idx))
+                print("No object detected in idx: {}".format(idx + i))
                 continue
-
-            loc, label, prob = [r.cpu().numpy() for r in result]
-            for loc_, label_, prob_ in zip(loc, label, prob):
-                ret.append([image_id, loc_[0]*wtot, \
-                                      loc_[1]*htot,
-                                      (loc_[2] - loc_[0])*wtot,
-                                      (loc_[3] - loc_[1])*htot,
-                                      prob_,
-                                      inv_map[label_]])
+            loc = loc.cpu().double().numpy()*sizes[i]
+            rows = ret[nret:nret + n]
+            rows[:, 0] = coco.img_keys[idx + i]
+            rows[:, 1:3] = loc[:, :2]
+            rows[:, 3:5] = loc[:, 2:] - loc[:, :2]
+            rows[:, 5] = prob.cpu().numpy()
+            rows[:, 6] = cat_ids[label.cpu().numpy()]
+            nret += n
+        idx += img.size(0)
     print("")
-    print("Predicting Ended, total time: {:.2f} s".format(time.time()-start))
+    elapsed = time.time() - start
+    print("Predicting Ended, total time: {:.2f} s, {:.1f} images/sec"
+          .format(elapsed, len(coco)/elapsed))
+    return ret[:nret]
+
 
-    cocoDt = cocoGt.loadRes(np.array(ret))
+def compute_map(cocoGt, dets):
+    from pycocotools.cocoeval import COCOeval
+    cocoDt = cocoGt.loadBboxRes(dets)
 
     E = COCOeval(cocoGt, cocoDt, iouType='bbox')
     E.evaluate()
     E.accumulate()
     E.summarize()
-    print("Current AP: {:.5f} AP goal: {:.5f}".format(E.stats[0], threshold))
-    return (E.stats[0] >= threshold) #Average Precision  (AP) @[ IoU=050:0.95 | area=   all | maxDets=100 ]
+    #Average Precision  (AP) @[ IoU=050:0.95 | area=   all | maxDets=100 ]
+    return E.stats[0]
+
+
+def reached_threshold(ap, threshold):
+    print("Current AP: {:.5f} AP goal: {:.5f}".format(ap, threshold))
+    return ap >= threshold
+
+
+def open_image_cache(coco, path, max_size=None):
+    if os.path.isdir(path):
+        return ImageCache(path)
+    print("Building image cache {}...".format(path))
+    start = time.time()
+    cache = ImageCache.build(coco.image_paths(), path, max_size)
+    print("Image cache built, total time: {:.2f} s".format(time.time()-start))
+    return cache
+
+
+def coco_eval(model, coco, cocoGt, encoder, inv_map, threshold, use_cuda=True,
+              batch_size=32, num_workers=4):
+    print("")
+    dets = predict(model, coco, encoder, inv_map, use_cuda, batch_size,
+                   num_workers)
+    return reached_threshold(compute_map(cocoGt, dets), threshold)
+
+
+# cocoGt of the background evaluation process, inherited when it is forked
+# so that it is not pickled for every evaluation
+_eval_coco_gt = None
+
+def _init_eval_process(cocoGt):
+    global _eval_coco_gt
+    _eval_coco_gt = cocoGt
+
+def _compute_map_in_process(dets):
+    return compute_map(_eval_coco_gt, dets)
+
+
+def make_eval_pool(cocoGt):
+    """ A one process pool that runs compute_map on cocoGt with
+        apply_async(_compute_map_in_process, (dets,)), so that training
+        continues while COCOeval runs
+    """
+    ctx = multiprocessing.get_context("fork")
+    return ctx.Pool(1, initializer=_init_eval_process, initargs=(cocoGt,))
 
 
 
@@ -110,7 +193,9 @@ def train300_mlperf_coco(args):
     use_cuda = not args.no_cuda and torch.cuda.is_available()
     dboxes = dboxes300_coco()
     encoder = Encoder(dboxes)
-    train_trans = SSDTransformer(dboxes, (300, 300), val=False)
+    train_trans = SSDTransformer(dboxes, (300, 300), val=False,
+                                 encode=not args.batch_encode,
+                                 fused=args.fused_augment)
     val_trans = SSDTransformer(dboxes, (300, 300), val=True)
 
     val_annotate = os.path.join(args.data, "annotations/instances_val2017.json")
@@ -119,8 +204,17 @@ def train300_mlperf_coco(args):
     train_coco_root = os.path.join(args.data, "train2017")
 
     cocoGt = COCO(annotation_file=val_annotate)
-    val_coco = COCODetection(val_coco_root, val_annotate, val_trans)
-    train_coco = COCODetection(train_coco_root, train_annotate, train_trans)
+    # forked before CUDA is initialized, as the child never uses it
+    eval_pool = make_eval_pool(cocoGt) if args.async_eval else None
+    val_coco = COCODetection(val_coco_root, val_annotate, val_trans,
+                             args.cache_dir)
+    train_coco = COCODetection(train_coco_root, train_annotate, train_trans,
+                               args.cache_dir)
+    if args.image_cache is not None:
+        val_coco.image_cache = open_image_cache(val_coco,
+            os.path.join(args.image_cache, "val2017"), args.image_cache_size)
+        train_coco.image_cache = open_image_cache(train_coco,
+            os.path.join(args.image_cache, "train2017"), args.image_cache_size)
 
     #print("Number of labels: {}".format(train_coco.labelnum))
     train_dataloader = DataLoader(train_coco, batch_size=args.batch_size, shuffle=True, num_workers=4)
@@ -133,7 +227,7 @@ def train300_mlperf_coco(args):
     ssd300.train()
     if use_cuda:
         ssd300.cuda()
-    loss_func = Loss(dboxes)
+    loss_func = Loss(dboxes, args.mining)
     if use_cuda:
         loss_func.cuda()
 
@@ -143,11 +237,20 @@ def train300_mlperf_coco(args):
     iter_num = args.iteration
     avg_loss = 0.0
     inv_map = {v:k for k,v in val_coco.label_map.items()}
+    # mAP of the last evaluation still running in the background
+    pending_map = None
 
     for epoch in range(args.epochs):
 
         for nbatch, (img, img_size, bbox, label) in enumerate(train_dataloader):
 
+            if pending_map is not None and pending_map.ready():
+                print("")
+                if reached_threshold(pending_map.get(), args.threshold):
+                    eval_pool.terminate()
+                    return
+                pending_map = None
+
             if iter_num == 160000:
                 print("")
                 print("lr decay step #1")
@@ -164,6 +267,10 @@ def train300_mlperf_coco(args):
                 img = img.cuda()
             img = Variable(img, requires_grad=True)
             ploc, plabel = ssd300(img)
+            if args.batch_encode:
+                if use_cuda:
+                    bbox, label = bbox.cuda(), label.cuda()
+                bbox, label = encoder.encode_batch(bbox, label)
             trans_bbox = bbox.transpose(1,2).contiguous()
             if use_cuda:
                 trans_bbox = trans_bbox.cuda()
@@ -187,11 +294,30 @@ def train300_mlperf_coco(args):
                     torch.save({"model" : ssd300.state_dict(), "label_map": train_coco.label_info},
                                 "./models/iter_{}.pt".format(iter_num))
 
-                if coco_eval(ssd300, val_coco, cocoGt, encoder, inv_map, args.threshold):
-                    return
+                if eval_pool is None:
+                    if coco_eval(ssd300, val_coco, cocoGt, encoder, inv_map,
+                                 args.threshold, use_cuda,
+                                 args.eval_batch_size, args.eval_workers):
+                        return
+                else:
+                    # evaluations run one at a time
+                    if pending_map is not None and \
+                       reached_threshold(pending_map.get(), args.threshold):
+                        eval_pool.terminate()
+                        return
+                    dets = predict(ssd300, val_coco, encoder, inv_map,
+                                   use_cuda, args.eval_batch_size,
+                                   args.eval_workers)
+                    pending_map = eval_pool.apply_async(
+                        _compute_map_in_process, (dets,))
 
             iter_num += 1
 
+    if pending_map is not None:
+        reached_threshold(pending_map.get(), args.threshold)
+    if eval_pool is not None:
+        eval_pool.close()
+
 def main():
     args = parse_args()
 
@@ -54,6 +54,65 @@ def calc_iou_tensor(box1, box2):
     iou = intersect/(area1 + area2 - intersect)
     return iou
 
+def _intersect_union(box1, box2):
+    """ Intersection and union areas of (G, N, 4) and (G, M, 4) ltrb boxes,
+        each (G, N, M), computed in place so only a few (G, N, M) tensors
+        are allocated
+    """
+    l1, t1, r1, b1 = box1.permute(2, 0, 1).contiguous().unsqueeze(3)
+    l2, t2, r2, b2 = box2.permute(2, 0, 1).contiguous().unsqueeze(2)
+
+    w = torch.min(r1, r2).sub_(torch.max(l1, l2)).clamp_(min=0)
+    h = torch.min(b1, b2).sub_(torch.max(t1, t2)).clamp_(min=0)
+    intersect = w.mul_(h)
+
+    area1 = (r1 - l1)*(b1 - t1)
+    area2 = (r2 - l2)*(b2 - t2)
+    union = (area1 + area2).sub_(intersect)
+    return intersect, union
+
+
+def calc_iou_batch(box1, box2):
+    """ Batched calc_iou_tensor
+        input:
+            box1 (G, N, 4)
+            box2 (G, M, 4)
+        output:
+            IoU (G, N, M)
+    """
+    intersect, union = _intersect_union(box1, box2)
+    return intersect.div_(union)
+
+
+def batched_nms(bboxes, valid, criteria):
+    """ Greedy NMS for G independent groups of boxes at once
+        input:
+            bboxes (G, K, 4), each group sorted by descending score
+            valid (G, K), 1 for real boxes, 0 for padding
+        output:
+            keep (G, K), 1 for the boxes greedy NMS keeps
+
+        Box i is kept iff no kept box before it has IoU >= criteria with it.
+        Starting from all valid boxes kept, applying that rule to every box
+        at once is correct for one more box per round, so iterating it to
+        a fixed point gives exactly the greedy result, usually in a few
+        rounds rather than one per kept box.
+    """
+    K = bboxes.size(1)
+    # suppress[g, j, i] = 1 if box j would suppress box i (j before i),
+    # i.e. not IoU < criteria like decode_single, without dividing
+    intersect, union = _intersect_union(bboxes, bboxes)
+    suppress = (intersect >= union.mul_(criteria)).float().triu_(diagonal=1)
+    keep = valid.float()
+    for _ in range(K):
+        new_keep = valid.float() * \
+            (torch.bmm(keep.unsqueeze(1), suppress).squeeze(1) == 0).float()
+        if torch.equal(new_keep, keep):
+            break
+        keep = new_keep
+    return keep > 0
+
+
 # This function is from https://github.com/kuangliu/pytorch-ssd.
 class Encoder(object):
     """
@@ -114,6 +173,49 @@ class Encoder(object):
         bboxes_out[:, 3] = h
         return bboxes_out, labels_out
 
+    def encode_batch(self, bboxes_in, labels_in, criteria = 0.5):
+        """ Batched encode, for padded ground truth of a whole batch
+            input:
+                bboxes_in (B, N, 4) ltrb, labels_in (B, N), padded at the
+                end with label 0
+            output:
+                bboxes_out (B, 8732, 4) xywh, labels_out (B, 8732)
+
+            Runs wherever bboxes_in is, so it can follow collation on the
+            GPU as well as run in DataLoader workers.
+        """
+        dboxes = self.dboxes.to(bboxes_in.device, bboxes_in.dtype)
+        valid = labels_in > 0
+        # drop the padding no image in the batch needs
+        N = max(int(valid.sum(dim=1).max()), 1)
+        bboxes_in, labels_in, valid = \
+            bboxes_in[:, :N], labels_in[:, :N], valid[:, :N]
+
+        # (B, N, 8732); padding never matches
+        intersect, union = _intersect_union(bboxes_in, dboxes.unsqueeze(0))
+        ious = intersect.div_(union).masked_fill_(~valid.unsqueeze(2), -1.0)
+        best_dbox_ious, best_dbox_idx = ious.max(dim=1)
+        best_bbox_ious, best_bbox_idx = ious.max(dim=2)
+
+        # every ground truth box keeps its best default box, set best ious 2.0
+        img_idx, gt_idx = valid.nonzero().unbind(1)
+        flat_idx = img_idx*self.nboxes + best_bbox_idx[img_idx, gt_idx]
+        best_dbox_ious.view(-1)[flat_idx] = 2.0
+        best_dbox_idx.view(-1)[flat_idx] = gt_idx
+
+        # filter IoU > 0.5
+        masks = best_dbox_ious > criteria
+        labels_out = labels_in.gather(1, best_dbox_idx)
+        labels_out.masked_fill_(~masks, 0)
+        bboxes_out = bboxes_in.gather(
+            1, best_dbox_idx.unsqueeze(2).expand(-1, -1, 4))
+        bboxes_out = torch.where(masks.unsqueeze(2), bboxes_out,
+                                 dboxes.unsqueeze(0))
+        # Transform format to xywh format
+        return torch.cat([0.5*(bboxes_out[:, :, :2] + bboxes_out[:, :, 2:]),
+                          bboxes_out[:, :, 2:] - bboxes_out[:, :, :2]],
+                         dim=2), labels_out
+
     def scale_back_batch(self, bboxes_in, scores_in):
         """
             Do scale and transform from xywh to ltrb
@@ -160,6 +262,54 @@ class Encoder(object):
             #print(output[-1])
         return output
 
+    def decode_batch_vectorized(self, bboxes_in, scores_in, criteria=0.45,
+                                max_output=200, max_num=200, chunk=256):
+        """ Same detections as decode_batch, for the whole batch at once:
+            score threshold, per class top max_num, class-aware NMS and
+            per image top max_output are tensor ops over all images and
+            classes, with no per-box .item() calls. Each image's
+            detections are sorted by descending score.
+
+            chunk bounds how many (image, class) groups NMS runs on at
+            once, since each takes a max_num x max_num IoU matrix.
+        """
+        bboxes, probs = self.scale_back_batch(bboxes_in, scores_in)
+        batch_size, nboxes, nlabels = probs.size()
+
+        # skip background; boxes under the threshold are never candidates
+        scores = probs[:, :, 1:]
+        scores = scores * (scores > 0.05).float()
+        k = min(max_num, nboxes)
+        # (B, k, C) -> (B*C, k), sorted by descending score
+        top_scores, top_idx = scores.topk(k, dim=1)
+        top_scores = top_scores.transpose(1, 2).reshape(-1, k)
+        top_idx = top_idx.transpose(1, 2).reshape(-1, k)
+        valid = top_scores > 0
+        num_valid = valid.sum(dim=1)
+
+        # only groups with candidates, padded to the longest one
+        groups = num_valid.nonzero().view(-1)
+        K = max(int(num_valid.max()), 1)
+        keep = torch.zeros_like(valid)
+        if groups.numel() > 0:
+            for g in groups.split(chunk):
+                image_idx = (g // (nlabels - 1)).unsqueeze(1)
+                group_boxes = bboxes[image_idx, top_idx[g, :K]]
+                keep[g, :K] = batched_nms(group_boxes, valid[g, :K], criteria)
+
+        # per image top max_output over all classes
+        kept_scores = (top_scores * keep.float()).reshape(batch_size, -1)
+        n_out = min(max_output, kept_scores.size(1))
+        out_scores, out_idx = kept_scores.topk(n_out, dim=1)
+        num_out = (out_scores > 0).sum(dim=1).tolist()
+        labels = out_idx // k + 1
+        box_idx = top_idx.reshape(batch_size, -1).gather(1, out_idx)
+        out_bboxes = bboxes.gather(
+            1, box_idx.unsqueeze(2).expand(-1, -1, 4))
+
+        return [(out_bboxes[i, :n], labels[i, :n], out_scores[i, :n])
+                for i, n in enumerate(num_out)]
+
     # perform non-maximum suppression
     def decode_single(self, bboxes_in, scores_in, criteria, max_output, max_num=200):
         # Reference to https://github.com/amdegroot/ssd.pytorch
@@ -292,17 +442,86 @@ class SSDCropping(object):
             (None, None),
         )
 
-    def __call__(self, img, img_size, bboxes, labels):
-       
+    def _tailor(self, crop, masks, bboxes, labels):
+        """ The boxes whose centers are in crop, clipped to it, in crop
+            coordinates
+        """
+        left, top, right, bottom = crop
+        w, h = right - left, bottom - top
+        bboxes[bboxes[:, 0] < left, 0] = left
+        bboxes[bboxes[:, 1] < top, 1] = top
+        bboxes[bboxes[:, 2] > right, 2] = right
+        bboxes[bboxes[:, 3] > bottom, 3] = bottom
+
+        #print(left, top, right, bottom)
+        #print(labels, bboxes, masks)
+        bboxes = bboxes[masks, :]
+        labels = labels[masks]
+
+        bboxes[:, 0] = (bboxes[:, 0] - left)/w
+        bboxes[:, 1] = (bboxes[:, 1] - top)/h
+        bboxes[:, 2] = (bboxes[:, 2] - left)/w
+        bboxes[:, 3] = (bboxes[:, 3] - top)/h
+        return bboxes, labels
+
+    def sample(self, bboxes, labels):
+        """ Draw a crop, as (left, top, right, bottom) scaled to [0, 1] or
+            None to keep the whole image, with the boxes and labels it
+            keeps, in crop coordinates
+
+            Same distribution as sample_sequential: the 50 candidates of a
+            mode are drawn and checked at once, and the first valid one is
+            the crop the sequential loop would have stopped at.
+        """
+        # Ensure always return cropped image
+        while True:
+            mode = random.choice(self.sample_options)
+            
+            if mode is None:
+                return None, bboxes, labels
+
+            min_iou, max_iou = mode
+            min_iou = float("-inf") if min_iou is None else min_iou
+            max_iou = float("+inf") if max_iou is None else max_iou
+
+            # Implementation use 50 iteration to find possible candidate
+            w = 0.3 + 0.7*torch.rand(50)
+            h = 0.3 + 0.7*torch.rand(50)
+            left = (1.0 - w)*torch.rand(50)
+            top = (1.0 - h)*torch.rand(50)
+            crops = torch.stack([left, top, left + w, top + h], dim=1)
+
+            # (nboxes, 50)
+            ious = calc_iou_tensor(bboxes, crops)
+            xc = 0.5*(bboxes[:, 0] + bboxes[:, 2]).unsqueeze(1)
+            yc = 0.5*(bboxes[:, 1] + bboxes[:, 3]).unsqueeze(1)
+            masks = (xc > crops[:, 0]) & (xc < crops[:, 2]) & \
+                    (yc > crops[:, 1]) & (yc < crops[:, 3])
+
+            nboxes = bboxes.size(0)
+            valid = (w/h >= 0.5) & (w/h <= 2) & \
+                    (((ious > min_iou) & (ious < max_iou)).long().sum(0)
+                     == nboxes) & \
+                    (masks.long().sum(0) > 0)
+            valid = valid.nonzero()
+            if valid.numel() == 0:
+                continue
+
+            i = int(valid[0, 0])
+            crop = tuple(crops[i].tolist())
+            bboxes, labels = self._tailor(crop, masks[:, i], bboxes, labels)
+            return crop, bboxes, labels
+
+    def sample_sequential(self, bboxes, labels):
+        """ sample, trying one candidate crop at a time
+        """
         # Ensure always return cropped image
         while True:
             mode = random.choice(self.sample_options)
             
             if mode is None:
-                return img, img_size, bboxes, labels
+                return None, bboxes, labels
 
-            htot, wtot = img_size
-           
             min_iou, max_iou = mode
             min_iou = float("-inf") if min_iou is None else min_iou
             max_iou = float("+inf") if max_iou is None else max_iou
@@ -338,33 +557,31 @@ class SSDCropping(object):
                 # if no such boxes, continue searching again
                 if not masks.any():
                     continue
-                
-                bboxes[bboxes[:, 0] < left, 0] = left
-                bboxes[bboxes[:, 1] < top, 1] = top
-                bboxes[bboxes[:, 2] > right, 2] = right
-                bboxes[bboxes[:, 3] > bottom, 3] = bottom
-
-                #print(left, top, right, bottom)
-                #print(labels, bboxes, masks)
-                bboxes = bboxes[masks, :]
-                labels = labels[masks]
-
-                left_idx = int(left*wtot)
-                top_idx =  int(top*htot)
-                right_idx = int(right*wtot)
-                bottom_idx = int(bottom*htot)
-                #print(left_idx,top_idx,right_idx,bottom_idx)
-                #img = img[:, top_idx:bottom_idx, left_idx:right_idx]
-                img = img.crop((left_idx, top_idx, right_idx, bottom_idx))
-
-                bboxes[:, 0] = (bboxes[:, 0] - left)/w
-                bboxes[:, 1] = (bboxes[:, 1] - top)/h
-                bboxes[:, 2] = (bboxes[:, 2] - left)/w
-                bboxes[:, 3] = (bboxes[:, 3] - top)/h
-
-                htot = bottom_idx - top_idx
-                wtot = right_idx - left_idx
-                return img, (htot, wtot), bboxes, labels
+
+                crop = (left, top, right, bottom)
+                bboxes, labels = self._tailor(crop, masks, bboxes, labels)
+                return crop, bboxes, labels
+
+    def __call__(self, img, img_size, bboxes, labels):
+        crop, bboxes, labels = self.sample(bboxes, labels)
+        if crop is None:
+            return img, img_size, bboxes, labels
+
+        # pixels of the image itself, which may be smaller than img_size
+        # when it comes from a downscaled ImageCache
+        wtot, htot = img.size
+        left, top, right, bottom = crop
+        left_idx = int(left*wtot)
+        top_idx =  int(top*htot)
+        right_idx = int(right*wtot)
+        bottom_idx = int(bottom*htot)
+        #print(left_idx,top_idx,right_idx,bottom_idx)
+        #img = img[:, top_idx:bottom_idx, left_idx:right_idx]
+        img = img.crop((left_idx, top_idx, right_idx, bottom_idx))
+
+        htot = bottom_idx - top_idx
+        wtot = right_idx - left_idx
+        return img, (htot, wtot), bboxes, labels
  
 class ToTensor(object):
     def __init__(self):
@@ -424,23 +641,30 @@ class SSDTransformer(object):
         Flipping
         Jittering
     """
-    def __init__(self, dboxes, size = (300, 300), val=False):
+    def __init__(self, dboxes, size = (300, 300), val=False, encode=True,
+                 fused=False):
 
         # define vgg16 mean 
         self.size = size
         self.val = val
+        # without encode, training samples keep their padded ground truth
+        # like validation ones, for Encoder.encode_batch after collation
+        self.encode = encode
+        # fused training augmentation, see _fused_trans
+        self.fused = fused
 
         self.dboxes_ = dboxes #DefaultBoxes300()
         self.encoder = Encoder(self.dboxes_)
 
         self.crop = SSDCropping()
+        self.color_jitter = transforms.ColorJitter(brightness=0.125,
+            contrast=0.5, saturation=0.5, hue=0.05
+        )
         self.img_trans = transforms.Compose([
             transforms.Resize(self.size),
             #transforms.Resize((300, 300)),
             #transforms.RandomHorizontalFlip(),
-            transforms.ColorJitter(brightness=0.125, contrast=0.5, 
-                saturation=0.5, hue=0.05
-            ),
+            self.color_jitter,
             transforms.ToTensor()
             #LightingNoice(),
         ]) 
@@ -450,6 +674,9 @@ class SSDTransformer(object):
         # https://discuss.pytorch.org/t/how-to-preprocess-input-for-pre-trained-networks/683
         self.normalize = transforms.Normalize(mean=[0.485, 0.456, 0.406],
                                                std=[0.229, 0.224, 0.225])
+        # ToTensor and normalize as one affine map of the uint8 pixels
+        self.mean255 = 255*torch.tensor(self.normalize.mean).view(3, 1, 1)
+        self.std255 = 255*torch.tensor(self.normalize.std).view(3, 1, 1)
         #self.normalize = transforms.Normalize(mean = [104.0, 117.0, 123.0],
         #                                      std = [1.0, 1.0, 1.0])
 
@@ -463,78 +690,247 @@ class SSDTransformer(object):
     def dboxes(self):
         return self.dboxes_
 
+    def _pad(self, bbox, label, max_num):
+        bbox_out = torch.zeros(max_num, 4)
+        label_out =  torch.zeros(max_num, dtype=torch.long)
+        bbox_out[:bbox.size(0), :] = bbox
+        label_out[:label.size(0)] = label
+        return bbox_out, label_out
+
+    def _fused_trans(self, img, img_size, bbox, label):
+        """ Training augmentation with fewer full image passes: the crop is
+            resampled straight to the output size in one PIL resize, flip
+            and jitter then run at the output size, and ToTensor and
+            normalize are one in-place pass
+        """
+        crop, bbox, label = self.crop.sample(bbox, label)
+        box = None
+        if crop is not None:
+            wtot, htot = img.size
+            left, top, right, bottom = crop
+            box = (int(left*wtot), int(top*htot),
+                   int(right*wtot), int(bottom*htot))
+            img_size = (box[3] - box[1], box[2] - box[0])
+        img = img.resize((self.size[1], self.size[0]), Image.BILINEAR, box)
+        img, bbox = self.hflip(img, bbox)
+        img = self.color_jitter(img)
+
+        img = torch.from_numpy(np.array(img, dtype=np.uint8))
+        img = img.permute(2, 0, 1).float().sub_(self.mean255).div_(self.std255)
+        return img.contiguous(), img_size, bbox, label
+
     def __call__(self, img, img_size, bbox=None, label=None, max_num=200):
         #img = torch.tensor(img)
         if self.val:
-            bbox_out = torch.zeros(max_num, 4)
-            label_out =  torch.zeros(max_num, dtype=torch.long)
-            bbox_out[:bbox.size(0), :] = bbox
-            label_out[:label.size(0)] = label
+            bbox_out, label_out = self._pad(bbox, label, max_num)
             return self.trans_val(img), img_size, bbox_out, label_out
    
-        #print("before", img.size, bbox)
-        img, img_size, bbox, label = self.crop(img, img_size, bbox, label)
-        #print("after", img.size, bbox)
-        img, bbox = self.hflip(img, bbox)
+        if self.fused:
+            img, img_size, bbox, label = \
+                self._fused_trans(img, img_size, bbox, label)
+        else:
+            #print("before", img.size, bbox)
+            img, img_size, bbox, label = self.crop(img, img_size, bbox, label)
+            #print("after", img.size, bbox)
+            img, bbox = self.hflip(img, bbox)
 
-        img = self.img_trans(img).contiguous()
-        #img = img.contiguous().div(255)
-        img = self.normalize(img)
+            img = self.img_trans(img).contiguous()
+            #img = img.contiguous().div(255)
+            img = self.normalize(img)
 
-        bbox, label = self.encoder.encode(bbox, label)
+        if self.encode:
+            bbox, label = self.encoder.encode(bbox, label)
+        else:
+            bbox, label = self._pad(bbox, label, max_num)
 
         return img, img_size, bbox, label
 
+def _decode_image(args):
+    img_path, max_size = args
+    img = Image.open(img_path).convert("RGB")
+    if max_size is not None and max(img.size) > max_size:
+        scale = max_size/max(img.size)
+        img = img.resize((max(int(round(img.size[0]*scale)), 1),
+                          max(int(round(img.size[1]*scale)), 1)),
+                         Image.BILINEAR)
+    return np.array(img, dtype=np.uint8)
+
+
+class ImageCache(object):
+    """ Decoded RGB images of a dataset, as uint8 arrays in memory-mapped
+        shard files, so that loading a sample is a copy rather than a JPEG
+        decode. Images may be downscaled to max_size on their longer side
+        when the cache is built; the crop code works in the pixels of the
+        image it is given, so boxes stay valid.
+
+        The shards are mapped lazily, by each DataLoader worker on first
+        access, and are shared through the page cache.
+    """
+    def __init__(self, path):
+        self.path = path
+        # shard, offset, height, width of each image
+        self.index = np.load(os.path.join(path, "index.npy"))
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, idx):
+        shard, offset, h, w = self.index[idx].tolist()
+        if shard not in self._shards:
+            self._shards[shard] = np.memmap(
+                os.path.join(self.path, "shard_{}.u8".format(shard)),
+                dtype=np.uint8, mode="r")
+        return self._shards[shard][offset:offset + h*w*3].reshape(h, w, 3)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
+
+    @staticmethod
+    def build(img_paths, path, max_size=None, shard_size=1 << 30,
+              num_workers=4):
+        """ Decode img_paths in a pool of num_workers processes into shards
+            of about shard_size bytes under path, and return the cache
+        """
+        from multiprocessing import Pool
+        # written aside and renamed, so a cache directory is always complete
+        tmp = "{}.tmp{}".format(path.rstrip("/"), os.getpid())
+        os.makedirs(tmp)
+        index = np.zeros((len(img_paths), 4), dtype=np.int64)
+        shard, offset, fout = 0, 0, None
+        with Pool(num_workers) as pool:
+            imgs = pool.imap(_decode_image,
+                             [(p, max_size) for p in img_paths], chunksize=16)
+            for i, img in enumerate(imgs):
+                if fout is None or \
+                        (offset > 0 and offset + img.nbytes > shard_size):
+                    if fout is not None:
+                        fout.close()
+                        shard += 1
+                    fout = open(os.path.join(tmp, "shard_{}.u8".format(shard)), "wb")
+                    offset = 0
+                fout.write(img.tobytes())
+                index[i] = (shard, offset, img.shape[0], img.shape[1])
+                offset += img.nbytes
+        if fout is not None:
+            fout.close()
+        np.save(os.path.join(tmp, "index.npy"), index)
+        os.rename(tmp, path)
+        return ImageCache(path)
+
+
 # Implement a datareader for COCO dataset
 class COCODetection(data.Dataset):
-    def __init__(self, img_folder, annotate_file, transform=None):
+    """ Images with at least one annotation, in annotation file order.
+
+        Annotations are kept in flat numpy arrays rather than Python
+        objects, so that forked DataLoader workers share them without
+        refcount updates copying the pages:
+            img_keys (I), img_sizes (I x 2, height and width),
+            file_names (I, bytes), offsets (I + 1),
+            boxes (A x 4, ltrb scaled to [0, 1]), labels (A)
+        where image i owns boxes[offsets[i]:offsets[i+1]].
+
+        With cache_dir, the arrays are saved there as .npy files when the
+        annotation file is first parsed, and memory-mapped on later runs
+        instead of loading the json. With image_cache, an ImageCache of
+        image_paths(), images are read from it instead of decoded.
+    """
+    _cache_arrays = ("img_keys", "img_sizes", "file_names", "offsets",
+                     "boxes", "labels", "cat_ids", "cat_names")
+
+    def __init__(self, img_folder, annotate_file, transform=None,
+                 cache_dir=None, image_cache=None):
         self.img_folder = img_folder
         self.annotate_file = annotate_file
+        self.image_cache = image_cache
 
-        # Start processing annotation
-        with open(annotate_file) as fin:
-            self.data = json.load(fin)
-
-        self.images = {}
+        #print("Parsing COCO data...")
+        start_time = time.time()
+        cache = None
+        if cache_dir is not None:
+            cache = os.path.join(cache_dir,
+                os.path.basename(annotate_file) + ".cache")
+        if cache is not None and os.path.isdir(cache):
+            for name in self._cache_arrays:
+                setattr(self, name, np.load(
+                    os.path.join(cache, name + ".npy"), mmap_mode="r"))
+        else:
+            # Start processing annotation
+            with open(annotate_file) as fin:
+                self._index(json.load(fin))
+            if cache is not None:
+                self._save_cache(cache)
 
         self.label_map = {}
         self.label_info = {}
-        #print("Parsing COCO data...")
-        start_time = time.time()
         # 0 stand for the background
-        cnt = 0
-        self.label_info[cnt] = "background"
-        for cat in self.data["categories"]:
-            cnt += 1
-            self.label_map[cat["id"]] = cnt
-            self.label_info[cnt] = cat["name"]
+        self.label_info[0] = "background"
+        for cnt, (cat_id, name) in enumerate(
+                zip(self.cat_ids.tolist(), self.cat_names.tolist()), 1):
+            self.label_map[cat_id] = cnt
+            self.label_info[cnt] = name
 
-        # build inference for images
-        for img in self.data["images"]:
-            img_id = img["id"]
-            img_name = img["file_name"]
-            img_size = (img["height"],img["width"])
-            #print(img_name)
-            if img_id in self.images: raise Exception("dulpicated image record")
-            self.images[img_id] = (img_name, img_size, [])
-
-        # read bboxes
-        for bboxes in self.data["annotations"]:
-            img_id = bboxes["image_id"]
-            category_id = bboxes["category_id"]
-            bbox = bboxes["bbox"]
-            bbox_label = self.label_map[bboxes["category_id"]]
-            self.images[img_id][2].append((bbox, bbox_label))
-
-        for k, v in list(self.images.items()):
-            if len(v[2]) == 0:
-                #print("empty image: {}".format(k))
-                self.images.pop(k)
-
-        self.img_keys = list(self.images.keys())
         self.transform = transform
         #print("End parsing COCO data, total time {}".format(time.time()-start_time))
 
+    def _index(self, data):
+        self.cat_ids = np.array([cat["id"] for cat in data["categories"]],
+                                dtype=np.int64)
+        self.cat_names = np.array([cat["name"] for cat in data["categories"]])
+        label_of = {cat_id: cnt for cnt, cat_id in
+                    enumerate(self.cat_ids.tolist(), 1)}
+
+        # build inference for images
+        img_ids = np.array([img["id"] for img in data["images"]],
+                           dtype=np.int64)
+        if np.unique(img_ids).size != img_ids.size:
+            raise Exception("dulpicated image record")
+        img_sizes = np.array([(img["height"], img["width"])
+                              for img in data["images"]],
+                             dtype=np.int64).reshape(-1, 2)
+        file_names = np.array([img["file_name"].encode()
+                               for img in data["images"]])
+
+        # read bboxes, grouped by image and in file order within an image
+        anns = data["annotations"]
+        by_id = np.argsort(img_ids)
+        ann_img = by_id[np.searchsorted(img_ids[by_id], np.array(
+            [ann["image_id"] for ann in anns], dtype=np.int64))]
+        order = np.argsort(ann_img, kind="stable")
+        ann_img = ann_img[order]
+        ltwh = np.array([ann["bbox"] for ann in anns],
+                        dtype=np.float64).reshape(-1, 4)[order]
+        labels = np.array([label_of[ann["category_id"]] for ann in anns],
+                          dtype=np.int64)[order]
+
+        # drop images without annotations
+        counts = np.bincount(ann_img, minlength=img_ids.size)
+        keep = counts > 0
+        self.img_keys = img_ids[keep]
+        self.img_sizes = img_sizes[keep]
+        self.file_names = file_names[keep]
+        self.offsets = np.concatenate([[0], np.cumsum(counts[keep])])
+
+        htot = img_sizes[ann_img, 0]
+        wtot = img_sizes[ann_img, 1]
+        self.boxes = np.stack([ltwh[:, 0]/wtot,
+                               ltwh[:, 1]/htot,
+                               (ltwh[:, 0] + ltwh[:, 2])/wtot,
+                               (ltwh[:, 1] + ltwh[:, 3])/htot],
+                              axis=1).astype(np.float32)
+        self.labels = labels
+
+    def _save_cache(self, cache):
+        # written aside and renamed, so a cache directory is always complete
+        tmp = "{}.tmp{}".format(cache, os.getpid())
+        os.makedirs(tmp)
+        for name in self._cache_arrays:
+            np.save(os.path.join(tmp, name + ".npy"), getattr(self, name))
+        os.rename(tmp, cache)
+
     @property
     def labelnum(self):
         return len(self.label_info)
@@ -553,30 +949,26 @@ class COCODetection(data.Dataset):
 
     
     def __len__(self):
-        return len(self.images)
+        return len(self.img_keys)
 
-    def __getitem__(self, idx):
-        img_id = self.img_keys[idx]
-        img_data = self.images[img_id]
-        fn = img_data[0]
-        img_path = os.path.join(self.img_folder, fn)
-        img = Image.open(img_path).convert("RGB")
+    def image_paths(self):
+        return [os.path.join(self.img_folder, fn.decode())
+                for fn in self.file_names]
 
-        htot, wtot = img_data[1]
-        bbox_sizes = []
-        bbox_labels = []
+    def __getitem__(self, idx):
+        if self.image_cache is not None:
+            img = Image.fromarray(self.image_cache[idx])
+        else:
+            fn = self.file_names[idx].decode()
+            img_path = os.path.join(self.img_folder, fn)
+            img = Image.open(img_path).convert("RGB")
 
-        #for (xc, yc, w, h), bbox_label in img_data[2]:
-        for (l,t,w,h), bbox_label in img_data[2]:
-            r = l + w
-            b = t + h
-            #l, t, r, b = xc - 0.5*w, yc - 0.5*h, xc + 0.5*w, yc + 0.5*h
-            bbox_size = (l/wtot, t/htot, r/wtot, b/htot)
-            bbox_sizes.append(bbox_size)
-            bbox_labels.append(bbox_label) 
+        htot, wtot = self.img_sizes[idx].tolist()
+        lo, hi = self.offsets[idx], self.offsets[idx + 1]
 
-        bbox_sizes = torch.tensor(bbox_sizes)
-        bbox_labels =  torch.tensor(bbox_labels)
+        # copies, as the transforms modify them in place
+        bbox_sizes = torch.tensor(self.boxes[lo:hi])
+        bbox_labels = torch.tensor(self.labels[lo:hi])
 
 
         if self.transform != None: